@@ -0,0 +1,263 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from variant_extractor import encode_event_log, count_encoded_variants, variant_hash_keys
+from pareto_cutoff_variants import CoverageIndex
+import metrics
+
+# Variants monitored by the heavy-hitters sketch (its memory is O(capacity))
+DEFAULT_CAPACITY = 10_000
+# Normal quantile of the reported intervals (1.96 -> ~95%)
+DEFAULT_Z = 1.96
+
+_SAMPLE_MIX = np.uint64(0xD6E8FEB86659FD93)
+_HASH_SPACE = 2.0 ** 64
+
+
+def case_sample_mask(case_ids, sample_rate, seed=0):
+    """
+    Case-level Bernoulli sample decided by a hash of the case_id.
+
+    A case is either sampled with all of its events or not at all, and the decision
+    is the same in every chunk, process and run with the same seed.
+
+    Returns:
+        bool array, True for sampled cases
+    """
+    if sample_rate >= 1:
+        return np.ones(len(case_ids), dtype=bool)
+    hashes = pd.util.hash_pandas_object(pd.Series(case_ids), index=False).to_numpy()
+    with np.errstate(over='ignore'):
+        mixed = (hashes ^ np.uint64(seed)) * _SAMPLE_MIX
+    return mixed < np.uint64(min(int(sample_rate * _HASH_SPACE), 2 ** 64 - 1))
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitters summary over variant hash keys.
+
+    At most `capacity` variants are monitored. Each monitored count overestimates the
+    true count by at most its `error`, and any unmonitored variant occurs at most
+    `min_count` times. Batches of exact counts are merged vectorized (mergeable
+    summaries: a variant missing from the full summary enters at its minimum count).
+
+    Parameters:
+        capacity (int): Number of monitored variants
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.keys = np.zeros(0, dtype=np.uint64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.errors = np.zeros(0, dtype=np.int64)
+        self.variants = {}  # key -> variant tuple, for monitored keys only
+        self.total = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def min_count(self):
+        """Upper bound on the count of every variant that is not monitored."""
+        return int(self.counts.min()) if len(self.keys) >= self.capacity else 0
+
+    def update(self, keys, counts, decode):
+        """
+        Adds exact counts of distinct keys (e.g. one chunk of cases).
+
+        Parameters:
+            keys (ndarray): Distinct uint64 variant keys
+            counts (ndarray): Number of cases per key
+            decode (callable): decode(i) -> variant tuple of keys[i], only called for
+                keys that become monitored
+        """
+        self.total += int(counts.sum())
+        floor = self.min_count
+        all_keys = np.concatenate([self.keys, keys])
+        unique, inverse = np.unique(all_keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        old, new = inverse[:len(self.keys)], inverse[len(self.keys):]
+
+        merged = np.zeros(len(unique), dtype=np.int64)
+        errors = np.zeros(len(unique), dtype=np.int64)
+        monitored = np.zeros(len(unique), dtype=bool)
+        merged[old] = self.counts
+        errors[old] = self.errors
+        monitored[old] = True
+        np.add.at(merged, new, counts)
+        # Keys seen for the first time may have been evicted before with up to `floor` cases
+        fresh = ~monitored
+        merged[fresh] += floor
+        errors[fresh] = floor
+
+        keep = np.lexsort((unique, -merged))[:self.capacity]
+        self.keys, self.counts, self.errors = unique[keep], merged[keep], errors[keep]
+
+        kept = set(self.keys.tolist())
+        for key in list(self.variants):
+            if key not in kept:
+                del self.variants[key]
+        position = {key: i for i, key in enumerate(keys.tolist())}
+        for key in self.keys[fresh[keep]].tolist():
+            self.variants[key] = decode(position[key])
+
+    def top(self):
+        """Monitored (variant, count, error) sorted by count desc."""
+        order = np.lexsort((self.keys, -self.counts))
+        return [(self.variants[key], count, error) for key, count, error in
+                zip(self.keys[order].tolist(), self.counts[order].tolist(), self.errors[order].tolist())]
+
+
+class ApproximationReport:
+    """
+    Error bounds of an approximate extraction, aligned with its sorted_variants.
+
+    Attributes:
+        total_cases (int): Exact number of cases in the log
+        sampled_cases (int): Cases that entered the sketch
+        sample_rate (float): Case sampling rate
+        sketch_error (int): Largest overcount of the sketch, in sampled cases
+        low, high (ndarray): Per-variant bounds on the full-log case count
+        unmonitored_max (float): Upper bound on the count of any variant not listed
+    """
+
+    def __init__(self, sorted_variants, total_cases, sampled_cases, sample_rate, sketch, z=DEFAULT_Z):
+        self.total_cases = total_cases
+        self.sampled_cases = sampled_cases
+        self.sample_rate = sample_rate
+        self.sketch_error = sketch.min_count
+        self.z = z
+        self.estimates = np.array([count for _, count in sorted_variants], dtype=np.float64)
+
+        top = sketch.top()
+        counts = np.array([c for _, c, _ in top], dtype=np.float64)
+        guaranteed = counts - np.array([e for _, _, e in top], dtype=np.float64)
+        # Sketch bounds in the sample, widened by the sampling error of a Bernoulli sample
+        spread = z * np.sqrt(1 - sample_rate)
+        self.low = np.maximum(guaranteed - spread * np.sqrt(guaranteed), 0) / sample_rate
+        self.high = (counts + spread * np.sqrt(counts)) / sample_rate
+        floor = sketch.min_count
+        self.unmonitored_max = float((floor + spread * math.sqrt(floor)) / sample_rate)
+        self._spread = spread
+        self._guaranteed_cumulative = np.cumsum(guaranteed)
+        self._count_cumulative = np.cumsum(counts)
+
+    def coverage_bounds(self, k):
+        """
+        (low, high) share of all cases covered by the first k variants. The sampling
+        error is taken on their summed count, which is tighter than adding per-variant bounds.
+        """
+        if k <= 0 or not self.total_cases or not len(self.low):
+            return 0.0, 0.0
+        k = min(k, len(self.low))
+        guaranteed, counts = self._guaranteed_cumulative[k - 1], self._count_cumulative[k - 1]
+        low = max(guaranteed - self._spread * math.sqrt(guaranteed), 0) / self.sample_rate
+        high = (counts + self._spread * math.sqrt(counts)) / self.sample_rate
+        return float(min(low / self.total_cases, 1.0)), float(min(high / self.total_cases, 1.0))
+
+    def pareto_bounds(self, threshold=0.8):
+        """
+        Pareto cutoff on the estimated counts with its coverage interval.
+
+        Returns:
+            (k, estimated coverage, low coverage, high coverage)
+        """
+        index = CoverageIndex([(None, c) for c in self.estimates.tolist()], total_cases=self.total_cases)
+        k = index.cutoff(threshold) if len(self.estimates) else 0
+        return (k, index.coverage(k) if k else 0.0) + self.coverage_bounds(k)
+
+    def summary(self):
+        return {
+            "total_cases": self.total_cases,
+            "sampled_cases": self.sampled_cases,
+            "sample_rate": self.sample_rate,
+            "monitored_variants": len(self.low),
+            "sketch_error": self.sketch_error,
+            "unmonitored_max": self.unmonitored_max,
+        }
+
+
+def _complete_cases(chunks):
+    """
+    Re-chunks a stream so no case spans two chunks: the last case of every chunk
+    (which may continue in the next one, see data_loader.iter_event_log_chunks) is
+    held back and prepended to the next chunk.
+    """
+    tail = None
+    for chunk in chunks:
+        if tail is not None:
+            chunk = pd.concat([tail, chunk], ignore_index=True)
+        if not len(chunk):
+            continue
+        last = chunk['case_id'].iloc[-1]
+        at_tail = (chunk['case_id'] == last).to_numpy()
+        tail = chunk[at_tail]
+        if not at_tail.all():
+            yield chunk[~at_tail]
+    if tail is not None and len(tail):
+        yield tail
+
+
+@metrics.timed("extract_variants_approx")
+def extract_variants_approx(source, sample_rate=0.1, capacity=DEFAULT_CAPACITY, seed=0, z=DEFAULT_Z):
+    """
+    Approximate variant counts for logs too large to count exactly, in fixed memory.
+
+    Cases are sampled by a hash of their case_id; the variants of sampled cases are
+    counted exactly per chunk and folded into a Space-Saving sketch of `capacity`
+    variants. Counts are scaled back to the full log (count / sample_rate).
+
+    Parameters:
+        source: Event log DataFrame, or an iterable of DataFrame chunks whose cases are
+            contiguous (e.g. from `data_loader.iter_event_log_chunks`)
+        sample_rate (float): Share of cases kept (1.0 = all)
+        capacity (int): Variants monitored by the sketch
+        seed (int): Seed of the case sample
+        z (float): Normal quantile of the reported bounds
+
+    Returns:
+        - variants_dict: {variant_tuple: estimated frequency}
+        - sorted_variants: list of (variant_tuple, estimated frequency), frequency desc,
+          usable wherever `extract_variants` output is (Pareto, trie, DAG builders)
+        - report: ApproximationReport with count and coverage bounds
+    """
+    chunks = [source] if isinstance(source, pd.DataFrame) else _complete_cases(source)
+    sketch = SpaceSaving(capacity)
+    vocabulary = {}
+    total_cases = sampled_cases = 0
+
+    for chunk in chunks:
+        case_ids = chunk['case_id']
+        unique_cases = case_ids.dropna().unique()
+        total_cases += len(unique_cases)
+        sampled = unique_cases[case_sample_mask(unique_cases, sample_rate, seed)]
+        if sample_rate < 1:
+            chunk = chunk[case_ids.isin(sampled)]
+        if not len(chunk):
+            continue
+
+        encoded = encode_event_log(chunk)
+        names = encoded.vocabulary
+        # Activity codes shared by all chunks, so variant keys agree across chunks
+        to_global = np.array([vocabulary.setdefault(a, len(vocabulary)) for a in names], dtype=np.int64)
+        codes = to_global[encoded.activities]
+        _, first_case, counts = count_encoded_variants(encoded.offsets, codes)
+        sampled_cases += int(counts.sum())
+        keys = variant_hash_keys(encoded.offsets, codes)[first_case]
+
+        offsets = encoded.offsets
+        activities = encoded.activities
+
+        def decode(i):
+            case = first_case[i]
+            return tuple(names[c] for c in activities[offsets[case]:offsets[case + 1]].tolist())
+
+        sketch.update(keys, counts, decode)
+
+    sorted_variants = [(variant, int(round(count / sample_rate))) for variant, count, _ in sketch.top()]
+    variants_dict = dict(sorted_variants)
+    report = ApproximationReport(sorted_variants, total_cases, sampled_cases, sample_rate, sketch, z=z)
+    metrics.annotate(cases=total_cases, sampled_cases=sampled_cases, variants=len(sorted_variants))
+    return variants_dict, sorted_variants, report
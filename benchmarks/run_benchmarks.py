@@ -0,0 +1,226 @@
+"""
+Times and memory-profiles every pipeline stage on seeded synthetic logs.
+
+    python -m benchmarks.run_benchmarks --scales small,medium
+    python -m benchmarks.run_benchmarks --save-baseline      # record a new baseline
+    python -m benchmarks.run_benchmarks --fail-on-regression # exit 1 on regressions
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_log import generate_event_log, write_xes
+from data_loader import load_event_log, save_log_cache
+from variant_extractor import extract_variants
+from pareto_cutoff_variants import pareto_cutoff_variants
+from variant_tree_builder import build_trie_from_variants
+from variant_dag_builder import build_process_graph
+from variant_hierarchy_builder import build_data_driven_tree, save_hierarchical_tree_to_csv
+from variant_tree_checker import analyze_variant_tree
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+RESULTS_PATH = os.path.join(BENCHMARK_DIR, "results", "latest.json")
+
+SCALES = {"small": 1_000, "medium": 10_000, "large": 100_000}
+STAGES = ["load_cache", "extract", "pareto", "trie", "trie_compact", "dag", "hierarchy", "analyze"]
+
+
+def stub_encoder(variants_subset, dim=32):
+    """Deterministic pseudo-embeddings (seeded by the variant text), no model needed."""
+    vectors = np.empty((len(variants_subset), dim), dtype=np.float32)
+    for i, (variant, _) in enumerate(variants_subset):
+        seed = int.from_bytes(hashlib.sha1(" ".join(variant).encode("utf-8")).digest()[:8], "little")
+        vectors[i] = np.random.default_rng(seed).standard_normal(dim)
+    return vectors
+
+
+def measure(func, repeat=3):
+    """
+    Runs func `repeat` times for the best wall time, then once more under tracemalloc
+    for the peak of Python-tracked allocations (numpy buffers included).
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {"seconds": min(times), "peak_mb": peak / 2 ** 20}
+
+
+def run_scale(scale, n_cases, stages, args, work_dir):
+    """Benchmarks the selected stages on one synthetic log; returns a list of result rows."""
+    df = generate_event_log(n_cases=n_cases, n_activities=args.activities, zipf_s=args.zipf,
+                            mean_length=args.mean_length, seed=args.seed)
+    rows = []
+
+    def record(stage, func, **extra):
+        result, stats = measure(func, repeat=args.repeat)
+        rows.append({"scale": scale, "stage": stage, "n_cases": n_cases, "n_events": len(df), **stats, **extra})
+        print(f"  {stage:<14} {stats['seconds'] * 1000:10.1f} ms  {stats['peak_mb']:8.1f} MB peak")
+        return result
+
+    if "load_cache" in stages:
+        xes_path = os.path.join(work_dir, f"{scale}.xes.gz")
+        cache_path = os.path.join(work_dir, f"{scale}.logcache")
+        write_xes(df, xes_path)
+        save_log_cache(df, cache_path, source_path=xes_path)
+        record("load_cache", lambda: load_event_log(xes_path, cache_path=cache_path))
+
+    _, sorted_variants = extract_variants(df)
+    if "extract" in stages:
+        record("extract", lambda: extract_variants(df), n_variants=len(sorted_variants))
+
+    total_cases = df["case_id"].nunique()
+    pareto_variants = pareto_cutoff_variants(sorted_variants, total_cases)
+    if "pareto" in stages:
+        record("pareto", lambda: pareto_cutoff_variants(sorted_variants, total_cases),
+               n_variants=len(pareto_variants))
+    if "trie" in stages:
+        record("trie", lambda: build_trie_from_variants(pareto_variants), n_variants=len(pareto_variants))
+    if "trie_compact" in stages:
+        record("trie_compact", lambda: build_trie_from_variants(pareto_variants, compact=True),
+               n_variants=len(pareto_variants))
+    if "dag" in stages:
+        record("dag", lambda: build_process_graph(pareto_variants), n_variants=len(pareto_variants))
+
+    hierarchy_variants = pareto_variants[:args.hierarchy_max]
+
+    def build_hierarchy():
+        return build_data_driven_tree(hierarchy_variants, max_levels=10, max_clusters=20,
+                                      min_cluster_size=2, encoder=stub_encoder)
+
+    if "hierarchy" in stages:
+        nodes, tree = record("hierarchy", build_hierarchy, n_variants=len(hierarchy_variants))
+    elif "analyze" in stages:
+        nodes, tree = build_hierarchy()
+    if "analyze" in stages:
+        csv_path = os.path.join(work_dir, f"{scale}_hierarchy.csv")
+        with contextlib.redirect_stdout(io.StringIO()):
+            save_hierarchical_tree_to_csv(nodes, tree, csv_path=csv_path)
+        record("analyze", lambda: analyze_variant_tree(csv_path), n_variants=len(nodes))
+    return rows
+
+
+def compare(results, baseline, tolerance, min_delta=0.005):
+    """
+    Compares wall times with the baseline (matched on scale and stage). A stage only
+    counts as a regression if it is also `min_delta` seconds slower, so timer noise on
+    sub-millisecond stages is not reported.
+
+    Returns:
+        list of (scale, stage, baseline_seconds, seconds, ratio) for regressions beyond tolerance
+    """
+    reference = {(row["scale"], row["stage"]): row for row in baseline["results"]}
+    regressions = []
+    print(f"\n{'scale':<8} {'stage':<14} {'baseline ms':>12} {'now ms':>10} {'ratio':>7}")
+    for row in results["results"]:
+        base = reference.get((row["scale"], row["stage"]))
+        if base is None:
+            continue
+        ratio = row["seconds"] / base["seconds"] if base["seconds"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance and row["seconds"] - base["seconds"] > min_delta:
+            flag = "  ⚠️ regression"
+            regressions.append((row["scale"], row["stage"], base["seconds"], row["seconds"], ratio))
+        print(f"{row['scale']:<8} {row['stage']:<14} {base['seconds'] * 1000:12.1f} "
+              f"{row['seconds'] * 1000:10.1f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def _write_json(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic logs.")
+    parser.add_argument("--scales", default="small,medium",
+                        help=f"Comma-separated scales from {list(SCALES)} or case counts")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated stages to run")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (best is kept)")
+    parser.add_argument("--activities", type=int, default=20, help="Activity alphabet size")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Variant popularity skew")
+    parser.add_argument("--mean-length", type=float, default=12, help="Mean trace length")
+    parser.add_argument("--hierarchy-max", type=int, default=2000, help="Variants fed to the hierarchy stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=RESULTS_PATH, help="Where to write the JSON results")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown vs the baseline before flagging (0.25 = 25%%)")
+    parser.add_argument("--min-delta", type=float, default=0.005,
+                        help="Ignore slowdowns smaller than this many seconds")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    args = parser.parse_args(argv)
+
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {sorted(unknown)}")
+
+    results = {
+        "meta": {
+            "created": pd.Timestamp.now(tz="UTC").isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        },
+        "results": [],
+    }
+    work_dir = tempfile.mkdtemp(prefix="variant_bench_")
+    try:
+        for scale in args.scales.split(","):
+            n_cases = SCALES[scale] if scale in SCALES else int(scale)
+            print(f"📏 Scale {scale}: {n_cases} cases")
+            results["results"].extend(run_scale(scale, n_cases, stages, args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    _write_json(results, args.output)
+    print(f"\n📄 Results written to {args.output}")
+
+    if args.save_baseline:
+        _write_json(results, args.baseline)
+        print(f"📌 Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.isfile(args.baseline):
+        print("[INFO] No baseline found; run with --save-baseline to record one.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.min_delta)
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} stage(s) slower than the baseline by more than {args.tolerance:.0%}")
+        return 1 if args.fail_on_regression else 0
+    print("\n✅ No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
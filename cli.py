@@ -0,0 +1,266 @@
+"""
+Command-line entry point for the variant analysis stages.
+
+    python cli.py extract data/log.xes.gz --top 10
+    python cli.py pareto data/log.xes.gz --threshold 0.9 --csv output/pareto_variants.csv
+    python cli.py trie data/log.xes.gz --max-nodes 300 --engine sfdp
+    python cli.py run --top-n 50 --max-clusters 20        # the full main() pipeline
+
+Every subcommand imports only the modules it needs, so the cheap ones (load, extract,
+pareto, analyze) start without matplotlib, sklearn, sentence-transformers or pm4py;
+pm4py is only loaded when a log has to be parsed without --streaming.
+"""
+import sys
+import argparse
+
+# Same defaults as main.py
+XES_PATH = 'data/BPI_Challenge_2017.xes.gz'
+CSV_PATH = "output/variant_hierarchy_details.csv"
+
+
+# ---------- Shared steps ----------
+def _load(args):
+    from data_loader import load_event_log
+
+    df = load_event_log(args.xes_path, cache_path=args.cache_path, force_reload=args.force_reload,
+                        streaming=args.streaming)
+    print(f"📊 Total cases: {df['case_id'].nunique()}")
+    print(f"⚙️ Total events: {len(df)}")
+    return df
+
+
+def _variants(args):
+    """Returns (sorted_variants, total_cases), exact or approximate."""
+    if args.approximate:
+        from data_loader import iter_event_log_chunks
+        from approximate_variants import extract_variants_approx
+
+        _, sorted_variants, report = extract_variants_approx(
+            iter_event_log_chunks(args.xes_path), sample_rate=args.sample_rate, capacity=args.sketch_capacity,
+            seed=args.seed)
+        print(f"🎲 Approximate: {report.sampled_cases} of {report.total_cases} cases sampled, "
+              f"sketch overcount ≤ {report.sketch_error}, unlisted variants ≤ {report.unmonitored_max:.0f} cases")
+        return sorted_variants, report.total_cases
+
+    df = _load(args)
+    if args.workers > 1:
+        from variant_extractor import extract_variants_parallel
+        _, sorted_variants = extract_variants_parallel(df, n_workers=args.workers)
+    else:
+        from variant_extractor import extract_variants
+        _, sorted_variants = extract_variants(df)
+    print(f"🧬 Total unique variants: {len(sorted_variants)}")
+    return sorted_variants, df['case_id'].nunique()
+
+
+def _pareto(args):
+    from pareto_cutoff_variants import CoverageIndex
+
+    sorted_variants, total_cases = _variants(args)
+    index = CoverageIndex(sorted_variants, total_cases=total_cases)
+    pareto_variants = index.variants(args.threshold)
+    k = len(pareto_variants)
+    print(f"🎯 Number of variants covering {args.threshold:.0%} of cases: {k} ({index.coverage(k):.2%})")
+    return pareto_variants
+
+
+def _print_variants(variants, top):
+    for i, (variant, count) in enumerate(variants[:top], 1):
+        print(f"{i:>4}. {count:>8}  {' → '.join(variant)}")
+
+
+# ---------- Subcommands ----------
+def cmd_load(args):
+    df = _load(args)
+    print(df.head())
+
+
+def cmd_extract(args):
+    sorted_variants, _ = _variants(args)
+    _print_variants(sorted_variants, args.top)
+    if args.csv:
+        from variant_visualizer import save_variants_to_csv
+        save_variants_to_csv(sorted_variants, csv_path=args.csv)
+
+
+def cmd_pareto(args):
+    pareto_variants = _pareto(args)
+    _print_variants(pareto_variants, args.top)
+    if args.csv:
+        from variant_visualizer import save_variants_to_csv
+        save_variants_to_csv(pareto_variants, csv_path=args.csv)
+    if args.plot:
+        from variant_visualizer import plot_variant_distribution
+        plot_variant_distribution(pareto_variants, save_path=args.plot)
+
+
+def cmd_trie(args):
+    from variant_tree_builder import build_and_visualize_trie
+
+    pareto_variants = _pareto(args)
+    build_and_visualize_trie(pareto_variants, top_n=args.top_n, save_path=args.save_path, compact=True,
+                             max_nodes=args.max_nodes, min_share=args.min_share, engine=args.engine)
+
+
+def cmd_dag(args):
+    from variant_dag_builder import build_process_graph, draw_process_graph
+
+    pareto_variants = _pareto(args)
+    graph = build_process_graph(pareto_variants, top_n=args.top_n)
+    draw_process_graph(graph, save_path=args.save_path)
+    print(f"🗺️ Variant DAG saved to {args.save_path}")
+
+
+def cmd_hierarchy(args):
+    from variant_hierarchy_builder import (
+        build_data_driven_tree, save_hierarchical_tree_to_csv, visualize_data_driven_tree,
+    )
+
+    pareto_variants = _pareto(args)
+    if args.top_n is not None:
+        pareto_variants = pareto_variants[:args.top_n]
+    nodes, tree = build_data_driven_tree(pareto_variants, max_levels=args.max_levels,
+                                         max_clusters=args.max_clusters, min_cluster_size=args.min_cluster_size,
+                                         model_name=args.model_name, distance=args.distance,
+                                         embedding_mode=args.embedding_mode, ngram=args.ngram, n_jobs=args.jobs)
+    save_hierarchical_tree_to_csv(nodes, tree, csv_path=args.csv)
+    if not args.no_render:
+        visualize_data_driven_tree(nodes, tree, save_path=args.save_path, max_nodes=args.max_nodes)
+    if args.analyze:
+        from variant_tree_checker import analyze_variant_tree
+        analyze_variant_tree(nodes)
+
+
+def cmd_analyze(args):
+    from variant_tree_checker import analyze_variant_tree
+
+    analyze_variant_tree(args.source)
+
+
+def cmd_run(args):
+    import main
+
+    main.main(metrics_path=None if args.no_metrics else args.metrics_path,
+              prometheus_path=args.prometheus_path, xes_path=args.xes_path, threshold=args.threshold,
+              top_n=args.top_n, trie_max_nodes=args.trie_max_nodes, max_levels=args.max_levels,
+              max_clusters=args.max_clusters, min_cluster_size=args.min_cluster_size, model_name=args.model_name,
+              distance=args.distance, embedding_mode=args.embedding_mode, ngram=args.ngram, approximate=args.approximate, sample_rate=args.sample_rate, sketch_capacity=args.sketch_capacity,
+              sample_seed=args.seed, background_render=not args.sync_render)
+
+
+# ---------- Argument parsing ----------
+def _add_log_args(parser):
+    parser.add_argument("xes_path", nargs="?", default=XES_PATH, help="XES event log (.xes or .xes.gz)")
+    parser.add_argument("--cache-path", default=None, help="Columnar log cache (derived from xes_path by default)")
+    parser.add_argument("--force-reload", action="store_true", help="Ignore the log cache and re-parse")
+    parser.add_argument("--streaming", action="store_true", help="Parse the XES incrementally without pm4py")
+
+
+def _add_variant_args(parser):
+    _add_log_args(parser)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for variant extraction")
+    _add_approximate_args(parser)
+    parser.add_argument("--top", type=int, default=10, help="Variants printed")
+
+
+def _add_approximate_args(parser):
+    parser.add_argument("--approximate", action="store_true",
+                        help="Sample cases and count variants with a fixed-size sketch")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="Share of cases sampled (--approximate)")
+    parser.add_argument("--sketch-capacity", type=int, default=10_000,
+                        help="Variants tracked by the sketch (--approximate)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the case sample (--approximate)")
+
+
+def _add_pareto_args(parser):
+    _add_variant_args(parser)
+    parser.add_argument("--threshold", type=float, default=0.8, help="Share of cases the variants must cover")
+
+
+def _add_hierarchy_args(parser):
+    parser.add_argument("--max-levels", type=int, default=10)
+    parser.add_argument("--max-clusters", type=int, default=20)
+    parser.add_argument("--min-cluster-size", type=int, default=2)
+    parser.add_argument("--model-name", default="all-MiniLM-L6-v2", help="SentenceTransformer model")
+    parser.add_argument("--distance", default="embedding", choices=["embedding", "edit"],
+                        help="Cluster on embeddings or on edit distance (no model needed)")
+    parser.add_argument("--embedding-mode", default="sentence", choices=["sentence", "activity"],
+                        help="Encode whole variants, or each activity once and pool per variant")
+    parser.add_argument("--ngram", type=int, default=1, choices=[1, 2],
+                        help="Pooling order of --embedding-mode activity (2 adds bigrams)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Process variant analysis stages.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sub = commands.add_parser("load", help="Load (and cache) the event log")
+    _add_log_args(sub)
+    sub.set_defaults(func=cmd_load)
+
+    sub = commands.add_parser("extract", help="Count the variants")
+    _add_variant_args(sub)
+    sub.add_argument("--csv", default=None, help="Write all variants to this CSV")
+    sub.set_defaults(func=cmd_extract)
+
+    sub = commands.add_parser("pareto", help="Variants covering a share of the cases")
+    _add_pareto_args(sub)
+    sub.add_argument("--csv", default=None, help="Write the Pareto variants to this CSV")
+    sub.add_argument("--plot", default=None, help="Save the variant distribution plot to this path")
+    sub.set_defaults(func=cmd_pareto)
+
+    sub = commands.add_parser("trie", help="Render the prefix tree of the Pareto variants")
+    _add_pareto_args(sub)
+    sub.add_argument("--top-n", type=int, default=None, help="Only use the N most frequent variants")
+    sub.add_argument("--max-nodes", type=int, default=200, help="Nodes rendered before folding into '+N more'")
+    sub.add_argument("--min-share", type=float, default=0.0, help="Fold prefixes below this share of cases")
+    sub.add_argument("--engine", default="dot", choices=["dot", "sfdp", "twopi"])
+    sub.add_argument("--save-path", default="output/variant_trie_tree", help="Output path without extension")
+    sub.set_defaults(func=cmd_trie)
+
+    sub = commands.add_parser("dag", help="Render the directly-follows graph of the Pareto variants")
+    _add_pareto_args(sub)
+    sub.add_argument("--top-n", type=int, default=50, help="Only use the N most frequent variants")
+    sub.add_argument("--save-path", default="output/variant_dag.png")
+    sub.set_defaults(func=cmd_dag)
+
+    sub = commands.add_parser("hierarchy", help="Cluster the Pareto variants into a hierarchy")
+    _add_pareto_args(sub)
+    _add_hierarchy_args(sub)
+    sub.add_argument("--top-n", type=int, default=None, help="Only use the N most frequent variants")
+    sub.add_argument("--jobs", type=int, default=1, help="Worker processes for clustering")
+    sub.add_argument("--csv", default=CSV_PATH, help="Hierarchy CSV to write")
+    sub.add_argument("--save-path", default="output/data_driven_tree", help="Rendered tree path without extension")
+    sub.add_argument("--max-nodes", type=int, default=None, help="Nodes rendered before folding")
+    sub.add_argument("--no-render", action="store_true", help="Skip the Graphviz render")
+    sub.add_argument("--analyze", action="store_true", help="Print the tree analysis afterwards")
+    sub.set_defaults(func=cmd_hierarchy)
+
+    sub = commands.add_parser("analyze", help="Summarize a saved hierarchy")
+    sub.add_argument("source", nargs="?", default=CSV_PATH, help="Hierarchy CSV or its .variants export")
+    sub.set_defaults(func=cmd_analyze)
+
+    sub = commands.add_parser("run", help="Run the full main() pipeline with caching")
+    sub.add_argument("xes_path", nargs="?", default=XES_PATH)
+    sub.add_argument("--threshold", type=float, default=0.8)
+    sub.add_argument("--top-n", type=int, default=50, help="Variants drawn in the DAG")
+    sub.add_argument("--trie-max-nodes", type=int, default=200)
+    _add_hierarchy_args(sub)
+    _add_approximate_args(sub)
+    sub.add_argument("--metrics-path", default="output/metrics.jsonl")
+    sub.add_argument("--prometheus-path", default="output/metrics.prom")
+    sub.add_argument("--no-metrics", action="store_true", help="Do not record stage metrics")
+    sub.add_argument("--sync-render", action="store_true",
+                     help="Render plots and graphs inline instead of on the background render queue")
+    sub.set_defaults(func=cmd_run)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
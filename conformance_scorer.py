@@ -0,0 +1,388 @@
+import heapq
+import time
+
+import numpy as np
+import pandas as pd
+
+from variant_extractor import EncodedVariants
+from variant_tree_builder import ArrayTrie, build_trie_from_variants
+import metrics
+
+NS_PER_SECOND = 1_000_000_000
+
+
+def _child_batch(trie, nodes, codes):
+    """Child of every node along its activity code (-1 where the edge does not exist)."""
+    edge_keys = trie._edge_keys
+    keys = nodes * trie._width + codes
+    pos = np.searchsorted(edge_keys, keys)
+    found = pos < len(edge_keys)
+    found[found] = edge_keys[pos[found]] == keys[found]
+    found &= (codes >= 0) & (nodes >= 0)
+    return np.where(found, pos + 1, -1)
+
+
+class ConformanceScorer:
+    """
+    Scores running cases against the Pareto variants while their events stream in.
+
+    The Pareto variants form a prefix automaton (an ArrayTrie). Each open case keeps
+    its automaton node, so an event on a known prefix is a single edge lookup. Once a
+    case leaves the model it keeps a sparse Levenshtein state instead: the trie nodes
+    whose path is within `max_distance` edits of the case's prefix (Ukkonen cut-off).
+    Its deviation is the smallest of those distances. States are interned as integer
+    ids and every (state, activity) transition is computed once, so an off-model
+    event is a memo lookup too, and all off-model cases at one event rank advance together.
+
+    Parameters:
+        model: ArrayTrie, EncodedVariants or list of (variant_tuple, frequency) (the Pareto set)
+        happy_path (tuple or None): Reference variant; defaults to the most frequent one
+        max_distance (int): Largest deviation tracked exactly; larger ones are
+            reported as max_distance + 1
+        ttl_seconds (float or None): Cases idle for longer than this are evicted
+        max_cases (int or None): Cap on open cases; the least recently seen are evicted
+    """
+
+    def __init__(self, model, happy_path=None, max_distance=2, ttl_seconds=None, max_cases=None):
+        if not isinstance(model, ArrayTrie):
+            if not isinstance(model, EncodedVariants):
+                model = EncodedVariants.from_sorted_variants(model)
+            model = build_trie_from_variants(model)
+        self.trie = model
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_cases = max_cases
+        self.total_cases = int(model.frequency[0]) if len(model) else 0
+
+        trie = model
+        if happy_path is None:
+            happy_node = int(np.argmax(trie.end_count)) if len(trie) else 0
+            happy_path = trie.path(happy_node)
+        else:
+            happy_node = trie.find(happy_path)
+            if happy_node < 0 or not trie.end_count[happy_node]:
+                raise ValueError("The happy path is not one of the model's variants")
+        self.happy_path = tuple(happy_path)
+        self.happy_node = happy_node
+        self.on_happy = np.zeros(len(trie), dtype=bool)
+        node = happy_node
+        while node >= 0:
+            self.on_happy[node] = True
+            node = trie.parent[node]
+
+        # Sparse Levenshtein states of on-model prefixes, filled on first deviation
+        initial = np.flatnonzero(trie.depth <= max_distance)
+        self._node_states = {0: dict(zip(initial.tolist(), trie.depth[initial].tolist()))}
+        # Interned states: id -> {trie node: distance}, its deviation, and memoized transitions
+        self._state_ids = {}
+        self._state_list = []
+        self._state_dev = []
+        self._transitions = {}
+        self._node_state_id = np.full(len(trie), -1, dtype=np.int64)
+        self._empty_state = self._intern({})
+
+        # Open cases live in slots of parallel arrays; slots of closed cases are reused
+        self._slots = {}
+        self._free = []
+        self._case = np.empty(0, dtype=object)
+        self._node = np.empty(0, dtype=np.int64)
+        self._events = np.empty(0, dtype=np.int64)
+        self._last_seen = np.empty(0, dtype=np.int64)
+        self._active = np.empty(0, dtype=bool)
+        self._state = np.empty(0, dtype=np.int64)  # interned state id of off-model cases
+        self.watermark = None
+        self.evicted = 0
+
+    # ---------- Levenshtein states ----------
+    def _advance(self, state, code):
+        """
+        One DP step of the prefix edit distance over the trie, restricted to nodes
+        within max_distance (insertion, substitution/match, then deletion chains).
+        """
+        trie, k = self.trie, self.max_distance
+        nodes = np.fromiter(state, dtype=np.int64, count=len(state))
+        matches = _child_batch(trie, nodes, np.full(len(nodes), code, dtype=np.int64)).tolist()
+        new = {}
+        for (node, d), match in zip(state.items(), matches):
+            if d < k:
+                new[node] = min(new.get(node, k + 1), d + 1)
+                for child in range(trie.child_offsets[node], trie.child_offsets[node + 1]):
+                    new[child] = min(new.get(child, k + 1), d + 1)
+            if match >= 0:
+                new[match] = min(new.get(match, k + 1), d)
+
+        # Deletions: parents precede children in node order, so one ordered pass settles them
+        heap = [node for node, d in new.items() if d < k]
+        heapq.heapify(heap)
+        while heap:
+            node = heapq.heappop(heap)
+            d = new[node] + 1
+            if d > k:
+                continue
+            for child in range(trie.child_offsets[node], trie.child_offsets[node + 1]):
+                if d < new.get(child, k + 1):
+                    if child not in new or new[child] >= k:
+                        heapq.heappush(heap, child)
+                    new[child] = d
+        return {node: d for node, d in new.items() if d <= k}
+
+    def _state_at(self, node):
+        """Levenshtein state of an on-model prefix, memoized along its ancestors."""
+        states = self._node_states
+        chain = []
+        while node not in states:
+            chain.append(node)
+            node = int(self.trie.parent[node])
+        state = states[node]
+        for node in reversed(chain):
+            state = self._advance(state, int(self.trie.activity[node]))
+            states[node] = state
+        return state
+
+    def _deviation(self, state):
+        return min(state.values()) if state else self.max_distance + 1
+
+    def _intern(self, state):
+        key = tuple(sorted(state.items()))
+        state_id = self._state_ids.get(key)
+        if state_id is None:
+            state_id = self._state_ids[key] = len(self._state_list)
+            self._state_list.append(state)
+            self._state_dev.append(self._deviation(state))
+        return state_id
+
+    def _transition(self, state_id, code):
+        """Id of the state after one more activity, computed once per (state, code)."""
+        key = (state_id, code)
+        next_id = self._transitions.get(key)
+        if next_id is None:
+            state = self._state_list[state_id]
+            next_id = self._transitions[key] = self._intern(self._advance(state, code) if state else {})
+        return next_id
+
+    def _node_state_ids(self, nodes):
+        """Interned state ids of on-model prefixes (trie nodes)."""
+        ids = self._node_state_id
+        for node in np.unique(nodes[ids[nodes] < 0]).tolist():
+            ids[node] = self._intern(self._state_at(node))
+        return ids[nodes]
+
+    # ---------- Case slots ----------
+    def _grow(self, size):
+        old = len(self._node)
+        if size <= old:
+            return
+        size = max(size, 2 * old, 64)
+        self._case = np.concatenate([self._case, np.empty(size - old, dtype=object)])
+        self._node = np.concatenate([self._node, np.zeros(size - old, dtype=np.int64)])
+        self._events = np.concatenate([self._events, np.zeros(size - old, dtype=np.int64)])
+        self._last_seen = np.concatenate([self._last_seen, np.zeros(size - old, dtype=np.int64)])
+        self._active = np.concatenate([self._active, np.zeros(size - old, dtype=bool)])
+        self._state = np.concatenate([self._state, np.full(size - old, self._empty_state, dtype=np.int64)])
+
+    def _slot_of(self, case_id):
+        slot = self._slots.get(case_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._slots)
+                self._grow(slot + 1)
+            self._slots[case_id] = slot
+            self._case[slot] = case_id
+            self._node[slot] = 0
+            self._events[slot] = 0
+            self._last_seen[slot] = np.iinfo(np.int64).min
+            self._active[slot] = True
+            self._state[slot] = self._empty_state
+        return slot
+
+    def _release(self, slots):
+        for slot in slots:
+            del self._slots[self._case[slot]]
+            self._case[slot] = None
+            self._free.append(slot)
+        self._active[slots] = False
+
+    def __len__(self):
+        return len(self._slots)
+
+    # ---------- Scoring ----------
+    @metrics.timed("conformance_observe", describe=lambda result, *args, **kwargs: {"rows": len(result)})
+    def observe_batch(self, case_ids, activities, timestamps=None):
+        """
+        Advances the cases by a batch of events and scores every event.
+
+        Events of the same case must be given in order; events of different cases may
+        interleave freely. All cases are advanced together, one vectorized step per
+        event rank within the batch.
+
+        Parameters:
+            case_ids, activities (sequence): One entry per event
+            timestamps (sequence or None): Event times (datetimes or int ns); wall-clock
+                time when omitted. They drive TTL eviction.
+
+        Returns:
+            DataFrame with case_id, activity, events (seen so far), on_model,
+            deviation (edits to the nearest Pareto prefix), on_happy_path and
+            support (share of model cases sharing the prefix, 0 off-model)
+        """
+        trie = self.trie
+        n = len(case_ids)
+        case_codes, unique_cases = pd.factorize(pd.Series(case_ids, dtype=object), use_na_sentinel=False)
+        index = trie.activity_index
+        codes = np.fromiter((index.get(a, -1) for a in activities), dtype=np.int64, count=n)
+        if timestamps is None:
+            stamps = np.full(n, time.time_ns(), dtype=np.int64)
+        else:
+            stamps = pd.DatetimeIndex(pd.to_datetime(pd.Series(timestamps), utc=True)).as_unit("ns").asi8
+
+        slots = np.fromiter((self._slot_of(case) for case in unique_cases), dtype=np.int64,
+                            count=len(unique_cases))[case_codes]
+        # Position of each event among its case's events in this batch
+        rank = pd.Series(case_codes).groupby(case_codes).cumcount().to_numpy()
+
+        out_node = np.empty(n, dtype=np.int64)
+        out_events = np.empty(n, dtype=np.int64)
+        deviation = np.zeros(n, dtype=np.int64)
+        by_rank = np.argsort(rank, kind="stable")
+        bounds = np.searchsorted(rank[by_rank], np.arange(int(rank.max(initial=-1)) + 2))
+        for r in range(len(bounds) - 1):
+            events = by_rank[bounds[r]:bounds[r + 1]]
+            event_slots = slots[events]
+            prev = self._node[event_slots]
+            nodes = _child_batch(trie, prev, codes[events])
+            self._node[event_slots] = nodes
+            self._events[event_slots] += 1
+            np.maximum.at(self._last_seen, event_slots, stamps[events])
+            out_node[events] = nodes
+            out_events[events] = self._events[event_slots]
+
+            # Cases off the model step their Levenshtein state: one memo lookup per
+            # distinct (state, activity) pair of this rank
+            off = np.flatnonzero(nodes < 0)
+            if len(off):
+                off_events, off_slots, off_prev = events[off], event_slots[off], prev[off]
+                state_ids = self._state[off_slots]
+                leaving = off_prev >= 0
+                if leaving.any():
+                    state_ids[leaving] = self._node_state_ids(off_prev[leaving])
+                width = trie._width + 1
+                keys = state_ids * width + codes[off_events] + 1
+                unique_keys, inverse = np.unique(keys, return_inverse=True)
+                next_ids = np.array([self._transition(key // width, key % width - 1)
+                                     for key in unique_keys.tolist()], dtype=np.int64)
+                next_dev = np.array([self._state_dev[i] for i in next_ids.tolist()], dtype=np.int64)
+                inverse = inverse.reshape(-1)
+                self._state[off_slots] = next_ids[inverse]
+                deviation[off_events] = next_dev[inverse]
+
+        safe = np.maximum(out_node, 0)
+        on_model = out_node >= 0
+        result = pd.DataFrame({
+            "case_id": np.asarray(case_ids, dtype=object),
+            "activity": np.asarray(activities, dtype=object),
+            "events": out_events,
+            "on_model": on_model,
+            "deviation": deviation,
+            "on_happy_path": on_model & self.on_happy[safe],
+            "support": np.where(on_model, trie.frequency[safe] / max(self.total_cases, 1), 0.0),
+        })
+
+        if n:
+            last = int(stamps.max())
+            self.watermark = last if self.watermark is None else max(self.watermark, last)
+        if self.ttl_seconds is not None:
+            self.evict_idle()
+        if self.max_cases is not None and len(self._slots) > self.max_cases:
+            self._evict_oldest(len(self._slots) - self.max_cases)
+        return result
+
+    def observe_frame(self, df):
+        """Scores an event DataFrame (case_id, activity and optional timestamp columns) in time order."""
+        if "timestamp" in df:
+            df = df.sort_values("timestamp", kind="stable")
+            return self.observe_batch(df["case_id"].to_numpy(), df["activity"].to_numpy(), df["timestamp"])
+        return self.observe_batch(df["case_id"].to_numpy(), df["activity"].to_numpy())
+
+    def observe(self, case_id, activity, timestamp=None):
+        """Scores a single event; returns its row of `observe_batch` as a dict."""
+        timestamps = None if timestamp is None else [timestamp]
+        return self.observe_batch([case_id], [activity], timestamps).iloc[0].to_dict()
+
+    def score(self, case_id):
+        """
+        Current state of an open case as a dict (None if the case is unknown or evicted).
+        """
+        slot = self._slots.get(case_id)
+        if slot is None:
+            return None
+        node = int(self._node[slot])
+        on_model = node >= 0
+        return {
+            "case_id": case_id,
+            "events": int(self._events[slot]),
+            "on_model": on_model,
+            "deviation": 0 if on_model else self._state_dev[self._state[slot]],
+            "on_happy_path": bool(on_model and self.on_happy[node]),
+            "support": float(self.trie.frequency[node] / max(self.total_cases, 1)) if on_model else 0.0,
+        }
+
+    def close_cases(self, case_ids):
+        """
+        Finishes cases: scores them as complete traces and releases their state.
+
+        Returns:
+            DataFrame with case_id, events, fitting (the trace is a Pareto variant),
+            on_happy_path (it is the happy path) and completion_distance (edits to
+            the nearest complete Pareto variant, max_distance + 1 if farther)
+        """
+        rows, slots = [], []
+        trie = self.trie
+        for case_id in case_ids:
+            slot = self._slots.get(case_id)
+            if slot is None:
+                continue
+            node = int(self._node[slot])
+            state = self._state_at(node) if node >= 0 else self._state_list[self._state[slot]]
+            ends = [d for n, d in state.items() if trie.end_count[n]]
+            rows.append({
+                "case_id": case_id,
+                "events": int(self._events[slot]),
+                "fitting": bool(node >= 0 and trie.end_count[node]),
+                "on_happy_path": node == self.happy_node,
+                "completion_distance": min(ends) if ends else self.max_distance + 1,
+            })
+            slots.append(slot)
+        self._release(slots)
+        return pd.DataFrame(rows, columns=["case_id", "events", "fitting", "on_happy_path", "completion_distance"])
+
+    def close_case(self, case_id):
+        result = self.close_cases([case_id])
+        return result.iloc[0].to_dict() if len(result) else None
+
+    # ---------- Eviction ----------
+    def evict_idle(self, now=None):
+        """
+        Drops cases whose last event is more than ttl_seconds before `now`
+        (default: the latest event time seen). Returns the number evicted.
+        A later event of an evicted case starts it again from the model root.
+        """
+        now = self.watermark if now is None else now
+        if self.ttl_seconds is None or now is None:
+            return 0
+        if not isinstance(now, (int, np.integer)):
+            now = pd.Timestamp(now).as_unit("ns").value
+        cutoff = now - int(self.ttl_seconds * NS_PER_SECOND)
+        idle = np.flatnonzero(self._active & (self._last_seen < cutoff))
+        self._release(idle.tolist())
+        self.evicted += len(idle)
+        metrics.count("conformance_evicted", len(idle))
+        return len(idle)
+
+    def _evict_oldest(self, n_evict):
+        active = np.flatnonzero(self._active)
+        oldest = active[np.argpartition(self._last_seen[active], n_evict - 1)[:n_evict]]
+        self._release(oldest.tolist())
+        self.evicted += n_evict
+        metrics.count("conformance_evicted", n_evict)
@@ -1,36 +1,641 @@
 import os
+import gzip
+import json
+import shutil
+import hashlib
+from datetime import datetime
 import pandas as pd
-import pickle
+import numpy as np
+from array import array
+from xml.etree.ElementTree import iterparse
 
-from pm4py.objects.log.importer.xes import importer as xes_importer
-from pm4py.objects.conversion.log import converter as log_converter
+import metrics
 
-def load_event_log(xes_path='data/BPI_Challenge_2017.xes.gz', cache_path=None, force_reload=False):
+# XES attribute tags that carry a single value (containers/lists are skipped)
+XES_VALUE_TAGS = {"string", "date", "int", "float", "boolean", "id"}
+
+# dtype of each XES attribute kind in streamed chunks (dates are datetime64[ns, UTC])
+_CHUNK_DTYPES = {"int": "float64", "float": "float64", "boolean": object}
+
+# Bump whenever the on-disk layout written by save_log_cache changes
+CACHE_FORMAT_VERSION = 1
+
+
+@metrics.timed("load_event_log", describe=lambda event_log, *args, **kwargs: {"rows": len(event_log)})
+def load_event_log(xes_path='data/BPI_Challenge_2017.xes.gz', cache_path=None, force_reload=False,
+                   streaming=False, attributes=None, chunk_size=100_000):
+    """
+    Loads an XES event log as a DataFrame with case_id / activity / timestamp columns.
+
+    The parsed log is cached as a columnar directory (see `save_log_cache`) that is
+    reopened through memory-mapped arrays. The cache is rebuilt automatically when the
+    source file's size or content hash no longer matches.
+
+    Parameters:
+        xes_path (str): Path to the .xes or .xes.gz file
+        cache_path (str or None): Cache directory; derived from xes_path when None
+        force_reload (bool): Ignore an existing cache and re-parse the log
+        streaming (bool): Parse incrementally instead of building the pm4py EventLog;
+            keeps only the core columns plus `attributes`, with categorical strings
+        attributes (list or None): Extra attributes to keep in streaming mode, named as in
+            the pm4py frame (e.g. "org:resource", "case:LoanGoal")
+        chunk_size (int): Events parsed per chunk in streaming mode
+    """
     if cache_path is None:
-        # Automatically generate a cache path in same folder as .xes.gz
-        cache_path = xes_path.replace('.xes.gz', '.pkl').replace('.xes', '.pkl')
+        cache_path = default_cache_path(xes_path)
 
-    if not force_reload and os.path.exists(cache_path):
-        print(f"[INFO] Loading event log from cache: {cache_path}")
-        with open(cache_path, 'rb') as f:
-            return pickle.load(f)
+    if not force_reload:
+        status = cache_status(cache_path, xes_path)
+        if status == "fresh":
+            print(f"[INFO] Loading event log from cache: {cache_path}")
+            metrics.count("log_cache_hits")
+            return read_log_cache(cache_path)
+        if status == "stale":
+            print(f"[INFO] Cache is stale (source changed): {cache_path}")
 
     # Else parse and save cache
-    print(f"[INFO] Parsing event log from XES: {xes_path}")
-    log = xes_importer.apply(xes_path)
-    event_log = log_converter.apply(log, variant=log_converter.Variants.TO_DATA_FRAME)
-    
+    metrics.count("log_cache_misses")
+    if streaming:
+        print(f"[INFO] Streaming event log from XES: {xes_path}")
+        event_log = _read_xes_streaming(xes_path, attributes=attributes, chunk_size=chunk_size)
+    else:
+        print(f"[INFO] Parsing event log from XES: {xes_path}")
+        # pm4py is only imported when a log is actually parsed with it (slow import)
+        from pm4py.objects.log.importer.xes import importer as xes_importer
+        from pm4py.objects.conversion.log import converter as log_converter
+        log = xes_importer.apply(xes_path)
+        event_log = log_converter.apply(log, variant=log_converter.Variants.TO_DATA_FRAME)
+
 
 # 🔁 Standardize column names for convenience
-    event_log.rename(columns={
-        "case:concept:name": "case_id",
-        "concept:name": "activity",
-        "time:timestamp": "timestamp"
-    }, inplace=True)
-    event_log['timestamp'] = pd.to_datetime(event_log['timestamp'])
+        event_log.rename(columns={
+            "case:concept:name": "case_id",
+            "concept:name": "activity",
+            "time:timestamp": "timestamp"
+        }, inplace=True)
+        event_log['timestamp'] = pd.to_datetime(event_log['timestamp'])
 
     print(f"[INFO] Saving parsed log to cache: {cache_path}")
-    with open(cache_path, 'wb') as f:
-        pickle.dump(event_log, f)
+    try:
+        save_log_cache(event_log, cache_path, source_path=xes_path)
+    except TypeError as error:
+        print(f"⚠️ Event log not cached: {error}")
 
     return event_log
+
+
+# ---------- Columnar Cache ----------
+def default_cache_path(xes_path):
+    # Automatically generate a cache path in same folder as .xes.gz
+    return xes_path.replace('.xes.gz', '.logcache').replace('.xes', '.logcache')
+
+
+def file_fingerprint(path, with_hash=True):
+    """
+    Returns the size, mtime and (optionally) SHA-256 of a file, used to detect stale caches.
+    """
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+
+def _read_cache_meta(cache_path):
+    meta_path = os.path.join(cache_path, "meta.json")
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def cached_source_fingerprint(cache_path):
+    """
+    Fingerprint (size/mtime_ns/sha256) of the source a compatible cache was built from,
+    or None. Lets callers identify a log whose XES file is gone but whose cache is not.
+    """
+    meta = _read_cache_meta(cache_path)
+    if meta is None or meta.get("version") != CACHE_FORMAT_VERSION:
+        return None
+    return meta.get("source") or None
+
+
+def cache_status(cache_path, source_path):
+    """
+    Checks a columnar cache against its source file.
+
+    Returns:
+        "missing" if there is no readable cache, "stale" if it was written by another
+        format version or the source content changed, otherwise "fresh".
+        A changed mtime alone only triggers a hash comparison, so touching the source
+        does not invalidate the cache.
+    """
+    meta = _read_cache_meta(cache_path)
+    if meta is None:
+        return "missing"
+    if meta.get("version") != CACHE_FORMAT_VERSION:
+        return "stale"
+    if not os.path.exists(source_path):
+        # Nothing to compare against; trust the cache
+        return "fresh"
+
+    recorded = meta.get("source", {})
+    current = file_fingerprint(source_path, with_hash=False)
+    if current["size"] != recorded.get("size"):
+        return "stale"
+    if current["mtime_ns"] == recorded.get("mtime_ns"):
+        return "fresh"
+    if file_fingerprint(source_path)["sha256"] != recorded.get("sha256"):
+        return "stale"
+
+    # Same content with a new mtime: remember it so the next check skips hashing
+    meta["source"]["mtime_ns"] = current["mtime_ns"]
+    with open(os.path.join(cache_path, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return "fresh"
+
+
+def _code_dtype(n_categories):
+    # Match the code width pandas picks for a Categorical so loading needs no cast
+    if n_categories < 2 ** 7:
+        return np.int8
+    if n_categories < 2 ** 15:
+        return np.int16
+    return np.int32
+
+
+def _encode_timestamp(value):
+    # [UTC nanoseconds, time zone, unit] keeps each object Timestamp's own offset
+    stamp = pd.Timestamp(value)
+    return [stamp.as_unit("ns").value, str(stamp.tz) if stamp.tz is not None else None, stamp.unit]
+
+
+def _decode_timestamp(ns, tz, unit):
+    stamp = pd.Timestamp(ns, tz="UTC").tz_convert(tz) if tz is not None else pd.Timestamp(ns)
+    return stamp.as_unit(unit)
+
+
+def _tag_value(value):
+    """[type, value] form of one category of a mixed object column."""
+    if isinstance(value, str):
+        return ["str", value]
+    if isinstance(value, (bool, np.bool_)):
+        return ["bool", bool(value)]
+    if isinstance(value, (int, np.integer)):
+        return ["int", int(value)]
+    if isinstance(value, (float, np.floating)):
+        return ["float", float(value)]
+    if isinstance(value, (datetime, np.datetime64)):
+        return ["datetime", _encode_timestamp(value)]
+    raise TypeError(f"values of type {type(value).__name__} cannot be cached")
+
+
+_UNTAG = {"str": str, "bool": bool, "int": int, "float": float,
+          "datetime": lambda value: _decode_timestamp(*value)}
+
+
+def _encode_categories(categories):
+    """
+    JSON form of a column's categories and how to read it back: "str" (strings),
+    "values" (numbers and booleans as-is), "datetime" (int64 nanoseconds, UTC; per-value
+    [nanoseconds, tz, unit] for object columns) or "tagged" ([type, value] pairs of mixed
+    object columns). Raises TypeError for values none of these can restore.
+    """
+    categories = pd.Index(categories)
+    if isinstance(categories.dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(categories.dtype):
+        return pd.DatetimeIndex(categories).as_unit("ns").asi8.tolist(), "datetime"
+    inferred = pd.api.types.infer_dtype(categories)
+    if pd.api.types.is_numeric_dtype(categories.dtype) or inferred in (
+            "integer", "floating", "mixed-integer-float", "boolean"):
+        return categories.tolist(), "values"
+    if inferred in ("string", "empty"):
+        return [str(c) for c in categories], "str"
+    if inferred in ("datetime", "datetime64"):
+        return [_encode_timestamp(c) for c in categories], "datetime"
+    return [_tag_value(c) for c in categories], "tagged"
+
+
+def _decode_categories(vocab, column):
+    """Inverse of _encode_categories, restoring the recorded categories dtype."""
+    kind, dtype = column.get("vocab_kind", "str"), column.get("vocab_dtype")
+    if kind == "datetime" and dtype == "object":
+        return pd.Index([_decode_timestamp(*value) for value in vocab], dtype=object)
+    if kind == "datetime":
+        stamps = pd.DatetimeIndex(np.asarray(vocab, dtype=np.int64).view("datetime64[ns]"))
+        dtype = pd.api.types.pandas_dtype(dtype)
+        tz = getattr(dtype, "tz", None)
+        unit = dtype.unit if tz is not None else np.datetime_data(dtype)[0]
+        stamps = stamps.tz_localize("UTC").tz_convert(tz) if tz is not None else stamps
+        return stamps.as_unit(unit)
+    if kind == "values":
+        return pd.Index(vocab, dtype=dtype)
+    if kind == "tagged":
+        return pd.Index([_UNTAG[tag](value) for tag, value in vocab], dtype=object)
+    return pd.Index(vocab, dtype=object)
+
+
+def save_log_cache(event_log, cache_path, source_path=None):
+    """
+    Writes an event log DataFrame as a versioned columnar cache directory.
+
+    String/categorical columns are stored dictionary-encoded (integer codes plus a JSON
+    vocabulary), datetimes as int64 nanoseconds and numeric columns as-is, each in its
+    own .npy file so they can be memory-mapped on load. Raises TypeError (and writes
+    nothing) if a column holds values whose type the cache could not restore.
+    """
+    tmp_path = cache_path.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = []
+    for i, name in enumerate(event_log.columns):
+        series = event_log[name]
+        stem = f"col{i}"
+        if isinstance(series.dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+            tz = str(series.dt.tz) if series.dt.tz is not None else None
+            values = series.dt.tz_convert(None) if tz is not None else series
+            np.save(os.path.join(tmp_path, f"{stem}.npy"),
+                    values.dt.as_unit("ns").to_numpy().view(np.int64))
+            columns.append({"name": name, "kind": "datetime", "file": f"{stem}.npy", "tz": tz})
+        elif pd.api.types.is_numeric_dtype(series.dtype) and not isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(tmp_path, f"{stem}.npy"), series.to_numpy())
+            columns.append({"name": name, "kind": "numeric", "file": f"{stem}.npy"})
+        else:
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes = series.cat.codes.to_numpy()
+                categories = series.cat.categories
+            else:
+                codes, categories = pd.factorize(series, sort=True)
+            try:
+                vocab, vocab_kind = _encode_categories(categories)
+                present = codes >= 0
+                if vocab_kind == "tagged" and not isinstance(series.dtype, pd.CategoricalDtype) and not np.array_equal(
+                        series[present].map(type).to_numpy(), categories.take(codes[present]).map(type).to_numpy()):
+                    # factorize folds equal values of different types together (1 and True)
+                    raise TypeError("values that compare equal across types cannot be cached")
+            except TypeError as error:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise TypeError(f"column {name!r}: {error}") from None
+            np.save(os.path.join(tmp_path, f"{stem}.codes.npy"), codes.astype(_code_dtype(len(vocab))))
+            with open(os.path.join(tmp_path, f"{stem}.vocab.json"), 'w', encoding='utf-8') as f:
+                json.dump(vocab, f, ensure_ascii=False)
+            columns.append({"name": name, "kind": "codes", "file": f"{stem}.codes.npy",
+                            "vocab": f"{stem}.vocab.json", "vocab_kind": vocab_kind,
+                            "vocab_dtype": str(categories.dtype)})
+
+    meta = {
+        "format": "event-log-cache",
+        "version": CACHE_FORMAT_VERSION,
+        "rows": len(event_log),
+        "columns": columns,
+        "source": file_fingerprint(source_path) if source_path and os.path.exists(source_path) else {},
+    }
+    with open(os.path.join(tmp_path, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    # Swap the finished directory in so readers never see a half-written cache
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+
+
+def read_log_cache(cache_path, columns=None):
+    """
+    Reopens a columnar cache as a DataFrame backed by memory-mapped arrays.
+
+    Parameters:
+        cache_path (str): Directory written by `save_log_cache`
+        columns (list or None): Restrict loading to these columns
+    """
+    meta = _read_cache_meta(cache_path)
+    if meta is None or meta.get("version") != CACHE_FORMAT_VERSION:
+        raise ValueError(f"No compatible event log cache at {cache_path}")
+
+    data = {}
+    for column in meta["columns"]:
+        name = column["name"]
+        if columns is not None and name not in columns:
+            continue
+        values = np.load(os.path.join(cache_path, column["file"]), mmap_mode='r')
+        if column["kind"] == "codes":
+            with open(os.path.join(cache_path, column["vocab"]), encoding='utf-8') as f:
+                vocab = json.load(f)
+            data[name] = pd.Categorical.from_codes(values, categories=_decode_categories(vocab, column),
+                                                   validate=False)
+        elif column["kind"] == "datetime":
+            stamps = pd.DatetimeIndex(values.view("datetime64[ns]"))
+            data[name] = stamps.tz_localize("UTC").tz_convert(column["tz"]) if column["tz"] else stamps
+        else:
+            data[name] = values
+    return pd.DataFrame(data, copy=False)
+
+
+# ---------- Streaming XES Parsing ----------
+def _local_name(tag):
+    # "{http://www.xes-standard.org/}trace" -> "trace"
+    return tag.rsplit('}', 1)[-1]
+
+
+def _open_xes(xes_path):
+    if xes_path.endswith('.gz'):
+        return gzip.open(xes_path, 'rb')
+    return open(xes_path, 'rb')
+
+
+def _iter_xes_columns(xes_path, attributes=None, chunk_size=100_000):
+    """
+    Incrementally parses an XES file and yields column chunks as dicts of lists.
+
+    Each chunk holds at most `chunk_size` events with the raw (unparsed) values of
+    case_id, activity, timestamp and the requested attributes. Parsed elements are
+    cleared as soon as they are consumed, so memory stays bounded by one chunk.
+    """
+    attributes = list(attributes or [])
+    case_attrs = {a[len("case:"):]: a for a in attributes if a.startswith("case:")}
+    event_attrs = {a: a for a in attributes if not a.startswith("case:")}
+    columns = ["case_id", "activity", "timestamp"] + attributes
+
+    chunk = {col: [] for col in columns}
+    attr_types = {}     # column -> XES kind ("int", "date", ...), known once declared or seen
+    stack = []          # local names of the currently open elements
+    global_scope = None
+    trace_values = {}   # trace-level attributes of the current trace
+    event_values = {}
+    root = None
+
+    with _open_xes(xes_path) as f:
+        for event, elem in iterparse(f, events=("start", "end")):
+            name = _local_name(elem.tag)
+            if event == "start":
+                if root is None:
+                    root = elem
+                stack.append(name)
+                if name == "trace":
+                    trace_values = {}
+                elif name == "event":
+                    event_values = {}
+                elif name == "global":
+                    global_scope = elem.get("scope")
+                continue
+
+            stack.pop()
+            parent = stack[-1] if stack else None
+
+            if name in XES_VALUE_TAGS and parent in ("trace", "event"):
+                key = elem.get("key")
+                value = elem.get("value")
+                if parent == "event":
+                    event_values[key] = value
+                    if key in event_attrs:
+                        attr_types.setdefault(key, name)
+                else:
+                    trace_values[key] = value
+                    if key in case_attrs:
+                        attr_types.setdefault(case_attrs[key], name)
+            elif name in XES_VALUE_TAGS and parent == "global":
+                # <global> declarations type a column before any trace carries it
+                key = elem.get("key")
+                if global_scope == "event" and key in event_attrs:
+                    attr_types.setdefault(key, name)
+                elif global_scope == "trace" and key in case_attrs:
+                    attr_types.setdefault(case_attrs[key], name)
+            elif name == "event" and parent == "trace":
+                chunk["case_id"].append(trace_values.get("concept:name"))
+                chunk["activity"].append(event_values.get("concept:name"))
+                chunk["timestamp"].append(event_values.get("time:timestamp"))
+                for key, col in case_attrs.items():
+                    chunk[col].append(trace_values.get(key))
+                for key in event_attrs:
+                    chunk[key].append(event_values.get(key))
+                elem.clear()
+                if len(chunk["case_id"]) >= chunk_size:
+                    yield chunk, attr_types
+                    chunk = {col: [] for col in columns}
+            elif name == "trace":
+                elem.clear()
+                # Drop the processed trace from the root so the tree never grows
+                if root is not None:
+                    root.clear()
+
+    if chunk["case_id"]:
+        yield chunk, attr_types
+
+
+def _parse_timestamps(values):
+    # XES dates are ISO 8601 with offsets; normalize to UTC int64 nanoseconds
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), utc=True, format="ISO8601")
+    return parsed.dt.tz_convert(None).dt.as_unit("ns").to_numpy().view("int64")
+
+
+def _utc_datetimes(ns):
+    # Explicit ns view: pd.to_datetime infers a coarser unit when every value is NaT
+    return pd.DatetimeIndex(np.asarray(ns, dtype=np.int64).view("datetime64[ns]")).tz_localize("UTC")
+
+
+def _parse_booleans(values):
+    return np.array([None if v is None else v.strip().lower() == "true" for v in values], dtype=object)
+
+
+def _parse_attribute(kind, values):
+    """
+    Parses raw attribute strings of one XES kind into the values that are stored:
+    int64 UTC nanoseconds for dates, float64 for ints and floats (NaN where missing),
+    bools (None where missing) for booleans, and the strings themselves otherwise.
+    """
+    if kind == "date":
+        return _parse_timestamps(values)
+    if kind in ("int", "float"):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").astype("float64").to_numpy()
+    if kind == "boolean":
+        return _parse_booleans(values)
+    return values
+
+
+def _chunk_to_frame(chunk, attr_types):
+    frame = pd.DataFrame({
+        "case_id": chunk["case_id"],
+        "activity": chunk["activity"],
+        "timestamp": _utc_datetimes(_parse_timestamps(chunk["timestamp"])),
+    })
+    for col, values in chunk.items():
+        if col in frame:
+            continue
+        kind = attr_types.get(col)
+        if kind is None:
+            # Not declared and not seen yet: every value in this chunk is missing
+            frame[col] = pd.Series(values, dtype=object)
+        elif kind == "date":
+            frame[col] = _utc_datetimes(_parse_attribute(kind, values))
+        else:
+            frame[col] = pd.Series(_parse_attribute(kind, values), dtype=_CHUNK_DTYPES.get(kind, object))
+    return frame
+
+
+def iter_event_log_chunks(xes_path, attributes=None, chunk_size=100_000):
+    """
+    Streams an XES file as a sequence of DataFrame chunks without building a pm4py log.
+
+    Parameters:
+        xes_path (str): Path to the .xes or .xes.gz file
+        attributes (list or None): Extra attributes to keep (pm4py column names)
+        chunk_size (int): Maximum number of events per chunk
+
+    Yields:
+        DataFrame with case_id, activity, timestamp (UTC) and the requested attributes.
+        A single case may span two consecutive chunks. Attribute dtypes follow the XES
+        kind and are the same in every chunk: datetime64[ns, UTC] for dates, float64 for
+        ints and floats (so a chunk with missing values fits), object bools for booleans
+        and object strings otherwise. Attributes that are neither declared in a <global>
+        nor present in the first chunk are typed by parsing ahead until they occur; one
+        that never occurs is an all-None object column.
+    """
+    kinds = None
+    for chunk, attr_types in _iter_xes_columns(xes_path, attributes=attributes, chunk_size=chunk_size):
+        if kinds is None:
+            kinds = dict(attr_types)
+            untyped = [a for a in attributes or [] if a not in kinds]
+            if untyped:
+                # Type late-appearing attributes up front so early chunks get their final dtype
+                kinds.update(_scan_attribute_kinds(xes_path, untyped, chunk_size))
+        kinds.update({col: kind for col, kind in attr_types.items() if col not in kinds})
+        yield _chunk_to_frame(chunk, kinds)
+
+
+def _scan_attribute_kinds(xes_path, attributes, chunk_size):
+    """
+    XES kinds of `attributes`, parsing only as far into the file as needed to see each
+    one (the whole file when one never occurs).
+    """
+    kinds = {}
+    for _, attr_types in _iter_xes_columns(xes_path, attributes=attributes, chunk_size=chunk_size):
+        kinds = dict(attr_types)
+        if len(kinds) == len(attributes):
+            break
+    return kinds
+
+
+class _CodeColumn:
+    """Dictionary-encodes a string column into an append-only int32 code array."""
+
+    def __init__(self):
+        self.codes = array('i')
+        self.lookup = {}
+
+    def extend(self, values):
+        lookup = self.lookup
+        for value in values:
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(lookup)
+            self.codes.append(code)
+
+    def to_categorical(self):
+        categories = [None] * len(self.lookup)
+        for value, code in self.lookup.items():
+            categories[code] = value
+        codes = np.frombuffer(self.codes, dtype=np.int32).copy()
+        # Missing values are encoded as -1, which pandas reads back as NaN
+        if None in self.lookup:
+            missing = self.lookup[None]
+            codes[codes == missing] = -1
+            codes[codes > missing] -= 1
+            categories.pop(missing)
+        return pd.Categorical.from_codes(codes, categories=pd.Index(categories, dtype=object))
+
+
+class _NumberColumn:
+    """Appends parsed numeric values into a typed array."""
+
+    def __init__(self, typecode):
+        self.values = array(typecode)
+
+    def extend(self, values):
+        self.values.extend(values)
+
+
+class _ObjectColumn:
+    """Appends parsed values that have no compact typed form (booleans with gaps)."""
+
+    def __init__(self):
+        self.values = []
+
+    def extend(self, values):
+        self.values.extend(values)
+
+
+def _attribute_column(kind):
+    if kind == "date":
+        return _NumberColumn('q')
+    if kind in ("int", "float"):
+        return _NumberColumn('d')
+    if kind == "boolean":
+        return _ObjectColumn()
+    return _CodeColumn()
+
+
+def _finish_column(column, kind):
+    """Final pandas values of a column, with the dtypes pm4py gives the same attribute."""
+    if isinstance(column, _CodeColumn):
+        return column.to_categorical()
+    if kind == "date":
+        return _utc_datetimes(np.frombuffer(column.values, dtype=np.int64))
+    if kind == "boolean":
+        values = np.array(column.values, dtype=object)
+        # Only a complete column is bool; with gaps pm4py keeps objects too
+        return values.astype(bool) if not any(v is None for v in column.values) else values
+    values = np.frombuffer(column.values, dtype=np.float64)
+    if kind == "int" and not np.isnan(values).any():
+        return values.astype(np.int64)
+    return values
+
+
+def _read_xes_streaming(xes_path, attributes=None, chunk_size=100_000):
+    """
+    Builds the event log DataFrame directly from streamed column chunks.
+
+    String columns are dictionary-encoded into int32 codes and timestamps are stored as
+    int64 nanoseconds as each chunk arrives, so peak memory stays close to the size of
+    the final frame instead of several copies of the full log. An attribute column gets
+    its storage when its XES kind is first known (declared or seen), with the missing
+    values before it filled in, so a late first value does not turn it into strings.
+    """
+    columns = {
+        "case_id": _CodeColumn(),
+        "activity": _CodeColumn(),
+        "timestamp": _NumberColumn('q'),
+    }
+    kinds = {"case_id": "string", "activity": "string", "timestamp": "date"}
+    order = list(columns)
+    leading_missing = {}  # untyped column -> number of (missing) values seen so far
+
+    for chunk, attr_types in _iter_xes_columns(xes_path, attributes=attributes, chunk_size=chunk_size):
+        for col, values in chunk.items():
+            if col not in order:
+                order.append(col)
+            if col not in columns:
+                kind = attr_types.get(col)
+                if kind is None:
+                    leading_missing[col] = leading_missing.get(col, 0) + len(values)
+                    continue
+                kinds[col] = kind
+                columns[col] = _attribute_column(kind)
+                missing = leading_missing.pop(col, 0)
+                if missing:
+                    columns[col].extend(_parse_attribute(kind, [None] * missing))
+            if col in ("case_id", "activity"):
+                columns[col].extend(values)
+            else:
+                columns[col].extend(_parse_attribute(kinds[col], values))
+
+    data = {}
+    for col in order:
+        if col in columns:
+            data[col] = _finish_column(columns[col], kinds[col])
+        else:
+            # Never seen with a value
+            data[col] = pd.Categorical([None] * leading_missing.get(col, 0),
+                                       categories=pd.Index([], dtype=object))
+    return pd.DataFrame(data)
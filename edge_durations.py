@@ -0,0 +1,238 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from variant_extractor import encode_event_log
+
+NS_PER_SECOND = 1e9
+MISSING_TS = np.iinfo(np.int64).max
+
+
+class DurationSketch:
+    """
+    Mergeable quantile sketch for non-negative durations (log-bucketed, DDSketch style).
+
+    Values are counted in buckets whose boundaries grow geometrically, so every
+    quantile estimate is within `relative_accuracy` of the true value. Two sketches
+    with the same accuracy merge by adding bucket counts, which makes them safe to
+    combine across chunks and processes.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.zeros = 0
+        self.buckets = {}
+
+    def bucket_index(self, values):
+        """Bucket of each positive value (vectorized)."""
+        return np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+
+    def add_counts(self, bucket_counts, zeros=0):
+        """Adds precomputed {bucket: count} pairs and a number of zero durations."""
+        self.zeros += zeros
+        buckets = self.buckets
+        for bucket, count in bucket_counts:
+            buckets[bucket] = buckets.get(bucket, 0) + count
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        idx, counts = np.unique(self.bucket_index(positive), return_counts=True)
+        self.add_counts(zip(idx.tolist(), counts.tolist()), zeros=int((values <= 0).sum()))
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.add_counts(other.buckets.items(), zeros=other.zeros)
+        return self
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.buckets.values())
+
+    def quantile(self, q):
+        total = self.count
+        if total == 0:
+            return float("nan")
+        rank = q * (total - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                return float(2 * self.gamma ** bucket / (self.gamma + 1))
+        return float(2 * self.gamma ** max(self.buckets) / (self.gamma + 1))
+
+
+class EdgeDurationStats:
+    """
+    Waiting-time statistics per directly-follows edge (prev activity -> next activity).
+
+    For every edge keeps count, sum, max and a DurationSketch (median/p95), all in
+    seconds. Instances merge, so chunks or worker processes can each build their own
+    and combine them afterwards.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.edges = {}
+
+    def _edge(self, key):
+        stats = self.edges.get(key)
+        if stats is None:
+            stats = self.edges[key] = {
+                "count": 0, "sum": 0.0, "max": 0.0,
+                "sketch": DurationSketch(self.relative_accuracy),
+            }
+        return stats
+
+    def add_pairs(self, prev_names, next_names, prev_codes, next_codes, seconds):
+        """
+        Adds a batch of (prev, next, duration) pairs in one vectorized grouping.
+
+        Parameters:
+            prev_names / next_names: Vocabularies for the code arrays
+            prev_codes / next_codes (ndarray): Activity codes per pair
+            seconds (ndarray): Duration of each pair in seconds
+        """
+        if len(seconds) == 0:
+            return
+        width = np.int64(max(len(next_names), 1))
+        keys = prev_codes.astype(np.int64) * width + next_codes
+        edge_keys, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        n_edges = len(edge_keys)
+
+        counts = np.bincount(inverse, minlength=n_edges)
+        sums = np.bincount(inverse, weights=seconds, minlength=n_edges)
+        maxima = np.full(n_edges, -np.inf)
+        np.maximum.at(maxima, inverse, seconds)
+
+        positive = seconds > 0
+        zeros = np.bincount(inverse[~positive], minlength=n_edges)
+        sketch = DurationSketch(self.relative_accuracy)
+        buckets = sketch.bucket_index(seconds[positive])
+        bucket_min = int(buckets.min()) if len(buckets) else 0
+        span = np.int64((int(buckets.max()) - bucket_min + 1) if len(buckets) else 1)
+        combined, bucket_counts = np.unique(inverse[positive] * span + (buckets - bucket_min),
+                                            return_counts=True)
+        per_edge_buckets = [[] for _ in range(n_edges)]
+        for key, count in zip(combined.tolist(), bucket_counts.tolist()):
+            per_edge_buckets[key // span].append((key % span + bucket_min, count))
+
+        for i, key in enumerate(edge_keys.tolist()):
+            stats = self._edge((prev_names[key // width], next_names[key % width]))
+            stats["count"] += int(counts[i])
+            stats["sum"] += float(sums[i])
+            stats["max"] = max(stats["max"], float(maxima[i]))
+            stats["sketch"].add_counts(per_edge_buckets[i], zeros=int(zeros[i]))
+
+    def merge(self, other):
+        for key, theirs in other.edges.items():
+            stats = self._edge(key)
+            stats["count"] += theirs["count"]
+            stats["sum"] += theirs["sum"]
+            stats["max"] = max(stats["max"], theirs["max"])
+            stats["sketch"].merge(theirs["sketch"])
+        return self
+
+    def summary(self):
+        """
+        Returns {(prev, next): {"count", "mean", "median", "p95", "max"}} in seconds.
+        """
+        result = {}
+        for key, stats in self.edges.items():
+            count = stats["count"]
+            result[key] = {
+                "count": count,
+                "mean": stats["sum"] / count if count else float("nan"),
+                "median": stats["sketch"].quantile(0.5),
+                "p95": stats["sketch"].quantile(0.95),
+                "max": stats["max"],
+            }
+        return result
+
+
+def _add_encoded_log(stats, encoded_log):
+    """Adds every within-case consecutive event pair of an EncodedLog."""
+    acts, stamps = encoded_log.activities, encoded_log.timestamps
+    if len(acts) < 2:
+        return
+    same_case = np.ones(len(acts) - 1, dtype=bool)
+    same_case[encoded_log.offsets[1:-1] - 1] = False
+    known = (stamps[:-1] != MISSING_TS) & (stamps[1:] != MISSING_TS)
+    pairs = np.flatnonzero(same_case & known)
+    seconds = (stamps[pairs + 1] - stamps[pairs]) / NS_PER_SECOND
+    vocab = encoded_log.vocabulary
+    stats.add_pairs(vocab, vocab, acts[pairs], acts[pairs + 1], np.maximum(seconds, 0.0))
+
+
+def compute_edge_durations(source, relative_accuracy=0.01):
+    """
+    Computes per-edge waiting-time statistics in a single pass over the event log.
+
+    Parameters:
+        source: Event log DataFrame, or an iterable of DataFrame chunks whose cases are
+            contiguous, so only a chunk's last case can continue in the next one (e.g.
+            from `data_loader.iter_event_log_chunks`). Only that case's last event is
+            carried between chunks.
+        relative_accuracy (float): Quantile accuracy of the duration sketches
+
+    Returns:
+        EdgeDurationStats
+    """
+    stats = EdgeDurationStats(relative_accuracy)
+    if isinstance(source, pd.DataFrame):
+        _add_encoded_log(stats, encode_event_log(source))
+        return stats
+
+    carry = None  # last event of the case that may continue in the next chunk
+    for chunk in source:
+        chunk = chunk[['case_id', 'activity', 'timestamp']]
+        if not len(chunk):
+            continue
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        encoded = encode_event_log(chunk)
+        _add_encoded_log(stats, encoded)
+
+        # Cases are numbered in sorted order, so look up the chunk's final case by value
+        open_case = np.flatnonzero(encoded.case_ids == chunk['case_id'].iloc[-1])
+        if not len(open_case):
+            carry = None
+            continue
+        last = encoded.offsets[open_case + 1] - 1
+        carry = pd.DataFrame({
+            "case_id": encoded.case_ids[open_case],
+            "activity": np.asarray(encoded.vocabulary, dtype=object)[encoded.activities[last]],
+            "timestamp": pd.to_datetime(encoded.timestamps[last], utc=True),
+        })
+    return stats
+
+
+def annotate_process_graph(G, stats):
+    """
+    Attaches duration statistics (seconds) to the matching edges of a process graph as
+    duration_count / duration_mean / duration_median / duration_p95 / duration_max.
+    START and END edges have no waiting time and are left untouched.
+    """
+    if isinstance(stats, EdgeDurationStats):
+        stats = stats.summary()
+    for (u, v), summary in stats.items():
+        if G.has_edge(u, v):
+            G[u][v].update({f"duration_{name}": value for name, value in summary.items()})
+    return G
+
+
+def format_duration(seconds):
+    """Short human-readable duration, e.g. 45s, 12.5m, 3.2h, 4.1d."""
+    if seconds is None or seconds != seconds:
+        return "-"
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{seconds / size:.1f}{unit}"
+    return f"{seconds:.0f}s"
@@ -0,0 +1,246 @@
+import os
+import re
+import json
+import hashlib
+
+import numpy as np
+
+import metrics
+
+# Bump whenever the on-disk layout of EmbeddingCache changes
+EMBEDDING_CACHE_VERSION = 1
+
+_MODELS = {}
+
+
+def get_sentence_model(model_name):
+    """
+    Returns a SentenceTransformer loaded once per process and reused afterwards.
+    """
+    model = _MODELS.get(model_name)
+    if model is None:
+        from sentence_transformers import SentenceTransformer
+        model = _MODELS[model_name] = SentenceTransformer(model_name)
+    return model
+
+
+def text_key(model_name, text, encode_kwargs=None):
+    """
+    Content address of one embedding: hash of (model_name, text) plus any model.encode
+    options that change the vector (e.g. normalize_embeddings), so texts encoded with
+    different options never share an entry.
+    """
+    options = f"\0{json.dumps(encode_kwargs, sort_keys=True, default=repr)}" if encode_kwargs else ""
+    return hashlib.sha1(f"{model_name}\0{text}{options}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding store: a memory-mapped matrix of vectors plus a JSON index.
+
+    Each entry maps a content key to a row (slot) of the matrix and a last-used tick.
+    When `max_entries` is reached, the least recently used entries are evicted and
+    their slots reused, so the files never exceed the size cap.
+
+    Parameters:
+        cache_dir (str): Directory holding `vectors.bin` and `index.json`
+        dim (int or None): Vector dimension (read from the index when it exists)
+        dtype (str): Storage dtype, "float16" (half the disk/memory) or "float32"
+        max_entries (int): Maximum number of stored vectors
+    """
+
+    def __init__(self, cache_dir, dim=None, dtype="float16", max_entries=200_000):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.vectors_path = os.path.join(cache_dir, "vectors.bin")
+        self.max_entries = max_entries
+        self.entries = {}   # key -> [slot, last_used]
+        self.tick = 0
+        self.capacity = 0
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.vectors = None
+
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") == EMBEDDING_CACHE_VERSION and (dim is None or index["dim"] == dim):
+                self.dim = index["dim"]
+                self.dtype = np.dtype(index["dtype"])
+                self.capacity = index["capacity"]
+                self.tick = index["tick"]
+                self.entries = index["entries"]
+                if self.capacity:
+                    self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+",
+                                             shape=(self.capacity, self.dim))
+                if self.capacity > self.max_entries:
+                    # Reopened with a smaller cap: keep the most recently used entries
+                    self._shrink()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_many(self, keys):
+        """
+        Looks up vectors by key.
+
+        Returns:
+            - vectors: float32 array (len(keys), dim) with zeros for misses
+            - hits: boolean mask of keys found in the cache
+        """
+        hits = np.zeros(len(keys), dtype=bool)
+        if self.dim is None:
+            return np.zeros((len(keys), 0), dtype=np.float32), hits
+        slots = np.zeros(len(keys), dtype=np.int64)
+        self.tick += 1
+        for i, key in enumerate(keys):
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry[1] = self.tick
+                slots[i] = entry[0]
+                hits[i] = True
+        vectors = np.zeros((len(keys), self.dim), dtype=np.float32)
+        if hits.any():
+            vectors[hits] = self.vectors[slots[hits]]
+        return vectors, hits
+
+    def _ensure_capacity(self, needed):
+        if self.capacity >= needed:
+            return
+        new_capacity = max(self.capacity, 1024)
+        while new_capacity < needed:
+            new_capacity *= 2
+        new_capacity = min(new_capacity, self.max_entries)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.vectors_path + ".tmp"
+        grown = np.memmap(tmp_path, dtype=self.dtype, mode="w+", shape=(new_capacity, self.dim))
+        if self.capacity:
+            grown[:self.capacity] = self.vectors
+            del self.vectors
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self.vectors_path)
+        self.capacity = new_capacity
+        self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+",
+                                 shape=(self.capacity, self.dim))
+
+    def _evict(self, count, protected=()):
+        """Drops the `count` least recently used entries and returns their slots."""
+        victims = sorted((entry[1], key) for key, entry in self.entries.items() if key not in protected)
+        return [self.entries.pop(key)[0] for _, key in victims[:max(count, 0)]]
+
+    def _shrink(self):
+        """Evicts down to max_entries and rewrites the matrix at that capacity."""
+        self._evict(len(self.entries) - self.max_entries)
+        keys = sorted(self.entries, key=lambda key: self.entries[key][0])
+        tmp_path = self.vectors_path + ".tmp"
+        shrunk = np.memmap(tmp_path, dtype=self.dtype, mode="w+", shape=(self.max_entries, self.dim))
+        if keys:
+            shrunk[:len(keys)] = self.vectors[[self.entries[key][0] for key in keys]]
+        shrunk.flush()
+        del shrunk, self.vectors
+        os.replace(tmp_path, self.vectors_path)
+        for slot, key in enumerate(keys):
+            self.entries[key][0] = slot
+        self.capacity = self.max_entries
+        self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+",
+                                 shape=(self.capacity, self.dim))
+        self.flush()
+
+    def _free_slots(self, count, protected):
+        """Returns `count` slots, evicting least-recently-used entries if the cache is full."""
+        used = {entry[0] for entry in self.entries.values()}
+        room = max(self.max_entries - len(self.entries), 0)
+        free = [slot for slot in range(self.capacity) if slot not in used][:min(count, room)]
+        return free + self._evict(count - len(free), protected)
+
+    def put_many(self, keys, vectors):
+        """Stores vectors under their keys (at most max_entries are kept)."""
+        vectors = np.asarray(vectors)
+        if len(keys) == 0:
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        keys, vectors = list(keys)[-self.max_entries:], vectors[-self.max_entries:]
+        new = [i for i, key in enumerate(keys) if key not in self.entries]
+        self._ensure_capacity(min(len(self.entries) + len(new), self.max_entries))
+        slots = self._free_slots(len(new), protected=set(keys))
+
+        self.tick += 1
+        for i, slot in zip(new, slots):
+            self.entries[keys[i]] = [slot, self.tick]
+        rows = np.array([self.entries[key][0] for key in keys], dtype=np.int64)
+        self.vectors[rows] = vectors.astype(self.dtype)
+        for key in keys:
+            self.entries[key][1] = self.tick
+
+    def flush(self):
+        """Persists the matrix and the index (index written atomically)."""
+        if self.vectors is None:
+            return
+        self.vectors.flush()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": EMBEDDING_CACHE_VERSION,
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+                "capacity": self.capacity,
+                "tick": self.tick,
+                "entries": self.entries,
+            }, f)
+        os.replace(tmp_path, self.index_path)
+
+
+def _model_cache_dir(cache_dir, model_name):
+    return os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+
+def encode_texts(texts, model_name="all-MiniLM-L6-v2", cache_dir=None, batch_size=256,
+                 show_progress_bar=True, **encode_kwargs):
+    """
+    Embeds texts, encoding only those not already in the cache.
+
+    Duplicate texts are encoded once, misses are sent to the model in batches and
+    written back to the cache.
+
+    Parameters:
+        texts (list): Strings to embed
+        model_name (str): SentenceTransformer model
+        cache_dir (str or None): Root of the on-disk cache; None disables caching
+        batch_size (int): Texts per model.encode call
+        encode_kwargs: Extra arguments for model.encode (e.g. normalize_embeddings);
+            part of the cache key
+
+    Returns:
+        float32 array (len(texts), dim)
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    position = {text: i for i, text in enumerate(unique_texts)}
+    cache = None
+    if cache_dir is not None:
+        cache = EmbeddingCache(_model_cache_dir(cache_dir, model_name))
+        keys = [text_key(model_name, text, encode_kwargs) for text in unique_texts]
+        vectors, hits = cache.get_many(keys)
+    else:
+        keys, vectors, hits = None, None, np.zeros(len(unique_texts), dtype=bool)
+
+    misses = np.flatnonzero(~hits)
+    if len(misses):
+        model = get_sentence_model(model_name)
+        encoded = model.encode([unique_texts[i] for i in misses], batch_size=batch_size,
+                               convert_to_numpy=True, show_progress_bar=show_progress_bar,
+                               **encode_kwargs).astype(np.float32)
+        if vectors is None or vectors.shape[1] != encoded.shape[1]:
+            vectors = np.zeros((len(unique_texts), encoded.shape[1]), dtype=np.float32)
+        vectors[misses] = encoded
+        if cache is not None:
+            cache.put_many([keys[i] for i in misses], encoded)
+    metrics.count("embedding_cache_hits", int(hits.sum()))
+    metrics.count("embedding_cache_misses", len(misses))
+    if cache is not None:
+        print(f"[INFO] Embedding cache: {int(hits.sum())} hits, {len(misses)} misses")
+        cache.flush()
+
+    return vectors[[position[text] for text in texts]]
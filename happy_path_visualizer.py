@@ -1,4 +1,4 @@
-def visualize_happy_path(variant, save_path="happy_path", format="svg"):
+def visualize_happy_path(variant, save_path="happy_path", format="svg", render_queue=None):
     from graphviz import Digraph
     import os
 
@@ -17,6 +17,8 @@ def visualize_happy_path(variant, save_path="happy_path", format="svg"):
         if idx > 0:
             dot.edge(f"{idx - 1}", node_id)
 
-    # Render to file
+    # Render to file (or hand the DOT source to the render queue and return its future)
+    if render_queue is not None:
+        return render_queue.submit_dot(dot.source, f"{save_path}.{format}", engine=dot.engine)
     dot.render(filename=save_path, cleanup=True)
     print(f"✅ Saved {format.upper()} happy path to: {save_path}.{format}")
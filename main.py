@@ -1,37 +1,47 @@
-import networkx as nx
-import matplotlib.pyplot as plt
-import os
-import pandas as pd
-from collections import defaultdict
-
-from data_loader import load_event_log
+from data_loader import load_event_log, iter_event_log_chunks
 from variant_extractor import extract_variants
+from approximate_variants import extract_variants_approx
 from variant_visualizer import plot_variant_distribution, save_variants_to_csv
 from happy_path_visualizer import visualize_happy_path
 from variant_tree_builder import build_and_visualize_trie
-from variant_tree_visualizer import visualize_variant_tree
 from variant_dag_builder import build_process_graph, draw_process_graph
-from pareto_cutoff_variants import pareto_cutoff_variants
+from pareto_cutoff_variants import CoverageIndex
 from variant_hierarchy_builder import (
     build_and_visualize_data_driven_tree,
 )
 from variant_tree_checker import analyze_variant_tree
+from pipeline import Pipeline
+from render_queue import RenderQueue
+import metrics
+
+XES_PATH = 'data/BPI_Challenge_2017.xes.gz'
+CSV_PATH = "output/variant_hierarchy_details.csv"
 
-def process_similarity_tree(pareto_variants, top_n):
+def process_similarity_tree(pareto_variants, top_n, max_levels=10, max_clusters=20, min_cluster_size=2,
+                            model_name="all-MiniLM-L6-v2", distance="embedding", embedding_mode="sentence", ngram=1,
+                            render_queue=None):
     """
     Process variants and create a similarity-based hierarchical tree.
+    distance="edit" or embedding_mode="activity" avoid per-variant sentence inference
+    (see build_data_driven_tree).
     """
     top_variants = pareto_variants[:top_n]
     nodes, tree = build_and_visualize_data_driven_tree(
     top_variants,      # your list of (variant, freq)
-    max_levels=10,         # set as needed
-    max_clusters=20,      # set as needed
-    min_cluster_size=2   # set as needed
+    max_levels=max_levels,         # set as needed
+    max_clusters=max_clusters,      # set as needed
+    min_cluster_size=min_cluster_size,   # set as needed
+    model_name=model_name,
+    distance=distance,
+    embedding_mode=embedding_mode,
+    ngram=ngram,
+    render_queue=render_queue
 )
     return nodes, tree
 
-def main():
-    df = load_event_log('data/BPI_Challenge_2017.xes.gz')
+# ---------- Pipeline stages ----------
+def load_stage(xes_path):
+    df = load_event_log(xes_path)
 
     print("✅ Event log loaded.")
     print("🔍 Preview:")
@@ -39,7 +49,9 @@ def main():
 
     print(f"📊 Total cases: {df['case_id'].nunique()}")
     print(f"⚙️ Total events: {len(df)}")
+    return df
 
+def extract_stage(df):
     # 🔍 Extract variants
     variants_dict, sorted_variants = extract_variants(df)
 
@@ -48,51 +60,135 @@ def main():
     print("\n🔎 Sample from sorted_variants:")
     for i, item in enumerate(sorted_variants[:5], 1):
         print(f"{i}: {item}")
+    return sorted_variants, df['case_id'].nunique()
 
-    # 📊 Compute Pareto (80%) cutoff variants
-    pareto_variants = pareto_cutoff_variants(sorted_variants, total_cases=df['case_id'].nunique())
-
-    print(f"\n🎯 Number of variants covering 80% of cases: {len(pareto_variants)}")
-    total_covered = sum([count for _, count in pareto_variants])
-    print(f"✅ Cases covered by these variants: {total_covered} ({(total_covered / df['case_id'].nunique()):.2%})")
+def extract_approx_stage(xes_path, sample_rate, capacity, seed=0):
+    # 🎲 Approximate variants from a case sample, streamed in chunks with a fixed-size sketch
+    _, sorted_variants, report = extract_variants_approx(
+        iter_event_log_chunks(xes_path), sample_rate=sample_rate, capacity=capacity, seed=seed)
 
+    print(f"\n🎲 Approximate mode: {report.sampled_cases} of {report.total_cases} cases sampled "
+          f"({report.sample_rate:.0%}), {len(sorted_variants)} variants monitored")
+    print(f"📐 Sketch overcount ≤ {report.sketch_error} sampled cases; "
+          f"unlisted variants ≤ {report.unmonitored_max:.0f} cases")
+    k, coverage, low, high = report.pareto_bounds(0.8)
+    print(f"📏 Top {k} variants cover ~{coverage:.2%} of cases (bounds {low:.2%} – {high:.2%})")
+    return sorted_variants, report.total_cases
 
-    # 📈 Plot and save variant distribution
-    plot_variant_distribution(pareto_variants, save_path="output/variant_distribution.png")
-    save_variants_to_csv(pareto_variants, csv_path="output/pareto_variants.csv")
+def pareto_stage(extracted, threshold=0.8, report_thresholds=(0.5, 0.8, 0.9, 0.95, 0.99)):
+    sorted_variants, total_cases = extracted
 
+    # 📊 Compute Pareto (80%) cutoff variants
+    coverage_index = CoverageIndex(sorted_variants, total_cases=total_cases)
+    pareto_variants = coverage_index.variants(threshold)
+
+    print(f"\n🎯 Number of variants covering {threshold:.0%} of cases: {len(pareto_variants)}")
+    total_covered = coverage_index.covered_cases(len(pareto_variants))
+    print(f"✅ Cases covered by these variants: {total_covered} ({coverage_index.coverage(len(pareto_variants)):.2%})")
+    for report_threshold, k in zip(report_thresholds, coverage_index.cutoffs(report_thresholds)):
+        print(f"   {report_threshold:.0%} of cases -> {k} variants")
+    return pareto_variants
+
+# Render stages hand their output to the render queue (when given) and return None,
+# so the pipeline never has to pickle a future
+def distribution_stage(pareto_variants, save_path, render_queue=None):
+    plot_variant_distribution(pareto_variants, save_path=save_path, render_queue=render_queue)
+
+def happy_path_stage(pareto_variants, save_path, render_queue=None):
     # 🎯 Extract and print happy path
     most_common_variant = list(pareto_variants[0][0])  # Ensure it's a list
     print("\n🎯 Happy Path (Most Common Variant):")
     print(" → ".join(most_common_variant))
     print(f"📏 Number of events in happy path: {len(most_common_variant)}")
-    
-    visualize_happy_path(most_common_variant, save_path="output/happy_path", format="svg")
-
-    # 🌳 Build and visualize the process variant tree
-    build_and_visualize_trie(pareto_variants, top_n=50, save_path="output/variant_trie_tree")
-    #visualize_variant_tree(tree, save_path="variant_tree")
-    graph = build_process_graph(pareto_variants, top_n=50)
-    draw_process_graph(graph, save_path="output/variant_dag.png")
-    print("🗺️ Variant DAG saved to variant_dag.png")
-
-    #process_similarity_tree(pareto_variants, top_n=100)
-
-    CSV_PATH = "output/variant_hierarchy_details.csv"
-
-    if not os.path.exists(CSV_PATH):
-        print("⚠️ variant_hierarchy_details.csv not found. Building variant tree now...")
-        process_similarity_tree(pareto_variants, top_n=len(pareto_variants))  # Adjust top_n as needed
-
-        # Check again after generation
-        if os.path.exists(CSV_PATH):
-            print("✅ Tree successfully built. Proceeding to analysis...")
-            analyze_variant_tree(CSV_PATH)
-        else:
-            print("❌ Tree generation failed. File still not found.")
+
+    visualize_happy_path(most_common_variant, save_path=save_path, format="svg", render_queue=render_queue)
+
+def trie_stage(pareto_variants, max_nodes, save_path, render_queue=None):
+    build_and_visualize_trie(pareto_variants, top_n=None, max_nodes=max_nodes, save_path=save_path,
+                             render_queue=render_queue)
+
+def dag_stage(pareto_variants, top_n, save_path, render_queue=None):
+    graph = build_process_graph(pareto_variants, top_n=top_n)
+    draw_process_graph(graph, save_path=save_path, render_queue=render_queue)
+    if render_queue is None:
+        print(f"🗺️ Variant DAG saved to {save_path}")
+
+def hierarchy_stage(pareto_variants, render_queue=None, **params):
+    nodes, tree = process_similarity_tree(pareto_variants, top_n=len(pareto_variants), render_queue=render_queue,
+                                          **params)
+    print("✅ Tree successfully built. Proceeding to analysis...")
+    return nodes, tree
+
+def analyze_stage(hierarchy):
+    # The hierarchy is analyzed in memory; the CSV stays for inspection
+    analyze_variant_tree(hierarchy)
+
+def build_pipeline(xes_path=XES_PATH, threshold=0.8, top_n=50, trie_max_nodes=200, max_levels=10, max_clusters=20,
+                   min_cluster_size=2, model_name="all-MiniLM-L6-v2", distance="embedding", embedding_mode="sentence",
+                   ngram=1, approximate=False, sample_rate=0.1, sketch_capacity=10_000, sample_seed=0,
+                   render_queue=None):
+    """
+    Declares the analysis as a stage graph; see pipeline.Pipeline for the caching rules.
+    With approximate=True the variants come from a case sample and a heavy-hitters sketch
+    (see approximate_variants) instead of the fully loaded log.
+    With a render_queue, the plot and Graphviz stages only submit their renders and the
+    caller waits on the queue.
+    """
+    pipeline = Pipeline()
+    render = {"render_queue": render_queue} if render_queue is not None else {}
+    if approximate:
+        pipeline.add("extract", extract_approx_stage, sources=[xes_path],
+                     params={"xes_path": xes_path, "sample_rate": sample_rate, "capacity": sketch_capacity,
+                             "seed": sample_seed})
+    else:
+        # The loader keeps its own columnar cache, so the DataFrame is never pickled here
+        pipeline.add("load", load_stage, params={"xes_path": xes_path}, sources=[xes_path], cache=False)
+        pipeline.add("extract", extract_stage, deps=["load"])
+    pipeline.add("pareto", pareto_stage, deps=["extract"], params={"threshold": threshold})
+
+    # 📈 Independent outputs of the Pareto set, run concurrently
+    pipeline.add("distribution_plot", distribution_stage, deps=["pareto"],
+                 params={"save_path": "output/variant_distribution.png"}, runtime=render,
+                 outputs=["output/variant_distribution.png"], resource="matplotlib")
+    pipeline.add("pareto_csv", save_variants_to_csv, deps=["pareto"],
+                 params={"csv_path": "output/pareto_variants.csv"},
+                 outputs=["output/pareto_variants.csv"])
+    pipeline.add("happy_path", happy_path_stage, deps=["pareto"],
+                 params={"save_path": "output/happy_path"}, runtime=render, outputs=["output/happy_path.svg"])
+    # 🌳 Process variant tree
+    # Level-of-detail pruning bounds the render, so the trie can use the whole Pareto set
+    pipeline.add("trie", trie_stage, deps=["pareto"],
+                 params={"max_nodes": trie_max_nodes, "save_path": "output/variant_trie_tree"}, runtime=render,
+                 outputs=["output/variant_trie_tree.png"])
+    pipeline.add("dag", dag_stage, deps=["pareto"],
+                 params={"top_n": top_n, "save_path": "output/variant_dag.png"}, runtime=render,
+                 outputs=["output/variant_dag.png"])
+
+    pipeline.add("hierarchy", hierarchy_stage, deps=["pareto"],
+                 params={"max_levels": max_levels, "max_clusters": max_clusters,
+                         "min_cluster_size": min_cluster_size, "model_name": model_name,
+                         "distance": distance, "embedding_mode": embedding_mode, "ngram": ngram},
+                 runtime=render, outputs=[CSV_PATH])
+    pipeline.add("analyze", analyze_stage, deps=["hierarchy"], cache=False)
+    return pipeline
+
+def main(metrics_path="output/metrics.jsonl", prometheus_path="output/metrics.prom", background_render=True,
+         **pipeline_params):
+    # Per-stage timings, memory and counts; pass metrics_path=None to disable
+    if metrics_path:
+        metrics.enable(metrics_path, prometheus_path=prometheus_path)
+    # e.g. main(approximate=True, sample_rate=0.05) for a quick run on a huge log
+    if not background_render:
+        build_pipeline(**pipeline_params).run()
     else:
-        print("✅ CSV file found. Proceeding to analysis...")
-        analyze_variant_tree(CSV_PATH)
+        # 🖼️ Renders run in the background while the analysis stages continue
+        with RenderQueue() as render_queue:
+            build_pipeline(render_queue=render_queue, **pipeline_params).run()
+            with metrics.stage("render_wait"):
+                done, _ = render_queue.wait()
+            print(f"🖼️ {len(done)} renders finished")
+    if metrics.write_prometheus():
+        print(f"📈 Metrics written to {metrics_path} and {prometheus_path}")
 
 if __name__ == "__main__":
     main()
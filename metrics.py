@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Prefix of every exported Prometheus metric
+METRIC_PREFIX = "variant_pipeline"
+# Stage record fields summed into the Prometheus items_processed_total family
+ITEM_FIELDS = ("rows", "cases", "variants", "nodes", "edges")
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _NoopStage:
+    """Returned by `stage()` while metrics are disabled; every call is a no-op."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **fields):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class StageTimer:
+    """
+    Measures one stage: wall and CPU time, growth of the peak RSS, and any sizes or
+    counts attached with `set` / `count` (rows, variants, nodes, cache hits...).
+    """
+
+    def __init__(self, recorder, name, labels):
+        self.recorder = recorder
+        self.name = name
+        self.fields = dict(labels)
+        self.counts = defaultdict(int)
+
+    def __enter__(self):
+        _active_stages().append(self)
+        self._rss = peak_rss_bytes()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        rss = peak_rss_bytes()
+        _active_stages().pop()
+        record = {
+            "ts": time.time(),
+            "stage": self.name,
+            "wall_seconds": wall,
+            "cpu_seconds": cpu,
+            "peak_rss_delta_bytes": rss - self._rss if rss is not None else None,
+            "ok": exc_type is None,
+            **self.fields,
+            **self.counts,
+        }
+        self.recorder.record(record, self.counts)
+        return False
+
+    def set(self, **fields):
+        """Attaches sizes or labels to the stage record (e.g. rows=..., variants=...)."""
+        self.fields.update(fields)
+
+    def count(self, name, value=1):
+        """Adds to a per-stage counter that is also summed into the global counters."""
+        self.counts[name] += value
+
+
+class MetricsRecorder:
+    """
+    Collects stage records and counters; appends every record to a JSON-lines file and
+    can write aggregated totals in the Prometheus text exposition format.
+
+    Parameters:
+        jsonl_path (str or None): File receiving one JSON object per finished stage
+        prometheus_path (str or None): Default target of `write_prometheus`
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.records = []
+        self.counters = defaultdict(float)
+        self.stage_totals = {}
+        self._lock = threading.Lock()
+        if jsonl_path:
+            os.makedirs(os.path.dirname(jsonl_path) or ".", exist_ok=True)
+
+    def record(self, record, counts=None):
+        with self._lock:
+            self.records.append(record)
+            totals = self.stage_totals.setdefault(record["stage"], {
+                "runs": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_delta_bytes": 0,
+                "items": defaultdict(int)})
+            totals["runs"] += 1
+            totals["wall_seconds"] += record["wall_seconds"]
+            totals["cpu_seconds"] += record["cpu_seconds"]
+            if record["peak_rss_delta_bytes"] is not None:
+                totals["peak_rss_delta_bytes"] = max(totals["peak_rss_delta_bytes"],
+                                                     record["peak_rss_delta_bytes"])
+            for item in ITEM_FIELDS:
+                if isinstance(record.get(item), int):
+                    totals["items"][item] += record[item]
+            for name, value in (counts or {}).items():
+                self.counters[name] += value
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def prometheus_text(self):
+        lines = []
+
+        def family(metric, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{metric}{{{label_text}}} {value}")
+
+        with self._lock:
+            stages = sorted(self.stage_totals.items())
+            counters = sorted(self.counters.items())
+        family("stage_runs_total", "counter", "Completed runs per stage.",
+               [({"stage": s}, t["runs"]) for s, t in stages])
+        family("stage_wall_seconds_total", "counter", "Wall-clock time spent per stage.",
+               [({"stage": s}, t["wall_seconds"]) for s, t in stages])
+        family("stage_cpu_seconds_total", "counter", "CPU time spent per stage.",
+               [({"stage": s}, t["cpu_seconds"]) for s, t in stages])
+        family("stage_peak_rss_delta_bytes", "gauge", "Largest growth of the peak RSS during one run.",
+               [({"stage": s}, t["peak_rss_delta_bytes"]) for s, t in stages])
+        family("items_processed_total", "counter", "Rows, cases, variants, nodes and edges handled per stage.",
+               [({"stage": s, "item": item}, value) for s, t in stages for item, value in sorted(t["items"].items())])
+        family("events_total", "counter", "Counters reported by the stages, e.g. cache hits and misses.",
+               [({"name": name}, value) for name, value in counters])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=None):
+        """Writes the Prometheus text file atomically (for node_exporter's textfile collector)."""
+        path = path or self.prometheus_path
+        if not path:
+            return None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return path
+
+
+_recorder = None
+_local = threading.local()
+
+
+def _active_stages():
+    """Stack of the stages currently open in this thread (innermost last)."""
+    stack = getattr(_local, "stages", None)
+    if stack is None:
+        stack = _local.stages = []
+    return stack
+
+
+def enable(jsonl_path=None, prometheus_path=None):
+    """Turns instrumentation on for the whole process and returns the recorder."""
+    global _recorder
+    _recorder = MetricsRecorder(jsonl_path, prometheus_path)
+    return _recorder
+
+
+def disable():
+    global _recorder
+    _recorder = None
+
+
+def get_recorder():
+    return _recorder
+
+
+def stage(name, **labels):
+    """
+    Context manager timing one stage; a shared no-op object when metrics are disabled.
+
+        with metrics.stage("extract_variants") as m:
+            ...
+            m.set(rows=len(df), variants=len(sorted_variants))
+    """
+    if _recorder is None:
+        return _NOOP_STAGE
+    return StageTimer(_recorder, name, labels)
+
+
+def timed(name, describe=None):
+    """
+    Decorator recording every call of a function as a stage.
+
+    Parameters:
+        name (str): Stage name
+        describe (callable or None): describe(result, *args, **kwargs) -> dict of sizes
+            (rows, variants, nodes...) attached to the record
+
+    When metrics are disabled the wrapper only checks one global and calls through.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            with StageTimer(_recorder, name, {}) as timer:
+                result = func(*args, **kwargs)
+                if describe is not None:
+                    timer.set(**describe(result, *args, **kwargs))
+                return result
+        return wrapper
+    return decorator
+
+
+def annotate(**fields):
+    """Attaches fields to the innermost open stage of this thread (no-op when disabled)."""
+    if _recorder is not None:
+        stack = _active_stages()
+        if stack:
+            stack[-1].set(**fields)
+
+
+def count(name, value=1):
+    """
+    Adds to a counter (e.g. cache hits). Inside a stage it is reported on that stage's
+    record and summed into the global counters when the stage ends.
+    """
+    if _recorder is None:
+        return
+    stack = _active_stages()
+    if stack:
+        stack[-1].count(name, value)
+    else:
+        _recorder.count(name, value)
+
+
+def write_prometheus(path=None):
+    if _recorder is not None:
+        return _recorder.write_prometheus(path)
+    return None
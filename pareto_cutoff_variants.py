@@ -1,10 +1,73 @@
+import numpy as np
+
+from variant_extractor import EncodedVariants
+
+
+class CoverageIndex:
+    """
+    Cumulative case counts over a frequency-sorted variant list, built once.
+
+    Any Pareto cutoff is then one binary search, and batches of thresholds or
+    the full top-k coverage curve come back as arrays.
+
+    Parameters:
+        sorted_variants: List of (variant_tuple, count) sorted by count desc, or EncodedVariants
+        total_cases (int or None): Denominator for coverage; defaults to the sum of counts
+    """
+
+    def __init__(self, sorted_variants, total_cases=None):
+        self.sorted_variants = sorted_variants
+        if isinstance(sorted_variants, EncodedVariants):
+            counts = np.asarray(sorted_variants.counts, dtype=np.int64)
+        else:
+            counts = np.fromiter((count for _, count in sorted_variants), dtype=np.int64,
+                                 count=len(sorted_variants))
+        self.cumulative = np.cumsum(counts)
+        if total_cases is None:
+            total_cases = int(self.cumulative[-1]) if len(counts) else 0
+        self.total_cases = total_cases
+        if total_cases > 0:
+            self.curve = self.cumulative / total_cases
+        else:
+            self.curve = np.zeros(len(counts), dtype=np.float64)
+
+    def __len__(self):
+        return len(self.cumulative)
+
+    def cutoff(self, threshold=0.8):
+        """Number of top variants needed to cover `threshold` of the cases."""
+        return int(self.cutoffs([threshold])[0])
+
+    def cutoffs(self, thresholds):
+        """
+        Vectorized `cutoff` for an array of thresholds.
+
+        Like the incremental loop, a variant is always included once it is reached,
+        and every variant is returned when the threshold is never met.
+        """
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        positions = np.searchsorted(self.curve, thresholds, side="left") + 1
+        return np.minimum(positions, len(self))
+
+    def coverage(self, k):
+        """Share of cases covered by the k most frequent variants."""
+        if k <= 0 or len(self) == 0:
+            return 0.0
+        return float(self.curve[min(k, len(self)) - 1])
+
+    def covered_cases(self, k):
+        """Number of cases covered by the k most frequent variants."""
+        if k <= 0 or len(self) == 0:
+            return 0
+        return int(self.cumulative[min(k, len(self)) - 1])
+
+    def variants(self, threshold=0.8):
+        """The (variant, count) slice covering `threshold` of the cases."""
+        k = self.cutoff(threshold)
+        if isinstance(self.sorted_variants, EncodedVariants):
+            return self.sorted_variants.subset(k)
+        return self.sorted_variants[:k]
+
+
 def pareto_cutoff_variants(sorted_variants, total_cases, threshold=0.8):
-    cumulative = 0
-    top_variants = []
-    
-    for variant, count in sorted_variants:
-        cumulative += count
-        top_variants.append((variant, count))
-        if cumulative / total_cases >= threshold:
-            break
-    return top_variants
+    return CoverageIndex(sorted_variants, total_cases).variants(threshold)
@@ -0,0 +1,284 @@
+import os
+import json
+import pickle
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from data_loader import file_fingerprint, default_cache_path, cached_source_fingerprint
+import metrics
+
+PIPELINE_CACHE_DIR = "output/.pipeline_cache"
+
+# Bump to invalidate every cached stage result
+PIPELINE_CACHE_VERSION = 1
+
+
+def _hash_code(code, digest):
+    """Feeds a code object's bytecode, names and constants into digest, recursing into nested code."""
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode("utf-8"))
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            _hash_code(const, digest)
+        elif isinstance(const, frozenset):
+            # Set literals: their repr order depends on the string hash seed
+            digest.update(repr(sorted(map(repr, const))).encode("utf-8"))
+        else:
+            digest.update(repr(const).encode("utf-8"))
+
+
+class Stage:
+    """
+    One step of a Pipeline.
+
+    Parameters:
+        name (str): Unique stage name
+        func (callable): Called as func(*dependency_values, **params)
+        deps (list): Names of the stages whose results are passed in, in order
+        params (dict): Keyword arguments; part of the cache key
+        runtime (dict): Keyword arguments that are not part of the key, for live objects
+            that do not change the result (e.g. a RenderQueue)
+        sources (list): Input files; their content hashes are part of the cache key
+        outputs (list): Files the stage writes; the stage re-runs if any is missing
+        cache (bool): Pickle the result under its key (False: always recompute when needed)
+        resource (str or None): Stages sharing a resource never run at the same time
+            (e.g. "matplotlib", whose pyplot state is not thread-safe)
+        version (str): Bump when the stage's behavior changes in a way the key cannot see,
+            e.g. a helper function it calls (only func's own code is hashed)
+    """
+
+    def __init__(self, name, func, deps=(), params=None, runtime=None, sources=(), outputs=(), cache=True,
+                 resource=None, version=""):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.params = dict(params or {})
+        self.runtime = dict(runtime or {})
+        self.sources = list(sources)
+        self.outputs = list(outputs)
+        self.cache = cache
+        self.resource = resource
+        self.version = version
+
+
+class Pipeline:
+    """
+    Small DAG runner with content-addressed stage caching.
+
+    A stage's key hashes its name, function (code, constants and defaults, not the
+    helpers it calls), parameters, source-file contents and the keys of its
+    dependencies (Merkle style), so changing a parameter or the input log
+    invalidates exactly the stages downstream of it. Stages whose cached result is
+    still valid are skipped, and their dependencies are not even loaded unless another
+    stage needs them. Independent stages run concurrently on a thread pool.
+
+    Parameters:
+        cache_dir (str): Directory for pickled results and the source hash memo
+        max_workers (int): Threads for concurrently runnable stages
+    """
+
+    def __init__(self, cache_dir=PIPELINE_CACHE_DIR, max_workers=4):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.stages = {}
+        self._locks = {}
+        self._source_memo = None
+
+    def add(self, name, func, **kwargs):
+        """Registers a stage (see Stage for the keyword arguments) and returns it."""
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage name: {name}")
+        stage = Stage(name, func, **kwargs)
+        for dep in stage.deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self.stages[name] = stage
+        if stage.resource is not None:
+            self._locks.setdefault(stage.resource, threading.Lock())
+        return stage
+
+    # ---------- Keys ----------
+    def _source_digest(self, path):
+        """SHA-256 of a source file, rehashed only when its size or mtime changes."""
+        if not os.path.exists(path):
+            return self._missing_source_digest(path)
+        memo_path = os.path.join(self.cache_dir, "sources.json")
+        if self._source_memo is None:
+            self._source_memo = {}
+            if os.path.isfile(memo_path):
+                with open(memo_path, encoding="utf-8") as f:
+                    self._source_memo = json.load(f)
+        quick = file_fingerprint(path, with_hash=False)
+        known = self._source_memo.get(os.path.abspath(path))
+        if known and known["size"] == quick["size"] and known["mtime_ns"] == quick["mtime_ns"]:
+            return known["sha256"]
+        fingerprint = file_fingerprint(path)
+        self._source_memo[os.path.abspath(path)] = fingerprint
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(memo_path, "w", encoding="utf-8") as f:
+            json.dump(self._source_memo, f)
+        return fingerprint["sha256"]
+
+    def _missing_source_digest(self, path):
+        """
+        Stands in for a source file that no longer exists. An event log whose columnar
+        cache is still valid (load_event_log then reads the cache) keys on the hash the
+        cache recorded, so the key is the same as while the file was there.
+        """
+        recorded = cached_source_fingerprint(default_cache_path(path))
+        if recorded and recorded.get("sha256"):
+            return recorded["sha256"]
+        return "missing"
+
+    def _func_identity(self, func):
+        """
+        Name plus a hash of the function's bytecode, constants (nested functions included),
+        referenced names and default arguments. Helpers it calls are not followed: a change
+        inside one of them needs a `version=` bump of the stage.
+        """
+        code = getattr(func, "__code__", None)
+        if code is None:
+            body = ""
+        else:
+            digest = hashlib.sha256()
+            _hash_code(code, digest)
+            defaults = (getattr(func, "__defaults__", None), getattr(func, "__kwdefaults__", None))
+            digest.update(json.dumps(defaults, sort_keys=True, default=repr).encode("utf-8"))
+            body = digest.hexdigest()
+        return f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}:{body}"
+
+    def stage_keys(self, names):
+        """Cache key of each named stage and of everything it depends on."""
+        keys = {}
+        for name in self._closure(names):
+            stage = self.stages[name]
+            payload = json.dumps({
+                "version": PIPELINE_CACHE_VERSION,
+                "stage": name,
+                "stage_version": stage.version,
+                "func": self._func_identity(stage.func),
+                "params": stage.params,
+                "sources": {path: self._source_digest(path) for path in stage.sources},
+                "deps": [keys[dep] for dep in stage.deps],
+            }, sort_keys=True, default=repr)
+            keys[name] = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return keys
+
+    def _closure(self, names):
+        """Names plus all their transitive dependencies, in dependency order."""
+        order, seen = [], set()
+        stack = [(name, False) for name in reversed(list(names))]
+        while stack:
+            name, expanded = stack.pop()
+            if expanded:
+                order.append(name)
+                continue
+            if name in seen:
+                continue
+            seen.add(name)
+            stack.append((name, True))
+            stack.extend((dep, False) for dep in reversed(self.stages[name].deps))
+        return order
+
+    # ---------- Cache ----------
+    def _cache_path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name}-{key[:16]}.pkl")
+
+    def _is_fresh(self, stage, key):
+        if not stage.cache:
+            return False
+        return os.path.isfile(self._cache_path(stage.name, key)) and all(
+            os.path.exists(path) for path in stage.outputs)
+
+    def _load(self, stage, key):
+        with open(self._cache_path(stage.name, key), "rb") as f:
+            return pickle.load(f)
+
+    def _store(self, stage, key, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._cache_path(stage.name, key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        # Drop results cached under older keys of the same stage
+        for entry in os.listdir(self.cache_dir):
+            if entry.endswith(".pkl") and entry.rsplit("-", 1)[0] == stage.name \
+                    and entry != os.path.basename(path):
+                os.remove(os.path.join(self.cache_dir, entry))
+
+    # ---------- Run ----------
+    def _plan(self, targets, keys, force=()):
+        """
+        Decides which stages must execute and which cached results must be loaded.
+        A fresh stage is loaded only if a target asks for it or an executing stage needs it.
+        """
+        run, load = set(force), set()
+        wanted = set(targets) | run
+        for name in reversed(self._closure(wanted)):
+            if name not in wanted:
+                continue
+            stage = self.stages[name]
+            if name not in run and self._is_fresh(stage, keys[name]):
+                load.add(name)
+            else:
+                run.add(name)
+                wanted.update(stage.deps)
+        return run, load
+
+    def _execute(self, stage, values):
+        args = [values[dep] for dep in stage.deps]
+        lock = self._locks.get(stage.resource)
+        with metrics.stage(f"pipeline.{stage.name}"):
+            if lock is None:
+                return stage.func(*args, **stage.params, **stage.runtime)
+            with lock:
+                return stage.func(*args, **stage.params, **stage.runtime)
+
+    def run(self, targets=None, force=()):
+        """
+        Runs the targets (default: the final stages) and whatever they need.
+
+        Parameters:
+            targets (list or None): Stage names whose results are wanted
+            force (list): Stage names to recompute even if their cache is valid
+
+        Returns:
+            dict {stage name: result} for the targets
+        """
+        if targets is None:
+            needed = {dep for stage in self.stages.values() for dep in stage.deps}
+            targets = [name for name in self.stages if name not in needed]
+        targets = list(targets)
+        keys = self.stage_keys(targets + list(force))
+        run, load = self._plan(targets, keys, force)
+
+        values = {}
+        for name in load:
+            values[name] = self._load(self.stages[name], keys[name])
+            print(f"[INFO] Stage '{name}' unchanged, using cached result")
+        metrics.count("pipeline_cache_hits", len(load))
+        metrics.count("pipeline_cache_misses", len(run))
+
+        pending = set(run)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while pending or running:
+                ready = [name for name in self._closure(pending)
+                         if name in pending and all(dep in values for dep in self.stages[name].deps)]
+                for name in ready:
+                    pending.discard(name)
+                    print(f"[INFO] Running stage '{name}'")
+                    running[pool.submit(self._execute, self.stages[name], values)] = name
+                if not running:
+                    raise RuntimeError(f"Pipeline stalled with unresolved stages: {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    values[name] = future.result()
+                    if stage.cache:
+                        self._store(stage, keys[name], values[name])
+
+        return {name: values[name] for name in targets}
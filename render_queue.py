@@ -0,0 +1,207 @@
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _run_plot_job(conn, func, args, kwargs):
+    """Plot process entry point: runs the job and sends back None or its exception."""
+    try:
+        func(*args, **kwargs)
+    except BaseException as error:
+        try:
+            conn.send(error)
+        except Exception:
+            conn.send(RuntimeError(repr(error)))
+    else:
+        conn.send(None)
+    finally:
+        conn.close()
+
+
+class RenderQueue:
+    """
+    Non-blocking rendering backend for Graphviz and matplotlib outputs.
+
+    Graphviz jobs write their DOT source next to the output right away and are laid
+    out by `dot`/`sfdp`/... subprocesses on a thread pool (the threads only wait on
+    the subprocess). matplotlib jobs each run in their own process, since pyplot is
+    neither thread-safe nor fast to share. Every output gets a `.sha256` sidecar holding the
+    hash of what produced it; a job whose hash matches an existing output is skipped.
+
+    Parameters:
+        max_workers (int or None): Concurrent Graphviz renders (default: CPU count)
+        plot_workers (int): Concurrent matplotlib jobs
+        timeout (float or None): Seconds before a Graphviz render or plot job is killed
+    """
+
+    def __init__(self, max_workers=None, plot_workers=1, timeout=300):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.plot_workers = plot_workers
+        self.timeout = timeout
+        self.futures = []
+        self._threads = None
+        self._plot_threads = None
+        self._plot_processes = set()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown(wait=exc_info[0] is None)
+
+    # ---------- Skip-if-unchanged ----------
+    @staticmethod
+    def _sidecar(output_path):
+        return output_path + ".sha256"
+
+    def is_current(self, output_path, digest):
+        """True if output_path exists and was produced from the same content hash."""
+        sidecar = self._sidecar(output_path)
+        if not (os.path.isfile(output_path) and os.path.isfile(sidecar)):
+            return False
+        with open(sidecar, encoding="utf-8") as f:
+            return f.read().strip() == digest
+
+    def _mark(self, output_path, digest):
+        with open(self._sidecar(output_path), "w", encoding="utf-8") as f:
+            f.write(digest)
+
+    # ---------- Graphviz ----------
+    def submit_dot(self, source, output_path, format=None, engine="dot"):
+        """
+        Queues a Graphviz render of a DOT source.
+
+        Parameters:
+            source (str): DOT source (e.g. `Digraph.source` or `AGraph.string()`)
+            output_path (str): Image path; its extension is the format unless given
+            format (str or None): Graphviz output format (png, svg, ...)
+            engine (str): Layout program (dot, sfdp, twopi, ...)
+
+        Returns:
+            Future resolving to output_path; it raises subprocess.TimeoutExpired or
+            CalledProcessError if the render fails.
+        """
+        format = format or os.path.splitext(output_path)[1].lstrip(".") or "png"
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        digest = hashlib.sha256(f"{engine}\0{format}\0{source}".encode("utf-8")).hexdigest()
+
+        source_path = os.path.splitext(output_path)[0] + ".gv"
+        with open(source_path, "w", encoding="utf-8") as f:
+            f.write(source)
+        if self.is_current(output_path, digest):
+            print(f"[INFO] Render skipped (unchanged): {output_path}")
+            return _done(output_path)
+
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.max_workers)
+        future = self._threads.submit(self._run_dot, source_path, output_path, format, engine, digest)
+        self.futures.append(future)
+        return future
+
+    def _run_dot(self, source_path, output_path, format, engine, digest):
+        tmp_path = f"{output_path}.tmp"
+        try:
+            # stderr goes to a file, not a pipe, so a timed-out render cannot hang on it
+            with tempfile.TemporaryFile() as stderr:
+                completed = subprocess.run([engine, f"-T{format}", "-o", tmp_path, source_path],
+                                           stdout=subprocess.DEVNULL, stderr=stderr, timeout=self.timeout)
+                if completed.returncode != 0:
+                    stderr.seek(0)
+                    raise subprocess.CalledProcessError(completed.returncode, completed.args,
+                                                        stderr=stderr.read().decode(errors="replace"))
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._mark(output_path, digest)
+        print(f"✅ Rendered {output_path}")
+        return output_path
+
+    # ---------- matplotlib ----------
+    def submit_plot(self, func, *args, output_path, **kwargs):
+        """
+        Queues func(*args, **kwargs) in a fresh plot process; func must be importable
+        (module level) and write output_path. The job is skipped when the pickled
+        arguments are unchanged since output_path was last written.
+
+        Returns:
+            Future resolving to output_path; it raises TimeoutError if the job runs
+            longer than `timeout`, or the job's own exception if it fails.
+        """
+        payload = pickle.dumps((func.__module__, func.__qualname__, args, sorted(kwargs.items())))
+        digest = hashlib.sha256(payload).hexdigest()
+        if self.is_current(output_path, digest):
+            print(f"[INFO] Render skipped (unchanged): {output_path}")
+            return _done(output_path)
+
+        if self._plot_threads is None:
+            self._plot_threads = ThreadPoolExecutor(max_workers=self.plot_workers)
+        future = self._plot_threads.submit(self._run_plot, func, args, kwargs, output_path, digest)
+        self.futures.append(future)
+        return future
+
+    def _run_plot(self, func, args, kwargs, output_path, digest):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_run_plot_job, args=(sender, func, args, kwargs), daemon=True)
+        process.start()
+        sender.close()
+        with self._lock:
+            self._plot_processes.add(process)
+        try:
+            if not receiver.poll(self.timeout):
+                raise TimeoutError(f"Plot job for {output_path} exceeded {self.timeout}s")
+            try:
+                error = receiver.recv()
+            except EOFError:
+                process.join()
+                error = RuntimeError(f"Plot process for {output_path} exited with code {process.exitcode}")
+        finally:
+            if process.is_alive():
+                process.kill()
+            process.join()
+            receiver.close()
+            with self._lock:
+                self._plot_processes.discard(process)
+        if error is not None:
+            raise error
+        self._mark(output_path, digest)
+        return output_path
+
+    # ---------- Lifecycle ----------
+    def wait(self, timeout=None):
+        """
+        Blocks until every queued job has finished.
+
+        Returns:
+            (done, not_done) sets of futures; failed jobs are in `done` with their exception
+        """
+        done, not_done = wait_futures(self.futures, timeout=timeout)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                print(f"❌ Render failed: {error}")
+        return done, not_done
+
+    def shutdown(self, wait=True):
+        """Stops the pools; without wait, queued jobs are cancelled and running plot processes killed."""
+        for pool in (self._threads, self._plot_threads):
+            if pool is not None:
+                pool.shutdown(wait=wait, cancel_futures=not wait)
+        if not wait:
+            with self._lock:
+                for process in self._plot_processes:
+                    process.kill()
+        self._threads = self._plot_threads = None
@@ -0,0 +1,94 @@
+import numpy as np
+
+LAYOUT_ENGINES = ("dot", "sfdp", "twopi")
+
+
+def node_depths(parent):
+    """
+    Depth of every node of a parent-array tree (root parent = -1), computed one
+    vectorized step per level.
+    """
+    parent = np.asarray(parent, dtype=np.int64)
+    depth = np.zeros(len(parent), dtype=np.int64)
+    frontier = parent >= 0
+    ancestor = np.where(frontier, parent, -1)
+    while frontier.any():
+        depth[frontier] += 1
+        ancestor = np.where(frontier, parent[np.maximum(ancestor, 0)], -1)
+        frontier = ancestor >= 0
+    return depth
+
+
+def subtree_totals(parent, values):
+    """Sum of `values` over each node's subtree (itself included), accumulated bottom-up per level."""
+    parent = np.asarray(parent, dtype=np.int64)
+    totals = np.asarray(values, dtype=np.float64).copy()
+    depth = node_depths(parent)
+    for d in range(int(depth.max()) if len(depth) else 0, 0, -1):
+        level = np.flatnonzero(depth == d)
+        np.add.at(totals, parent[level], totals[level])
+    return totals
+
+
+def prune_for_display(parent, weight, max_nodes=None, min_share=0.0):
+    """
+    Frequency-based level of detail for tree rendering.
+
+    Keeps the heaviest nodes (at most `max_nodes`, each carrying at least `min_share`
+    of the root's weight) and folds everything else into one aggregate per kept parent.
+    `weight` must not grow from parent to child (e.g. case frequency of a trie prefix
+    or subtree totals), so the kept nodes always form a connected tree.
+
+    Parameters:
+        parent (array): Parent of each node, -1 for the root; parents precede children
+        weight (array): Subtree weight of each node
+        max_nodes (int or None): Node budget for the rendered tree
+        min_share (float): Minimum share of the root weight for a node to be kept
+
+    Returns:
+        - visible: Sorted array of kept node ids
+        - collapsed: dict {kept node: (number of hidden nodes below it, hidden weight)}
+    """
+    parent = np.asarray(parent, dtype=np.int64)
+    weight = np.asarray(weight, dtype=np.float64)
+    n = len(parent)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), {}
+    if max_nodes is None and min_share <= 0:
+        return np.arange(n), {}
+
+    keep = weight >= min_share * weight[0]
+    keep[0] = True
+    if max_nodes is not None and keep.sum() > max_nodes:
+        # Heaviest first; ties go to the lower id, so a parent precedes its children
+        candidates = np.flatnonzero(keep)
+        order = candidates[np.lexsort((candidates, -weight[candidates]))]
+        keep[:] = False
+        keep[order[:max(max_nodes, 1)]] = True
+
+    sizes = subtree_totals(parent, np.ones(n))
+    hidden_roots = np.flatnonzero(~keep & (parent >= 0))
+    hidden_roots = hidden_roots[keep[parent[hidden_roots]]]
+    owners = parent[hidden_roots]
+    hidden_nodes = np.bincount(owners, weights=sizes[hidden_roots], minlength=n)
+    hidden_weight = np.bincount(owners, weights=weight[hidden_roots], minlength=n)
+    collapsed = {int(node): (int(hidden_nodes[node]), hidden_weight[node])
+                 for node in np.unique(owners).tolist()}
+    return np.flatnonzero(keep), collapsed
+
+
+def apply_layout_engine(dot, engine, root_id=None):
+    """
+    Sets a graphviz Digraph's layout engine plus the attributes that keep large
+    graphs readable with it (sfdp: force-directed, twopi: radial around the root).
+    """
+    if engine not in LAYOUT_ENGINES:
+        raise ValueError(f"Unknown layout engine: {engine} (expected one of {LAYOUT_ENGINES})")
+    dot.engine = engine
+    if engine == "sfdp":
+        dot.attr('graph', overlap='prism', splines='false', outputorder='edgesfirst')
+    elif engine == "twopi":
+        dot.attr('graph', overlap='false', splines='false', ranksep='1.5')
+        if root_id is not None:
+            dot.attr('graph', root=str(root_id))
+    return dot
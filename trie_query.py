@@ -0,0 +1,204 @@
+import heapq
+
+import numpy as np
+
+from variant_extractor import EncodedVariants
+from variant_tree_builder import ArrayTrie, build_trie_from_variants
+
+
+class TrieQuery:
+    """
+    Runtime query layer over an ArrayTrie for monitoring running cases.
+
+    Single-case lookups walk the prefix once (one binary search per activity);
+    the *_batch methods advance thousands of prefixes together, one vectorized
+    step per prefix position.
+
+    Parameters:
+        trie: ArrayTrie, EncodedVariants or a list of (variant_tuple, frequency)
+    """
+
+    def __init__(self, trie):
+        if not isinstance(trie, ArrayTrie):
+            if not isinstance(trie, EncodedVariants):
+                trie = EncodedVariants.from_sorted_variants(trie)
+            trie = build_trie_from_variants(trie)
+        self.trie = trie
+        self.total_cases = int(trie.frequency[0]) if len(trie) else 0
+        self._end_within = {}
+        self._top_children = {}
+
+    # ---------- Single prefix ----------
+    def lookup(self, prefix):
+        """Node id of an activity-name prefix, or -1 if no case started that way."""
+        return self.trie.find(prefix)
+
+    def coverage(self, prefix):
+        """
+        Returns (number of cases in the prefix's subtree, share of all cases).
+        """
+        node = self.lookup(prefix)
+        if node < 0 or self.total_cases == 0:
+            return 0, 0.0
+        cases = int(self.trie.frequency[node])
+        return cases, cases / self.total_cases
+
+    def next_activity_distribution(self, prefix):
+        """
+        Conditional distribution of the next activity given the prefix.
+
+        Returns:
+            dict {activity: probability}, including "END" for cases that stop here,
+            sorted by probability desc; empty if the prefix is unknown.
+        """
+        trie = self.trie
+        node = self.lookup(prefix)
+        if node < 0:
+            return {}
+        total = int(trie.frequency[node])
+        dist = {trie.name(child): int(trie.frequency[child]) / total for child in trie.children(node)}
+        if trie.end_count[node]:
+            dist["END"] = int(trie.end_count[node]) / total
+        return dict(sorted(dist.items(), key=lambda item: -item[1]))
+
+    def top_k_next(self, prefix, k=3):
+        """The k most likely next activities as a list of (activity, probability)."""
+        return list(self.next_activity_distribution(prefix).items())[:k]
+
+    def end_probability(self, prefix, n_steps):
+        """Probability that a case with this prefix reaches END within n_steps more activities."""
+        node = self.lookup(prefix)
+        if node < 0:
+            return 0.0
+        return float(self._end_within_steps(n_steps)[node] / self.trie.frequency[node])
+
+    def top_k_completions(self, prefix, k=5):
+        """
+        The k most frequent complete variants extending the prefix.
+
+        Best-first search: a subtree's frequency bounds every completion inside it,
+        so only the nodes needed to certify the top k are expanded.
+
+        Returns:
+            list of (remaining_activities_tuple, cases, probability given the prefix)
+        """
+        trie = self.trie
+        node = self.lookup(prefix)
+        if node < 0:
+            return []
+        total = int(trie.frequency[node])
+        # Entries: (-priority, tie, node, is_terminal)
+        heap = [(-int(trie.frequency[node]), node, node, False)]
+        results = []
+        while heap and len(results) < k:
+            priority, _, current, terminal = heapq.heappop(heap)
+            if terminal:
+                path = trie.path(current)[len(prefix):]
+                results.append((path, -priority, -priority / total))
+                continue
+            if trie.end_count[current]:
+                heapq.heappush(heap, (-int(trie.end_count[current]), current, current, True))
+            for child in trie.children(current):
+                heapq.heappush(heap, (-int(trie.frequency[child]), int(child), int(child), False))
+        return results
+
+    # ---------- Batch ----------
+    def _encode_batch(self, prefixes):
+        """Pads activity-name (or code) prefixes into a code matrix; -2 marks padding."""
+        lengths = np.fromiter((len(p) for p in prefixes), dtype=np.int64, count=len(prefixes))
+        width = int(lengths.max()) if len(prefixes) else 0
+        codes = np.full((len(prefixes), width), -2, dtype=np.int64)
+        index = self.trie.activity_index
+        for i, prefix in enumerate(prefixes):
+            if len(prefix):
+                if isinstance(prefix[0], str):
+                    codes[i, :len(prefix)] = [index.get(step, -1) for step in prefix]
+                else:
+                    codes[i, :len(prefix)] = prefix
+        return codes
+
+    def lookup_batch(self, prefixes):
+        """
+        Node ids for many prefixes at once (-1 where the prefix is unknown).
+
+        Parameters:
+            prefixes: Sequence of activity-name tuples or activity-code arrays
+        """
+        trie = self.trie
+        codes = self._encode_batch(prefixes)
+        nodes = np.zeros(len(codes), dtype=np.int64)
+        edge_keys = trie._edge_keys
+        for j in range(codes.shape[1]):
+            step = codes[:, j]
+            moving = (step != -2) & (nodes >= 0)
+            keys = nodes * trie._width + step
+            pos = np.searchsorted(edge_keys, keys)
+            found = pos < len(edge_keys)
+            found[found] = edge_keys[pos[found]] == keys[found]
+            found &= step >= 0
+            nodes = np.where(moving, np.where(found, pos + 1, -1), nodes)
+        return nodes
+
+    def coverage_batch(self, prefixes):
+        """Cases under each prefix and their share of all cases, as two arrays."""
+        nodes = self.lookup_batch(prefixes)
+        cases = np.where(nodes >= 0, self.trie.frequency[np.maximum(nodes, 0)], 0)
+        share = cases / self.total_cases if self.total_cases else np.zeros(len(cases))
+        return cases, share
+
+    def next_activity_batch(self, prefixes, k=3):
+        """
+        Top-k next activities for many prefixes.
+
+        Returns:
+            - codes: (n, k) activity codes, -1 where fewer than k continuations exist
+            - probs: (n, k) conditional probabilities
+            - end_probs: (n,) probability that the case stops at the prefix
+        """
+        trie = self.trie
+        nodes = self.lookup_batch(prefixes)
+        known = nodes >= 0
+        safe = np.maximum(nodes, 0)
+        top = self._top_k_children(k)[safe]
+        freq = trie.frequency[safe].astype(np.float64)
+
+        valid = (top >= 0) & known[:, None]
+        codes = np.where(valid, trie.activity[np.maximum(top, 0)], -1)
+        probs = np.where(valid, trie.frequency[np.maximum(top, 0)] / freq[:, None], 0.0)
+        end_probs = np.where(known, trie.end_count[safe] / freq, 0.0)
+        return codes, probs, end_probs
+
+    def end_probability_batch(self, prefixes, n_steps):
+        """Probability of reaching END within n_steps for each prefix (0 if unknown)."""
+        nodes = self.lookup_batch(prefixes)
+        safe = np.maximum(nodes, 0)
+        probs = self._end_within_steps(n_steps)[safe] / self.trie.frequency[safe]
+        return np.where(nodes >= 0, probs, 0.0)
+
+    # ---------- Precomputed tables ----------
+    def _end_within_steps(self, n_steps):
+        """Cases ending within n_steps below each node (itself included), cached per n."""
+        table = self._end_within.get(n_steps)
+        if table is None:
+            trie = self.trie
+            table = trie.end_count.astype(np.float64)
+            for _ in range(n_steps):
+                below = np.bincount(trie.parent[1:], weights=table[1:], minlength=len(trie))
+                table = trie.end_count + below
+            self._end_within[n_steps] = table
+        return table
+
+    def _top_k_children(self, k):
+        """(n_nodes, k) matrix of each node's most frequent children, cached per k."""
+        table = self._top_children.get(k)
+        if table is None:
+            trie = self.trie
+            child_ids = np.arange(1, len(trie))
+            order = np.lexsort((-trie.frequency[child_ids], trie.parent[child_ids]))
+            ranked = child_ids[order]
+            rank = np.arange(len(ranked)) - (trie.child_offsets[trie.parent[ranked]] - 1)
+            table = np.full((len(trie), k), -1, dtype=np.int64)
+            keep = rank < k
+            table[trie.parent[ranked[keep]], rank[keep]] = ranked[keep]
+            self._top_children[k] = table
+        return table
@@ -1,47 +1,163 @@
 import networkx as nx
-import matplotlib.pyplot as plt
-from collections import defaultdict
+import numpy as np
+from scipy import sparse
 
+from edge_durations import format_duration
+from variant_extractor import EncodedVariants, encode_event_log
+import metrics
+
+def _dfg_edges(encoded):
+    """
+    Computes all directly-follows pair counts of int-encoded variants in one pass.
+
+    Every variant is framed as START, codes..., END (START = n_activities,
+    END = n_activities + 1) so the pairs are simply consecutive elements of one flat
+    array; pair keys are counted with a single np.unique / np.bincount.
+
+    Returns:
+        rows, cols, weights arrays in order of first appearance, and the node labels
+    """
+    n_act = len(encoded.vocabulary)
+    start_code, end_code = n_act, n_act + 1
+    labels = list(encoded.vocabulary) + ["START", "END"]
+    n_var = len(encoded)
+    if n_var == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, labels
+
+    lengths = encoded.lengths
+    framed_offsets = encoded.offsets + 2 * np.arange(n_var + 1)
+    framed = np.empty(framed_offsets[-1], dtype=np.int64)
+    framed[framed_offsets[:-1]] = start_code
+    framed[framed_offsets[1:] - 1] = end_code
+    inner = np.ones(len(framed), dtype=bool)
+    inner[framed_offsets[:-1]] = False
+    inner[framed_offsets[1:] - 1] = False
+    framed[inner] = encoded.codes
+
+    # A pair is valid unless it straddles two variants (END followed by START)
+    prev, nxt = framed[:-1], framed[1:]
+    valid = np.ones(len(prev), dtype=bool)
+    valid[framed_offsets[1:-1] - 1] = False
+    pair_weights = np.repeat(encoded.counts, lengths + 2)[:-1][valid]
+
+    width = n_act + 2
+    keys = prev[valid] * width + nxt[valid]
+    unique_keys, first_seen, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    weights = np.bincount(inverse.reshape(-1), weights=pair_weights,
+                          minlength=len(unique_keys)).astype(np.int64)
+    order = np.argsort(first_seen, kind="stable")
+    unique_keys, weights = unique_keys[order], weights[order]
+    return unique_keys // width, unique_keys % width, weights, labels
+
+
+def compute_dfg_matrix(variants_subset):
+    """
+    Directly-follows counts as a sparse matrix.
+
+    Parameters:
+        variants_subset: List of (variant, count) tuples, or EncodedVariants
+
+    Returns:
+        - matrix: scipy.sparse CSR matrix, matrix[i, j] = weight of labels[i] -> labels[j]
+        - labels: activity names followed by "START" and "END"
+    """
+    if not isinstance(variants_subset, EncodedVariants):
+        variants_subset = EncodedVariants.from_sorted_variants(variants_subset)
+    rows, cols, weights, labels = _dfg_edges(variants_subset)
+    matrix = sparse.coo_matrix((weights, (rows, cols)), shape=(len(labels), len(labels))).tocsr()
+    return matrix, labels
+
+
+def _graph_from_edges(encoded, rows, cols, weights, labels):
+    """Builds the DiGraph once, in the node/edge order the incremental loop used to produce."""
+    G = nx.DiGraph()
+    G.add_node("START")
+    G.add_node("END")
+    if len(encoded.codes):
+        codes, first_seen = np.unique(encoded.codes, return_index=True)
+        G.add_nodes_from(labels[c] for c in codes[np.argsort(first_seen, kind="stable")].tolist())
+    G.add_edges_from(
+        (labels[u], labels[v], {"weight": w})
+        for u, v, w in zip(rows.tolist(), cols.tolist(), weights.tolist())
+    )
+    return G
+
+
+def _describe_graph(G, *args, **kwargs):
+    return {"nodes": G.number_of_nodes(), "edges": G.number_of_edges()}
+
+
+@metrics.timed("build_process_graph", describe=_describe_graph)
 def build_process_graph(variants_subset, top_n=None):
     """
     Builds a compressed graph (trie-inspired) from a subset of variants.
     Each node is an activity; repeated activities across variants are not duplicated.
 
     Parameters:
-        variants_subset (list): List of (variant, count) tuples
+        variants_subset (list): List of (variant, count) tuples, or EncodedVariants
         top_n (int or None): If given, use only the top_n variants
     """
+    encoded = variants_subset if isinstance(variants_subset, EncodedVariants) else None
     if top_n is not None:
-        variants_subset = variants_subset[:top_n]
+        if encoded is not None:
+            encoded = encoded.subset(top_n)
+        else:
+            variants_subset = variants_subset[:top_n]
         print(f"📦 Building process graph from top {top_n} variants.")
     else:
         print(f"📦 Building process graph from full variant set ({len(variants_subset)} variants).")
 
-    G = nx.DiGraph()
-    G.add_node("START")
-    G.add_node("END")
+    if encoded is None:
+        encoded = EncodedVariants.from_sorted_variants(variants_subset)
+    metrics.annotate(variants=len(encoded))
+    rows, cols, weights, labels = _dfg_edges(encoded)
+    return _graph_from_edges(encoded, rows, cols, weights, labels)
 
-    edge_weights = defaultdict(int)
 
-    for variant, count in variants_subset:
-        prev_node = "START"
+@metrics.timed("build_process_graph_from_log", describe=_describe_graph)
+def build_process_graph_from_log(df):
+    """
+    Builds the same process graph directly from a raw event log DataFrame,
+    counting every case once without extracting variants first.
+    """
+    encoded_log = encode_event_log(df)
+    print(f"📦 Building process graph from event log ({len(encoded_log)} cases).")
+    per_case = EncodedVariants(encoded_log.vocabulary, encoded_log.offsets, encoded_log.activities,
+                               np.ones(len(encoded_log), dtype=np.int64))
+    rows, cols, weights, labels = _dfg_edges(per_case)
+    return _graph_from_edges(per_case, rows, cols, weights, labels)
 
-        for step in variant:
-            if not G.has_node(step):
-                G.add_node(step)
 
-            edge_weights[(prev_node, step)] += count
-            G.add_edge(prev_node, step, weight=edge_weights[(prev_node, step)])
+def _edge_label(value, attribute):
+    if attribute.startswith("duration_") and attribute != "duration_count":
+        return format_duration(value)
+    return str(value)
 
-            prev_node = step
 
-        edge_weights[(prev_node, "END")] += count
-        G.add_edge(prev_node, "END", weight=edge_weights[(prev_node, "END")])
+def _edge_color(value, low, high):
+    # Gray for the fastest edges through to red for the slowest
+    share = 0.0 if high <= low else (value - low) / (high - low)
+    red = int(160 + 95 * share)
+    other = int(160 * (1 - share))
+    return f"#{red:02x}{other:02x}{other:02x}"
 
-    return G
 
+@metrics.timed("draw_process_graph", describe=lambda result, G, *args, **kwargs: _describe_graph(G))
+def draw_process_graph(G, save_path="output/variant_dag.png", edge_label="weight", color_by=None,
+                       render_queue=None):
+    """
+    Renders the process graph with Graphviz.
 
-def draw_process_graph(G, save_path="output/variant_dag.png"):
+    Parameters:
+        G: DiGraph from build_process_graph
+        save_path: Output image path
+        edge_label: Edge attribute shown as the label, e.g. "weight" or
+            "duration_mean" / "duration_p95" after annotate_process_graph
+        color_by: Optional edge attribute used to color edges from gray (low) to red (high)
+        render_queue: Optional RenderQueue; the layout then runs in the background and
+            its future is returned
+    """
     try:
         import pygraphviz
         from networkx.drawing.nx_agraph import to_agraph
@@ -76,11 +192,19 @@ def draw_process_graph(G, save_path="output/variant_dag.png"):
         arrowsize="0.8"
     )
 
-    # Add edge labels (frequency)
-    for u, v in G.edges():
-        weight = G[u][v]['weight']
+    # Add edge labels (frequency or the chosen statistic)
+    colored = [d[color_by] for _, _, d in G.edges(data=True) if color_by and d.get(color_by) is not None]
+    low, high = (min(colored), max(colored)) if colored else (0, 0)
+    for u, v, data in G.edges(data=True):
         edge = A.get_edge(u, v)
-        edge.attr['label'] = str(weight)
+        value = data.get(edge_label)
+        edge.attr['label'] = _edge_label(value, edge_label) if value is not None else ""
+        if color_by and data.get(color_by) is not None:
+            edge.attr['color'] = _edge_color(data[color_by], low, high)
+            edge.attr['penwidth'] = "1.5"
+
+    if render_queue is not None:
+        return render_queue.submit_dot(A.string(), save_path, engine="dot")
 
     # Draw graph using Graphviz's 'dot' layout
     A.layout(prog="dot")
@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from variant_extractor import EncodedVariants
+from variant_export import PATH_SEPARATOR, columnar_path, load_variants
+from variant_similarity import levenshtein_pairs
+from variant_tree_checker import parent_positions, read_hierarchy_columns
+import metrics
+
+EDGE_COLUMNS = ["Parent", "Child", "Added Events", "Removed Events", "Add Weight", "Remove Weight",
+                "Edge Weight", "Common Prefix", "Common Suffix", "Edit Distance"]
+
+
+def load_hierarchy_variants(source):
+    """
+    Loads a variant hierarchy as int-encoded variants plus its id columns.
+
+    Parameters:
+        source: `nodes` (or (nodes, tree)) of build_data_driven_tree, a columnar export
+            directory, or a hierarchy CSV (its columnar export is used when present)
+
+    Returns:
+        - encoded: EncodedVariants, one row per node, counts = node frequency
+        - ids, parents: node ids and parent ids (-1 for the root)
+    """
+    if isinstance(source, tuple):
+        source = source[0]
+    if isinstance(source, list):
+        encoded = EncodedVariants.from_sorted_variants([(node["variant"], node["freq"]) for node in source])
+        ids, _, _, parents = read_hierarchy_columns(source)
+        return encoded, ids, parents
+    if not os.path.isdir(source) and os.path.isdir(columnar_path(source)):
+        source = columnar_path(source)
+    if os.path.isdir(source):
+        encoded, columns = load_variants(source, with_columns=True)
+        return encoded, np.asarray(columns["id"]), np.asarray(columns["parent"])
+
+    df = pd.read_csv(source, usecols=["Variant ID", "Frequency", "Parent ID", "Event Path"],
+                     dtype={"Parent ID": str}, keep_default_na=False)
+    encoded = EncodedVariants.from_sorted_variants(
+        list(zip((tuple(path.split(PATH_SEPARATOR)) if path else () for path in df["Event Path"]),
+                 df["Frequency"].tolist())))
+    parents = pd.to_numeric(df["Parent ID"].where(df["Parent ID"] != "ROOT"), errors="raise")
+    return encoded, df["Variant ID"].to_numpy(np.int64), parents.fillna(-1).to_numpy(np.int64)
+
+
+def activity_count_matrix(encoded):
+    """Sparse (variants × activities) matrix of how often each activity occurs in each variant."""
+    rows = np.repeat(np.arange(len(encoded)), encoded.lengths)
+    shape = (len(encoded), max(len(encoded.vocabulary), 1))
+    return sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, encoded.codes)), shape=shape)
+
+
+def event_weight_vector(encoded, counts=None, frequency_weighted=True, normalize="sum"):
+    """
+    Weight of every activity code.
+
+    Parameters:
+        counts: activity_count_matrix(encoded), if already computed
+        frequency_weighted (bool): Weight each variant by its number of cases
+        normalize (str or None): "sum" (shares of all events), "max" (most common = 1) or None
+    """
+    counts = activity_count_matrix(encoded) if counts is None else counts
+    per_variant = encoded.counts if frequency_weighted else np.ones(len(encoded), dtype=np.int64)
+    weights = np.asarray(counts.T @ per_variant, dtype=np.float64).reshape(-1)
+    if normalize == "sum" and weights.sum() > 0:
+        weights /= weights.sum()
+    elif normalize == "max" and weights.max(initial=0) > 0:
+        weights /= weights.max()
+    return weights
+
+
+def event_weights(source, frequency_weighted=True, normalize="sum"):
+    """
+    Global event weights of a hierarchy as {activity: weight}, heaviest first.
+
+    The notebook's first table is frequency_weighted=True, normalize="max"; the weights
+    behind its edge table are frequency_weighted=False, normalize="sum".
+    """
+    encoded = source if isinstance(source, EncodedVariants) else load_hierarchy_variants(source)[0]
+    weights = event_weight_vector(encoded, frequency_weighted=frequency_weighted, normalize=normalize)
+    order = np.argsort(-weights, kind="stable")
+    return {encoded.vocabulary[code]: float(weights[code]) for code in order.tolist() if weights[code] > 0}
+
+
+def common_affix_lengths(encoded, a, b, suffix=False):
+    """
+    Length of the common prefix (or suffix) of variants a[i] and b[i] for every pair,
+    advancing all still-matching pairs one position per vectorized step.
+    """
+    a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+    lengths, offsets, codes = encoded.lengths, encoded.offsets, encoded.codes
+    limit = np.minimum(lengths[a], lengths[b])
+    if suffix:
+        base_a, base_b, step = offsets[a + 1] - 1, offsets[b + 1] - 1, -1
+    else:
+        base_a, base_b, step = offsets[a], offsets[b], 1
+    result = np.zeros(len(a), dtype=np.int64)
+    active = np.arange(len(a))
+    j = 0
+    while len(active):
+        active = active[limit[active] > j]
+        same = codes[base_a[active] + step * j] == codes[base_b[active] + step * j]
+        active = active[same]
+        result[active] += 1
+        j += 1
+    return result
+
+
+def pair_edit_distances(encoded, a, b):
+    """Edit distance of every pair (a[i], b[i]) with the pairwise batched Myers kernel."""
+    return levenshtein_pairs(encoded.codes, encoded.offsets, a, b)
+
+
+@metrics.timed("variant_edge_diffs", describe=lambda result, *args, **kwargs: {"edges": len(result)})
+def hierarchy_edge_diffs(source, weights=None, frequency_weighted=True, normalize="sum", ordered=True,
+                         sort=True):
+    """
+    Parent → child differences of every edge in a variant hierarchy, all at once.
+
+    Multiset diffs are one sparse subtraction of the children's and parents' rows of the
+    activity-count matrix; add/remove weights are two sparse mat-vec products.
+
+    Parameters:
+        source: see load_hierarchy_variants
+        weights (dict or None): {activity: weight}; event_weights(...) of the hierarchy by default
+        frequency_weighted, normalize: Passed to event_weight_vector when weights is None
+        ordered (bool): Also compute common prefix/suffix lengths and the edit distance
+        sort (bool): Order rows by Edge Weight desc, as in the notebook
+
+    Returns:
+        DataFrame with EDGE_COLUMNS (the ordered columns only when ordered=True)
+    """
+    encoded, ids, parents = load_hierarchy_variants(source)
+    counts = activity_count_matrix(encoded)
+    if weights is None:
+        w = event_weight_vector(encoded, counts, frequency_weighted=frequency_weighted, normalize=normalize)
+    else:
+        w = np.array([weights.get(a, 0.0) for a in encoded.vocabulary] or [0.0], dtype=np.float64)
+
+    parent_pos = parent_positions(ids, parents)
+    child = np.flatnonzero(parent_pos >= 0)
+    parent = parent_pos[child]
+    diff = counts[child] - counts[parent]
+    added = diff.maximum(0).tocsr()
+    removed = (-diff).maximum(0).tocsr()
+    add_weight = added @ w
+    remove_weight = removed @ w
+
+    names = np.asarray(encoded.vocabulary + [""], dtype=object)
+
+    def event_lists(matrix):
+        matrix.eliminate_zeros()
+        return [part.tolist() for part in np.split(names[matrix.indices], matrix.indptr[1:-1])]
+
+    result = pd.DataFrame({
+        "Parent": ids[parent],
+        "Child": ids[child],
+        "Added Events": event_lists(added) if len(child) else [],
+        "Removed Events": event_lists(removed) if len(child) else [],
+        "Add Weight": add_weight,
+        "Remove Weight": remove_weight,
+        "Edge Weight": add_weight - remove_weight,
+    })
+    if ordered:
+        result["Common Prefix"] = common_affix_lengths(encoded, parent, child)
+        result["Common Suffix"] = common_affix_lengths(encoded, parent, child, suffix=True)
+        result["Edit Distance"] = pair_edit_distances(encoded, parent, child)
+    if sort:
+        result = result.sort_values(by="Edge Weight", ascending=False, kind="stable").reset_index(drop=True)
+    return result
@@ -0,0 +1,120 @@
+import os
+import csv
+import json
+import shutil
+
+import numpy as np
+
+from variant_extractor import EncodedVariants
+
+# Bump whenever the on-disk layout written by export_variants changes
+VARIANT_EXPORT_VERSION = 1
+
+# Rows per csv.writer.writerows call
+CSV_BATCH_SIZE = 50_000
+
+PATH_SEPARATOR = " → "
+
+
+def columnar_path(csv_path):
+    """Directory of the columnar export that accompanies a CSV (x.csv -> x.variants)."""
+    return os.path.splitext(csv_path)[0] + ".variants"
+
+
+def _as_encoded(variants):
+    if isinstance(variants, EncodedVariants):
+        return variants
+    return EncodedVariants.from_sorted_variants(variants)
+
+
+def export_variants(variants, export_path, columns=None):
+    """
+    Writes variants as a columnar directory: the activity sequences as an
+    offsets + values list column (int codes), the activity dictionary as JSON, the
+    counts and any extra per-variant columns as .npy files that reload memory-mapped.
+
+    Parameters:
+        variants: EncodedVariants or list of (variant_tuple, frequency)
+        export_path (str): Target directory (replaced atomically)
+        columns (dict or None): Extra per-variant numeric columns {name: array}
+    """
+    encoded = _as_encoded(variants)
+    tmp_path = export_path.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, "offsets.npy"), encoded.offsets)
+    np.save(os.path.join(tmp_path, "codes.npy"), encoded.codes)
+    np.save(os.path.join(tmp_path, "counts.npy"), encoded.counts)
+    extra = []
+    for name, values in (columns or {}).items():
+        values = np.asarray(values)
+        if len(values) != len(encoded):
+            raise ValueError(f"Column '{name}' has {len(values)} values for {len(encoded)} variants")
+        np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+        extra.append(name)
+
+    meta = {
+        "format": "variant-export",
+        "version": VARIANT_EXPORT_VERSION,
+        "variants": len(encoded),
+        "vocabulary": encoded.vocabulary,
+        "columns": extra,
+    }
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    shutil.rmtree(export_path, ignore_errors=True)
+    os.replace(tmp_path, export_path)
+    return encoded
+
+
+def load_variants(export_path, with_columns=False):
+    """
+    Reloads an export written by `export_variants` without any string parsing.
+
+    Returns:
+        EncodedVariants (memory-mapped arrays), plus a dict of the extra columns
+        when with_columns is True
+    """
+    with open(os.path.join(export_path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != "variant-export" or meta.get("version") != VARIANT_EXPORT_VERSION:
+        raise ValueError(f"No compatible variant export at {export_path}")
+
+    def column(name):
+        return np.load(os.path.join(export_path, f"{name}.npy"), mmap_mode="r")
+
+    encoded = EncodedVariants(meta["vocabulary"], column("offsets"), column("codes"), column("counts"))
+    if with_columns:
+        return encoded, {name: column(name) for name in meta["columns"]}
+    return encoded
+
+
+def variant_path_strings(encoded, start=0, stop=None):
+    """'A → B → C' strings of variants start..stop, sliced from one decoded list."""
+    stop = len(encoded) if stop is None else stop
+    offsets = encoded.offsets[start:stop + 1].tolist()
+    vocab = encoded.vocabulary
+    names = [vocab[code] for code in encoded.codes[offsets[0]:offsets[-1]].tolist()]
+    base = offsets[0]
+    return [PATH_SEPARATOR.join(names[a - base:b - base]) for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def write_variant_csv(csv_path, header, encoded, build_rows, batch_size=CSV_BATCH_SIZE):
+    """
+    Writes a CSV with one row per variant in batches of `batch_size` rows.
+
+    Parameters:
+        header (list): Column names
+        encoded (EncodedVariants): The variants, in row order
+        build_rows (callable): build_rows(start, stop, paths) -> list of rows for
+            variants start..stop, given their path strings
+    """
+    os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for start in range(0, len(encoded), batch_size):
+            stop = min(start + batch_size, len(encoded))
+            writer.writerows(build_rows(start, stop, variant_path_strings(encoded, start, stop)))
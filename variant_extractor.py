@@ -1,23 +1,454 @@
-from collections import Counter
+import os
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_variants(df):
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Multiplier for the per-case polynomial hash (odd 64-bit constant, arithmetic wraps mod 2**64)
+HASH_BASE = np.uint64(0x9E3779B97F4A7C15)
+LENGTH_MIX = np.uint64(0xC2B2AE3D27D4EB4F)
+
+
+class _MissingActivity(float):
+    """NaN that unpickles as the same object, so variant tuples holding it stay equal."""
+
+    def __reduce__(self):
+        return "MISSING_ACTIVITY"
+
+
+# A missing activity gets its own code and stays NaN in variant tuples, as with groupby
+MISSING_ACTIVITY = _MissingActivity("nan")
+
+
+class EncodedLog:
+    """
+    Event log in compact per-case form: events sorted by (case, timestamp) with
+    activities as small integer codes.
+
+    Attributes:
+        case_ids (ndarray): Case id of each case, in sorted order
+        vocabulary (list): Activity name for each activity code
+        offsets (ndarray): int64, events of case i are at offsets[i]:offsets[i + 1]
+        activities (ndarray): int32 activity code of every event
+        timestamps (ndarray): int64 nanoseconds of every event
+    """
+
+    def __init__(self, case_ids, vocabulary, offsets, activities, timestamps):
+        self.case_ids = case_ids
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.activities = activities
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+
+class EncodedVariants:
+    """
+    Compact int-encoded variant set in `sorted_variants` order.
+
+    Attributes:
+        vocabulary (list): Activity name for each activity code
+        offsets (ndarray): int64, variant i is codes[offsets[i]:offsets[i + 1]]
+        codes (ndarray): int32 activity codes of all variants, concatenated
+        counts (ndarray): int64 number of cases per variant
+    """
+
+    def __init__(self, vocabulary, offsets, codes, counts):
+        self.vocabulary = list(vocabulary)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def activity_index(self):
+        return {activity: code for code, activity in enumerate(self.vocabulary)}
+
+    def sequence(self, i):
+        return self.codes[self.offsets[i]:self.offsets[i + 1]]
+
+    def decode(self, i):
+        vocab = self.vocabulary
+        return tuple(vocab[c] for c in self.sequence(i).tolist())
+
+    def to_sorted_variants(self):
+        return [(self.decode(i), int(self.counts[i])) for i in range(len(self))]
+
+    def subset(self, n):
+        """Returns the first n variants (e.g. the Pareto set) sharing the same vocabulary."""
+        n = min(n, len(self))
+        end = self.offsets[n]
+        return EncodedVariants(self.vocabulary, self.offsets[:n + 1], self.codes[:end], self.counts[:n])
+
+    def take(self, indices):
+        """Returns the variants at `indices` (in that order) sharing the same vocabulary."""
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1], dtype=np.int64)
+        return EncodedVariants(self.vocabulary, offsets, self.codes[gather], self.counts[indices])
+
+    @classmethod
+    def from_sorted_variants(cls, sorted_variants, vocabulary=None):
+        """
+        Encodes a list of (variant_tuple, frequency) pairs.
+
+        Parameters:
+            sorted_variants (list): List of (variant_tuple, frequency) tuples
+            vocabulary (list or None): Existing activity vocabulary to extend
+        """
+        vocabulary = list(vocabulary) if vocabulary is not None else []
+        lookup = {activity: code for code, activity in enumerate(vocabulary)}
+        lengths = np.fromiter((len(v) for v, _ in sorted_variants), dtype=np.int64, count=len(sorted_variants))
+        offsets = np.zeros(len(sorted_variants) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        codes = np.empty(offsets[-1], dtype=np.int32)
+        pos = 0
+        for variant, _ in sorted_variants:
+            for step in variant:
+                code = lookup.get(step)
+                if code is None:
+                    code = lookup[step] = len(vocabulary)
+                    vocabulary.append(step)
+                codes[pos] = code
+                pos += 1
+        counts = np.fromiter((c for _, c in sorted_variants), dtype=np.int64, count=len(sorted_variants))
+        return cls(vocabulary, offsets, codes, counts)
+
+
+def _factorize_sorted(series):
+    """Integer codes of a column with categories in sorted order (matches groupby key order)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        codes = series.cat.codes.to_numpy().astype(np.int64)
+        if not categories.is_monotonic_increasing:
+            order = np.argsort(categories.to_numpy(), kind="stable")
+            remap = np.empty(len(order), dtype=np.int64)
+            remap[order] = np.arange(len(order))
+            codes = np.where(codes >= 0, remap[codes], -1)
+            categories = categories[order]
+        return codes, np.asarray(categories, dtype=object)
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes.astype(np.int64), np.asarray(uniques, dtype=object)
+
+
+def _timestamp_ns(series):
+    stamps = pd.DatetimeIndex(series)
+    if stamps.tz is not None:
+        stamps = stamps.tz_convert(None)
+    values = stamps.as_unit("ns").asi8.copy()
+    # pandas sorts missing timestamps last
+    values[stamps.isna()] = np.iinfo(np.int64).max
+    return values
+
+
+def encode_event_log(df):
+    """
+    Factorizes an event log DataFrame and orders its events by (case, timestamp).
+
+    A single stable lexsort replaces the DataFrame sort; case boundaries are found
+    from the sorted case codes, so no per-case Python objects are created. Missing
+    activities are kept as MISSING_ACTIVITY (the last vocabulary entry).
+
+    Returns:
+        EncodedLog
+    """
+    case_codes, case_ids = _factorize_sorted(df['case_id'])
+    activity_codes, vocabulary = _factorize_sorted(df['activity'])
+    timestamps = _timestamp_ns(df['timestamp'])
+
+    order = np.lexsort((timestamps, case_codes))
+    sorted_cases = case_codes[order]
+    # Cases with a missing id are dropped, as groupby does
+    keep = sorted_cases >= 0
+    order, sorted_cases = order[keep], sorted_cases[keep]
+
+    counts = np.bincount(sorted_cases, minlength=len(case_ids))
+    present = counts > 0
+    offsets = np.zeros(int(present.sum()) + 1, dtype=np.int64)
+    np.cumsum(counts[present], out=offsets[1:])
+
+    vocabulary = [str(a) for a in vocabulary]
+    missing = activity_codes < 0
+    if missing.any():
+        activity_codes = np.where(missing, len(vocabulary), activity_codes)
+        vocabulary.append(MISSING_ACTIVITY)
+
+    return EncodedLog(
+        case_ids=case_ids[present],
+        vocabulary=vocabulary,
+        offsets=offsets,
+        activities=activity_codes[order].astype(np.int32),
+        timestamps=timestamps[order],
+    )
+
+
+def _exact_variant_ids(offsets, activities):
+    # Fallback used only if two different sequences ever share a hash
+    lookup = {}
+    ids = np.empty(len(offsets) - 1, dtype=np.int64)
+    for i in range(len(ids)):
+        key = activities[offsets[i]:offsets[i + 1]].tobytes()
+        ids[i] = lookup.setdefault(key, len(lookup))
+    return ids
+
+
+def variant_hash_keys(offsets, activities):
+    """
+    64-bit polynomial hash of each case's activity code sequence (one `np.add.reduceat`).
+    Equal sequences get equal keys; keys are comparable across calls that share codes.
+    """
+    n_cases = len(offsets) - 1
+    if n_cases == 0:
+        return np.zeros(0, dtype=np.uint64)
+    lengths = np.diff(offsets)
+    starts = offsets[:-1]
+    position = np.arange(len(activities), dtype=np.int64) - np.repeat(starts, lengths)
+
+    with np.errstate(over='ignore'):
+        powers = np.cumprod(np.full(int(lengths.max()), HASH_BASE, dtype=np.uint64))
+        terms = (activities.astype(np.uint64) + np.uint64(1)) * powers[position]
+        hashes = np.add.reduceat(terms, starts) if len(terms) else np.zeros(n_cases, dtype=np.uint64)
+        hashes[lengths == 0] = 0
+        return hashes ^ (lengths.astype(np.uint64) * LENGTH_MIX)
+
+
+def count_encoded_variants(offsets, activities):
+    """
+    Groups cases with identical activity sequences.
+
+    Each case's code sequence is reduced to a 64-bit polynomial hash
+    (`variant_hash_keys`); hash groups are then verified element-wise against their
+    representative case, so the result is exact.
+
+    Parameters:
+        offsets (ndarray): Case boundaries into `activities`
+        activities (ndarray): Activity codes of all events, grouped by case
+
+    Returns:
+        - variant_of_case: variant id of each case
+        - first_case: index of the first case of each variant
+        - counts: number of cases per variant
+    """
+    n_cases = len(offsets) - 1
+    if n_cases == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    lengths = np.diff(offsets)
+    starts = offsets[:-1]
+    position = np.arange(len(activities), dtype=np.int64) - np.repeat(starts, lengths)
+    keys = variant_hash_keys(offsets, activities)
+
+    _, first_case, variant_of_case, counts = np.unique(
+        keys, return_index=True, return_inverse=True, return_counts=True
+    )
+    variant_of_case = variant_of_case.reshape(-1)
+
+    # Verify every case against its variant's representative
+    representative = first_case[variant_of_case]
+    same = np.array_equal(lengths, lengths[representative])
+    if same and len(activities):
+        rep_events = np.repeat(starts[representative], lengths) + position
+        same = np.array_equal(activities, activities[rep_events])
+    if not same:
+        _, first_case, variant_of_case, counts = np.unique(
+            _exact_variant_ids(offsets, activities),
+            return_index=True, return_inverse=True, return_counts=True
+        )
+        variant_of_case = variant_of_case.reshape(-1)
+
+    return variant_of_case, first_case, counts
+
+
+def encoded_variants_from_log(encoded_log):
+    """
+    Counts the variants of an EncodedLog, ordered by frequency desc and first case.
+
+    Returns:
+        EncodedVariants
+    """
+    _, first_case, counts = count_encoded_variants(encoded_log.offsets, encoded_log.activities)
+    # Ties keep first-seen order, like sorted() over a Counter filled in case order
+    order = np.lexsort((first_case, -counts))
+    reps = first_case[order]
+
+    starts = encoded_log.offsets[reps]
+    lengths = encoded_log.offsets[reps + 1] - starts
+    offsets = np.zeros(len(reps) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1], dtype=np.int64)
+    return EncodedVariants(encoded_log.vocabulary, offsets, encoded_log.activities[gather], counts[order])
+
+
+@metrics.timed("extract_variants")
+def extract_variants(df, return_encoded=False):
     """
     Extracts and counts all unique process variants from an event log DataFrame.
 
+    Parameters:
+        df (DataFrame): Event log with case_id, activity and timestamp columns
+        return_encoded (bool): Also return the int-encoded variants (EncodedVariants)
+
+    Returns:
+        - variants_dict: a dict of {variant_tuple: frequency}
+        - sorted_variants: a list of (variant_tuple, frequency) sorted by frequency desc
+        - encoded (only if return_encoded): EncodedVariants in sorted_variants order,
+          with the activity vocabulary
+    """
+    encoded = encoded_variants_from_log(encode_event_log(df))
+    sorted_variants = encoded.to_sorted_variants()
+    variants_dict = dict(sorted_variants)
+    metrics.annotate(rows=len(df), cases=int(encoded.counts.sum()), variants=len(sorted_variants))
+
+    if return_encoded:
+        return variants_dict, sorted_variants, encoded
+    return variants_dict, sorted_variants
+
+
+# ---------- Partitioned / Parallel Extraction ----------
+def _partition_of_cases(case_ids, n_partitions):
+    # Stable across processes and runs (fixed-key SipHash), so chunks of one case agree
+    hashes = pd.util.hash_pandas_object(case_ids, index=False).to_numpy()
+    return (hashes % np.uint64(n_partitions)).astype(np.int64)
+
+
+def _split_by_partition(df, n_partitions):
+    df = df[['case_id', 'activity', 'timestamp']]
+    parts = _partition_of_cases(df['case_id'], n_partitions)
+    order = np.argsort(parts, kind="stable")
+    bounds = np.searchsorted(parts[order], np.arange(n_partitions + 1))
+    for p in range(n_partitions):
+        rows = order[bounds[p]:bounds[p + 1]]
+        if len(rows):
+            yield p, df.take(rows)
+
+
+def _partition_variant_counts(piece_frames=None, piece_paths=None):
+    """
+    Worker: counts the variants of one partition.
+
+    Returns:
+        dict of {variant_tuple: (frequency, smallest case_id)}; the case id is
+        used as a deterministic tie-break when partial results are merged.
+    """
+    frames = list(piece_frames or [])
+    for path in piece_paths or []:
+        with open(path, 'rb') as f:
+            frames.append(pickle.load(f))
+    if not frames:
+        return {}
+    encoded_log = encode_event_log(pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0])
+    variant_of_case, first_case, counts = count_encoded_variants(encoded_log.offsets, encoded_log.activities)
+
+    vocab = encoded_log.vocabulary
+    offsets, activities = encoded_log.offsets, encoded_log.activities
+    result = {}
+    for rep, count in zip(first_case.tolist(), counts.tolist()):
+        variant = tuple(vocab[c] for c in activities[offsets[rep]:offsets[rep + 1]].tolist())
+        result[variant] = (count, encoded_log.case_ids[rep])
+    return result
+
+
+def merge_variant_counts(partials):
+    """
+    Merges per-partition results of `_partition_variant_counts`.
+
+    Frequencies are summed and ties are broken by the smallest case id, which is the
+    order a single-process `extract_variants` run produces.
+
     Returns:
         - variants_dict: a dict of {variant_tuple: frequency}
         - sorted_variants: a list of (variant_tuple, frequency) sorted by frequency desc
     """
-    # Sort by case and timestamp to preserve order of events
-    df_sorted = df.sort_values(by=['case_id', 'timestamp'])
+    merged = {}
+    for partial in partials:
+        for variant, (count, first_case) in partial.items():
+            if variant in merged:
+                total, best = merged[variant]
+                merged[variant] = (total + count, min(best, first_case))
+            else:
+                merged[variant] = (count, first_case)
+
+    ranked = sorted(merged.items(), key=lambda item: (-item[1][0], item[1][1]))
+    sorted_variants = [(variant, count) for variant, (count, _) in ranked]
+    return dict(sorted_variants), sorted_variants
+
 
-    # Group activities by case_id in order
-    grouped = df_sorted.groupby('case_id')['activity'].apply(list)
+@metrics.timed("extract_variants_parallel")
+def extract_variants_parallel(source, n_workers=None, n_partitions=None, spill_dir=None,
+                              return_encoded=False):
+    """
+    Extracts variants by sharding cases across a process pool.
+
+    Cases are assigned to partitions by a hash of their case_id, so every event of a
+    case lands in the same partition even when the log arrives in chunks. Each worker
+    counts its partition's variants and the partial counts are merged deterministically.
+
+    Parameters:
+        source: Event log DataFrame, or an iterable of DataFrame chunks (e.g. from
+            `data_loader.iter_event_log_chunks`). Chunks are spilled to disk per
+            partition, so the full log never has to fit in memory.
+        n_workers (int or None): Worker processes (defaults to os.cpu_count()); 1 runs inline
+        n_partitions (int or None): Number of case partitions (defaults to n_workers, or
+            4 × n_workers for chunked input to keep each partition small)
+        spill_dir (str or None): Directory for chunk spill files (a temp dir by default)
+        return_encoded (bool): Also return the variants as EncodedVariants
+
+    Returns:
+        Same as `extract_variants`.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    chunked = not isinstance(source, pd.DataFrame)
+    if n_partitions is None:
+        n_partitions = n_workers * 4 if chunked else n_workers
 
-    # Count unique activity sequences
-    variant_counter = Counter(tuple(variant) for variant in grouped)
+    spill_root = None
+    if chunked:
+        spill_root = tempfile.mkdtemp(prefix="variant_spill_", dir=spill_dir)
+        paths = [[] for _ in range(n_partitions)]
+        for k, chunk in enumerate(source):
+            for p, piece in _split_by_partition(chunk, n_partitions):
+                path = os.path.join(spill_root, f"part{p:04d}_chunk{k:06d}.pkl")
+                with open(path, 'wb') as f:
+                    pickle.dump(piece, f, protocol=pickle.HIGHEST_PROTOCOL)
+                paths[p].append(path)
+        jobs = [{"piece_paths": part} for part in paths if part]
+    else:
+        jobs = [{"piece_frames": [piece]} for _, piece in _split_by_partition(source, n_partitions)]
 
-    # Sort variants by frequency
-    sorted_variants = sorted(variant_counter.items(), key=lambda x: x[1], reverse=True)
+    try:
+        if n_workers == 1 or len(jobs) <= 1:
+            partials = [_partition_variant_counts(**job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs))) as pool:
+                futures = [pool.submit(_partition_variant_counts, **job) for job in jobs]
+                partials = [future.result() for future in futures]
+    finally:
+        if spill_root is not None:
+            shutil.rmtree(spill_root, ignore_errors=True)
 
-    return dict(variant_counter), sorted_variants
+    variants_dict, sorted_variants = merge_variant_counts(partials)
+    metrics.annotate(partitions=len(jobs), cases=sum(variants_dict.values()), variants=len(sorted_variants))
+    if return_encoded:
+        return variants_dict, sorted_variants, EncodedVariants.from_sorted_variants(sorted_variants)
+    return variants_dict, sorted_variants
@@ -1,124 +1,321 @@
 import os
-import csv
-from graphviz import Digraph
-from sentence_transformers import SentenceTransformer
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from sklearn.cluster import MiniBatchKMeans, AgglomerativeClustering
+from scipy import sparse
+
+from embedding_cache import encode_texts
+from variant_extractor import EncodedVariants
+from variant_similarity import edit_distance_clusters
+from tree_lod import prune_for_display, subtree_totals, apply_layout_engine
+from variant_export import columnar_path, export_variants, write_variant_csv
+import metrics
+
+EMBEDDING_CACHE_DIR = "output/embedding_cache"
+# Above this many (variant, activity) cells, activity pooling switches to a sparse matrix
+DENSE_POOLING_CELLS = 50_000_000
 
 # ---------- Variant Encoding ----------
-def encode_variants(variants_subset, model_name="all-MiniLM-L6-v2"):
-    model = SentenceTransformer(model_name)
+def compose_variant_embeddings(encoded, activity_vectors, ngram=1):
+    """
+    Builds variant vectors from per-activity vectors with position-aware pooling.
+
+    Each event contributes its activity vector to an "early" and a "late" channel,
+    weighted by 1 - r and r where r is its relative position in the variant, so the
+    same activities in a different order give a different vector. With ngram=2 a third
+    channel adds the element-wise product of consecutive activity vectors (bag of
+    observed bigrams). All pooling is a (variants × activities) weight matrix built with
+    one bincount, times the activity matrix; no per-variant Python work.
+
+    Parameters:
+        encoded (EncodedVariants): Int-encoded variants
+        activity_vectors (ndarray): (n_activities, dim) vectors indexed by activity code
+        ngram (int): 1 for position-weighted unigrams, 2 to add bigram features
+
+    Returns:
+        float32 array (n_variants, 2 * dim or 3 * dim), L2-normalized rows
+    """
+    n_var, n_act = len(encoded), len(encoded.vocabulary)
+    lengths = encoded.lengths
+    variant_of_event = np.repeat(np.arange(n_var), lengths)
+    position = np.arange(len(encoded.codes)) - np.repeat(encoded.offsets[:-1], lengths)
+    span = np.maximum(lengths - 1, 1)[variant_of_event]
+    late = np.where(lengths[variant_of_event] > 1, position / span, 0.5)
+    scale = 1.0 / np.maximum(lengths, 1)[variant_of_event]
+
+    vectors32 = np.asarray(activity_vectors, dtype=np.float32)
+
+    def pooled(rows, weights, columns, vectors):
+        n_cols = len(vectors)
+        if n_var * n_cols <= DENSE_POOLING_CELLS:
+            # Small vocabularies: dense weight matrix via bincount, then one BLAS matmul
+            dense = np.bincount(rows * n_cols + columns, weights=weights, minlength=n_var * n_cols)
+            return dense.reshape(n_var, n_cols).astype(np.float32) @ vectors
+        matrix = sparse.csr_matrix((weights.astype(np.float32), (rows, columns)), shape=(n_var, n_cols))
+        return np.asarray(matrix @ vectors, dtype=np.float32)
+
+    dim = vectors32.shape[1]
+    n_channels = 3 if ngram >= 2 else 2
+    # Channels are written straight into one preallocated output matrix
+    embeddings = np.empty((n_var, n_channels * dim), dtype=np.float32)
+    embeddings[:, :dim] = pooled(variant_of_event, (1 - late) * scale, encoded.codes, vectors32)
+    embeddings[:, dim:2 * dim] = pooled(variant_of_event, late * scale, encoded.codes, vectors32)
+    if ngram >= 2:
+        # Consecutive pairs inside a variant (never across variant boundaries)
+        last = np.zeros(len(encoded.codes), dtype=bool)
+        last[encoded.offsets[1:][lengths > 0] - 1] = True
+        first_of_pair = np.flatnonzero(~last)
+        pair_keys = encoded.codes[first_of_pair].astype(np.int64) * n_act + encoded.codes[first_of_pair + 1]
+        bigrams, bigram_ids = np.unique(pair_keys, return_inverse=True)
+        bigram_vectors = vectors32[bigrams // n_act] * vectors32[bigrams % n_act]
+        embeddings[:, 2 * dim:] = pooled(variant_of_event[first_of_pair], scale[first_of_pair],
+                                         bigram_ids.reshape(-1), bigram_vectors)
+
+    norms = np.sqrt(np.einsum("ij,ij->i", embeddings, embeddings))
+    embeddings /= np.maximum(norms, 1e-12)[:, None]
+    return embeddings
+
+@metrics.timed("encode_variants", describe=lambda result, variants_subset, *args, **kwargs: {
+    "variants": len(variants_subset), "dim": int(result[1].shape[1])})
+def encode_variants(variants_subset, model_name="all-MiniLM-L6-v2", cache_dir=EMBEDDING_CACHE_DIR,
+                    mode="sentence", ngram=1):
+    """
+    Embeds each variant.
+
+    Parameters:
+        variants_subset: List of (variant_tuple, frequency), or EncodedVariants
+        model_name: SentenceTransformer model
+        cache_dir: On-disk embedding cache (None disables it)
+        mode: "sentence" encodes each variant's joined activities with the model;
+            "activity" encodes each distinct activity once and composes variant
+            vectors with `compose_variant_embeddings` (no length truncation, and
+            only NumPy work per variant)
+        ngram: Pooling order for mode="activity"
+
+    The model is loaded once per process and only texts missing from the cache
+    (keyed by model, text and encode options) are encoded.
+    """
+    if isinstance(variants_subset, EncodedVariants):
+        encoded = variants_subset
+        variants_subset = encoded.to_sorted_variants()
+    else:
+        encoded = None
     variant_texts = [" ".join(variant) for variant, _ in variants_subset]
-    embeddings = model.encode(variant_texts, convert_to_numpy=True, show_progress_bar=True)
+
+    if mode == "activity":
+        if encoded is None:
+            encoded = EncodedVariants.from_sorted_variants(variants_subset)
+        activity_vectors = encode_texts(encoded.vocabulary, model_name=model_name, cache_dir=cache_dir,
+                                        show_progress_bar=False, normalize_embeddings=True)
+        return variant_texts, compose_variant_embeddings(encoded, activity_vectors, ngram=ngram)
+    if mode != "sentence":
+        raise ValueError(f"Unknown encoding mode: {mode}")
+
+    embeddings = encode_texts(variant_texts, model_name=model_name, cache_dir=cache_dir)
     return variant_texts, embeddings
 
-# ---------- Data-Driven Recursive Tree Construction ----------
+# ---------- Data-Driven Hierarchical Tree Construction ----------
+def _fit_cluster_labels(group, n_clusters, seed, agglomerative_max_size):
+    """Clusters one node's variants; module-level so it can run in a worker process."""
+    if isinstance(group, EncodedVariants):
+        # distance="edit": the group is passed as int-encoded variants
+        return edit_distance_clusters(group, n_clusters, seed=seed)
+    from sklearn.cluster import MiniBatchKMeans, AgglomerativeClustering
+    if len(group) > agglomerative_max_size:
+        clustering = MiniBatchKMeans(n_clusters=n_clusters, batch_size=1000, n_init=3, random_state=seed)
+    else:
+        # Agglomerative needs O(n²) memory, so it is only used below the size threshold
+        clustering = AgglomerativeClustering(n_clusters=n_clusters)
+    return clustering.fit_predict(group)
+
+def _partition_by_label(indices, labels, n_clusters):
+    """Splits indices into clusters with one stable argsort (original order kept inside each)."""
+    order = np.argsort(labels, kind="stable")
+    bounds = np.zeros(n_clusters + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=n_clusters), out=bounds[1:])
+    return [indices[order[bounds[c]:bounds[c + 1]]] for c in range(n_clusters)]
+
+@metrics.timed("build_data_driven_tree", describe=lambda result, variants_subset, *args, **kwargs: {
+    "variants": len(variants_subset), "nodes": len(result[0])})
 def build_data_driven_tree(
     variants_subset,
     max_levels=4,
     max_clusters=10,
     min_cluster_size=10,
-    model_name="all-MiniLM-L6-v2"
+    model_name="all-MiniLM-L6-v2",
+    embedding_mode="sentence",
+    ngram=1,
+    agglomerative_max_size=1000,
+    random_state=0,
+    n_jobs=1,
+    distance="embedding",
+    encoder=None
 ):
-    variant_texts, embeddings = encode_variants(variants_subset, model_name=model_name)
-    nodes, tree = [], {}
-    node_id_counter = [1]  # Start from 1, as 0 will be root
+    """
+    Builds a hierarchy of variants by repeatedly clustering their embeddings.
+
+    The tree is grown breadth-first from a worklist instead of recursion, so depth is
+    not limited by Python's recursion limit. All clusterings of one level are
+    independent and are fitted together, on a process pool when n_jobs > 1. Cluster
+    members are partitioned with argsort/bincount, and each fit gets a seed derived
+    from random_state and its position in the worklist, so results are reproducible
+    regardless of n_jobs. Node ids are assigned depth-first at the end, matching the
+    numbering of the former recursive builder.
+
+    Parameters:
+        variants_subset: List of (variant_tuple, frequency)
+        max_levels: Deepest level that is still clustered
+        max_clusters: Clusters per split
+        min_cluster_size: Groups at or below this size become leaves directly
+        model_name / embedding_mode / ngram: Passed to encode_variants
+        agglomerative_max_size: Largest group clustered with AgglomerativeClustering;
+            bigger groups use MiniBatchKMeans
+        random_state: Base seed for MiniBatchKMeans
+        n_jobs: Worker processes for clustering (None = all CPUs)
+        distance: "embedding" clusters sentence embeddings; "edit" clusters by exact
+            Levenshtein distance over activity codes (k-center, see variant_similarity)
+            and needs no embedding model
+        encoder: Optional callable(variants_subset) -> (n, dim) array used instead of
+            encode_variants for the "embedding" distance (e.g. a stub in benchmarks)
+
+    Returns:
+        - nodes: list of {"id", "variant", "freq", "parent", "level"} in id order
+        - tree: {parent_id: [child ids]}, with tree[None] = [0]
+    """
+    if distance == "edit":
+        features = EncodedVariants.from_sorted_variants(variants_subset)
+    elif distance == "embedding" and encoder is not None:
+        features = np.asarray(encoder(variants_subset))
+    elif distance == "embedding":
+        variant_texts, features = encode_variants(variants_subset, model_name=model_name, mode=embedding_mode,
+                                                   ngram=ngram)
+    else:
+        raise ValueError(f"Unknown distance backend: {distance}")
+    freqs = np.array([freq for _, freq in variants_subset])
 
     # Always create a single root node (most frequent variant)
-    root_idx = max(range(len(variants_subset)), key=lambda i: variants_subset[i][1])
-    root_id = 0
-    nodes.append({
-        "id": root_id,
-        "variant": variants_subset[root_idx][0],
-        "freq": variants_subset[root_idx][1],
-        "parent": None,
-        "level": 0,
-    })
-    tree[None] = [root_id]
-
-    # Remove root from indices for recursion
-    all_indices = list(range(len(variants_subset)))
-    all_indices.remove(root_idx)
-
-    def recursive_build(variant_indices, parent_id, level):
-        if not variant_indices:
-            return
-        if level > max_levels or len(variant_indices) <= min_cluster_size:
-            for idx in variant_indices:
-                node_id = node_id_counter[0]
-                nodes.append({
-                    "id": node_id,
-                    "variant": variants_subset[idx][0],
-                    "freq": variants_subset[idx][1],
-                    "parent": parent_id,
-                    "level": level,
-                })
-                if parent_id not in tree:
-                    tree[parent_id] = []
-                tree[parent_id].append(node_id)
-                node_id_counter[0] += 1
-            return
-
-        # Clustering
-        n_clusters = min(max_clusters, len(variant_indices))
-        if len(variant_indices) > 1000:
-            clustering = MiniBatchKMeans(n_clusters=n_clusters, batch_size=1000)
-        else:
-            clustering = AgglomerativeClustering(n_clusters=n_clusters)
-        sub_embeddings = embeddings[variant_indices]
-        cluster_labels = clustering.fit_predict(sub_embeddings)
-
-        for cluster_id in range(n_clusters):
-            cluster_indices = [variant_indices[i] for i, label in enumerate(cluster_labels) if label == cluster_id]
-            if not cluster_indices:
-                continue
-            # Choose the most frequent variant as the cluster representative
-            best_idx = max(cluster_indices, key=lambda idx: variants_subset[idx][1])
-            node_id = node_id_counter[0]
-            nodes.append({
-                "id": node_id,
-                "variant": variants_subset[best_idx][0],
-                "freq": variants_subset[best_idx][1],
-                "parent": parent_id,
-                "level": level,
-            })
-            if parent_id not in tree:
-                tree[parent_id] = []
-            tree[parent_id].append(node_id)
-            node_id_counter[0] += 1
-
-            # Remove the representative from the cluster for recursion
-            child_indices = [idx for idx in cluster_indices if idx != best_idx]
-            if child_indices:
-                recursive_build(child_indices, node_id, level + 1)
-
-    # Start recursion from root
-    recursive_build(all_indices, root_id, 1)
+    root_idx = int(np.argmax(freqs))
+    # Pending tree: per temporary node, its variant index, level and ordered children
+    node_variant, node_level, node_children = [root_idx], [0], [[]]
+
+    def add_node(variant_idx, parent, level):
+        node_variant.append(int(variant_idx))
+        node_level.append(level)
+        node_children.append([])
+        node_children[parent].append(len(node_variant) - 1)
+        return len(node_variant) - 1
+
+    # Worklist of (variant indices, parent node, level); the root is excluded
+    all_indices = np.delete(np.arange(len(variants_subset)), root_idx)
+    worklist = [(all_indices, 0, 1)] if len(all_indices) else []
+    n_fits = 0
+    n_workers = n_jobs or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+    try:
+        while worklist:
+            to_fit = []
+            for indices, parent, level in worklist:
+                if level > max_levels or len(indices) <= min_cluster_size:
+                    for idx in indices:
+                        add_node(idx, parent, level)
+                    # No fit needed; keeps to_fit aligned with the worklist
+                    to_fit.append(None)
+                else:
+                    n_clusters = min(max_clusters, len(indices))
+                    group = features.take(indices) if distance == "edit" else features[indices]
+                    to_fit.append((group, n_clusters, random_state + n_fits,
+                                   agglomerative_max_size))
+                    n_fits += 1
+
+            jobs = [job for job in to_fit if job is not None]
+            if pool is not None and len(jobs) > 1:
+                # Batch small fits per task so deep levels are not dominated by IPC
+                chunksize = max(1, len(jobs) // (4 * n_workers))
+                labels = list(pool.map(_fit_cluster_labels, *zip(*jobs), chunksize=chunksize))
+            else:
+                labels = [_fit_cluster_labels(*job) for job in jobs]
+
+            next_worklist = []
+            fitted = iter(labels)
+            for (indices, parent, level), job in zip(worklist, to_fit):
+                if job is None:
+                    continue
+                n_clusters = job[1]
+                for cluster_indices in _partition_by_label(indices, next(fitted), n_clusters):
+                    if not len(cluster_indices):
+                        continue
+                    # Choose the most frequent variant as the cluster representative
+                    best = int(np.argmax(freqs[cluster_indices]))
+                    node = add_node(cluster_indices[best], parent, level)
+                    child_indices = np.delete(cluster_indices, best)
+                    if len(child_indices):
+                        next_worklist.append((child_indices, node, level + 1))
+            worklist = next_worklist
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    metrics.annotate(cluster_fits=n_fits)
+
+    # Number nodes depth-first (pre-order) with an explicit stack
+    nodes, tree = [], {}
+    stack = [(0, None)]
+    while stack:
+        temp, parent_id = stack.pop()
+        node_id = len(nodes)
+        idx = node_variant[temp]
+        nodes.append({
+            "id": node_id,
+            "variant": variants_subset[idx][0],
+            "freq": variants_subset[idx][1],
+            "parent": parent_id,
+            "level": node_level[temp],
+        })
+        tree.setdefault(parent_id, []).append(node_id)
+        stack.extend((child, node_id) for child in reversed(node_children[temp]))
     return nodes, tree
 
 # ---------- CSV Export ----------
-def save_hierarchical_tree_to_csv(nodes, tree, csv_path="output/variant_hierarchy_details.csv"):
-    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-    with open(csv_path, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(["Variant ID", "Level", "Frequency", "Parent ID", "Event Path"])
-        for node in nodes:
-            writer.writerow([
-                node["id"],
-                node.get("level", 0),
-                node["freq"],
-                node["parent"] if node["parent"] is not None else "ROOT",
-                " → ".join(node["variant"])
-            ])
+def save_hierarchical_tree_to_csv(nodes, tree, csv_path="output/variant_hierarchy_details.csv", columnar=True):
+    """
+    Writes one CSV row per hierarchy node in batches, plus (columnar=True) the
+    int-encoded export with id / level / parent columns next to it (x.variants).
+    """
+    variants = [(node["variant"], node["freq"]) for node in nodes]
+    ids = np.array([node["id"] for node in nodes], dtype=np.int64)
+    levels = np.array([node.get("level", 0) for node in nodes], dtype=np.int32)
+    parents = np.array([-1 if node["parent"] is None else node["parent"] for node in nodes], dtype=np.int64)
+    if columnar:
+        encoded = export_variants(variants, columnar_path(csv_path),
+                                  columns={"id": ids, "level": levels, "parent": parents})
+    else:
+        encoded = EncodedVariants.from_sorted_variants(variants)
+
+    ids, levels, freqs = ids.tolist(), levels.tolist(), encoded.counts.tolist()
+    parent_ids = [p if p >= 0 else "ROOT" for p in parents.tolist()]
+    write_variant_csv(csv_path, ["Variant ID", "Level", "Frequency", "Parent ID", "Event Path"], encoded,
+                      lambda start, stop, paths: zip(ids[start:stop], levels[start:stop], freqs[start:stop],
+                                                     parent_ids[start:stop], paths))
     print(f"📄 Hierarchical tree CSV saved to {csv_path}")
 
 # ---------- Visualization ----------
-def visualize_data_driven_tree(nodes, tree, save_path="output/data_driven_tree", dpi=300):
+@metrics.timed("visualize_data_driven_tree")
+def visualize_data_driven_tree(nodes, tree, save_path="output/data_driven_tree", dpi=300, render_queue=None,
+                               max_nodes=None, min_share=0.0, engine="dot"):
+    """
+    Renders the hierarchy as small level-colored dots.
+
+    Large hierarchies: `max_nodes` / `min_share` keep the subtrees carrying the most
+    cases and fold the rest into "+N more" nodes; `engine` can be "sfdp" or "twopi".
+    """
+    from graphviz import Digraph
+
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
     dot = Digraph(format='svg', engine='dot')
     dot.attr(dpi=str(dpi))
     dot.attr(rankdir='TB')
-    dot.attr('graph', splines='true', ranksep='0.5', nodesep='0.2', concentrate='true')
+    if engine == "dot":
+        dot.attr('graph', splines='true', ranksep='0.5', nodesep='0.2', concentrate='true')
+    else:
+        apply_layout_engine(dot, engine, root_id=nodes[0]["id"] if nodes else None)
 
     # Color scheme for levels
     level_colors = [
@@ -130,7 +327,16 @@ def visualize_data_driven_tree(nodes, tree, save_path="output/data_driven_tree",
         '#B388FF',  # Level 5+
     ]
 
-    for node in nodes:
+    # Nodes are numbered in pre-order, so every parent precedes its children
+    position = {node["id"]: i for i, node in enumerate(nodes)}
+    parent = np.array([-1 if node["parent"] is None else position[node["parent"]] for node in nodes],
+                      dtype=np.int64)
+    weight = subtree_totals(parent, [node["freq"] for node in nodes])
+    visible, collapsed = prune_for_display(parent, weight, max_nodes=max_nodes, min_share=min_share)
+    metrics.annotate(nodes=len(nodes), rendered_nodes=len(visible), collapsed_groups=len(collapsed))
+
+    for i in visible.tolist():
+        node = nodes[i]
         level = node.get('level', 0)
         color = level_colors[level] if level < len(level_colors) else level_colors[-1]
         dot.node(
@@ -144,11 +350,21 @@ def visualize_data_driven_tree(nodes, tree, save_path="output/data_driven_tree",
             fixedsize='true'
         )
 
-    for node in nodes:
+    for i in visible.tolist():
+        node = nodes[i]
         if node["parent"] is not None:
             dot.edge(str(node["parent"]), str(node["id"]), color='#CCCCCC', penwidth='0.5')
 
-    dot.attr('graph', label=f"Data-Driven Variant Tree ({len(nodes)} nodes)")
+    for i, (hidden_nodes, hidden_freq) in collapsed.items():
+        node_id = nodes[i]["id"]
+        dot.node(f"more{node_id}", label=f"+{hidden_nodes} more\n({int(hidden_freq)})", shape='plaintext',
+                 fontsize='8', fontcolor='gray40')
+        dot.edge(str(node_id), f"more{node_id}", color='#CCCCCC', penwidth='0.5', style='dashed')
+
+    shown = f"{len(visible)} of {len(nodes)}" if collapsed else f"{len(nodes)}"
+    dot.attr('graph', label=f"Data-Driven Variant Tree ({shown} nodes)")
+    if render_queue is not None:
+        return render_queue.submit_dot(dot.source, f"{save_path}.svg", engine=dot.engine)
     rendered_path = dot.render(filename=save_path, cleanup=True)
     print(f"✅ Data-driven tree saved to {rendered_path}")
 
@@ -158,15 +374,31 @@ def build_and_visualize_data_driven_tree(
     max_levels=4,
     max_clusters=10,
     min_cluster_size=10,
-    model_name="all-MiniLM-L6-v2"
+    model_name="all-MiniLM-L6-v2",
+    embedding_mode="sentence",
+    ngram=1,
+    random_state=0,
+    n_jobs=1,
+    distance="embedding",
+    max_nodes=None,
+    engine="dot",
+    save_path="output/data_driven_tree",
+    render_queue=None
 ):
     nodes, tree = build_data_driven_tree(
         variants_subset,
         max_levels=max_levels,
         max_clusters=max_clusters,
         min_cluster_size=min_cluster_size,
-        model_name=model_name
+        model_name=model_name,
+        embedding_mode=embedding_mode,
+        ngram=ngram,
+        random_state=random_state,
+        n_jobs=n_jobs,
+        distance=distance
     )
-    visualize_data_driven_tree(nodes, tree)
+    # With a render_queue the layout runs in the background (see RenderQueue.wait)
+    visualize_data_driven_tree(nodes, tree, save_path=save_path, max_nodes=max_nodes, engine=engine,
+                               render_queue=render_queue)
     save_hierarchical_tree_to_csv(nodes, tree)
     return nodes, tree
\ No newline at end of file
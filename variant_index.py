@@ -0,0 +1,199 @@
+import os
+import pickle
+from bisect import bisect_right
+from collections import defaultdict
+
+import networkx as nx
+
+from variant_extractor import encode_event_log, MISSING_ACTIVITY
+from variant_tree_builder import TrieNode, insert_variant, remove_variant
+
+# Bump whenever the pickled layout of VariantIndex changes
+INDEX_FORMAT_VERSION = 1
+
+
+def _variant_sort_key(variant):
+    # Missing activities (NaN) sort after every named one instead of failing the comparison
+    return tuple((True, "") if step is MISSING_ACTIVITY else (False, step) for step in variant)
+
+
+class VariantIndex:
+    """
+    Persistent, incrementally updated variant index keyed by case_id.
+
+    Keeps each open case's activity sequence and maintains, by deltas only:
+        - variants_dict: {variant_tuple: number of cases}
+        - trie_root: TrieNode prefix tree over all cases (see variant_tree_builder)
+        - edge_weights: {(prev, next): weight} directly-follows counts including
+          START/END, the same weights `build_process_graph` puts on its edges
+
+    Ingesting new events only touches the cases they belong to, so a daily refresh
+    costs time proportional to the new events rather than the whole log.
+    """
+
+    def __init__(self):
+        self.open_cases = {}       # case_id -> ([timestamps], [activities])
+        self.case_variant = {}     # case_id -> current variant tuple (open and closed)
+        self.closed_cases = set()
+        self.variants_dict = {}
+        self._interned = {}
+        self.trie_root = TrieNode("START")
+        self.edge_weights = defaultdict(int)
+        self.watermark = None      # largest event timestamp ingested (int ns, UTC)
+
+    # ---------- Updates ----------
+    def _apply_variant_delta(self, variant, delta):
+        count = self.variants_dict.get(variant, 0) + delta
+        if count > 0:
+            self.variants_dict[variant] = count
+        else:
+            self.variants_dict.pop(variant, None)
+            self._interned.pop(variant, None)
+
+        if delta > 0:
+            insert_variant(self.trie_root, variant, delta)
+        else:
+            remove_variant(self.trie_root, variant, -delta)
+
+        prev = "START"
+        for step in variant + ("END",):
+            weight = self.edge_weights[(prev, step)] + delta
+            if weight > 0:
+                self.edge_weights[(prev, step)] = weight
+            else:
+                del self.edge_weights[(prev, step)]
+            prev = step
+
+    def _set_case_variant(self, case_id, variant):
+        old = self.case_variant.get(case_id)
+        if old == variant:
+            return
+        if old is not None:
+            self._apply_variant_delta(old, -1)
+        # Share one tuple object per variant so closed cases cost a single reference
+        variant = self._interned.setdefault(variant, variant)
+        self.case_variant[case_id] = variant
+        self._apply_variant_delta(variant, +1)
+
+    def ingest(self, df):
+        """
+        Adds new or late-arriving events.
+
+        Events are merged into their case in timestamp order; an event identical to
+        one already stored (same timestamp and activity) is ignored, so overlapping
+        batches are safe. Events for closed cases are skipped.
+
+        Parameters:
+            df (DataFrame): Events with case_id, activity and timestamp columns
+
+        Returns:
+            dict with the number of events added, duplicates and events for closed cases skipped
+        """
+        stats = {"added": 0, "duplicates": 0, "closed_skipped": 0}
+        if len(df) == 0:
+            return stats
+
+        encoded = encode_event_log(df)
+        vocab = encoded.vocabulary
+        offsets = encoded.offsets
+        timestamps = encoded.timestamps.tolist()
+        activities = [vocab[c] for c in encoded.activities.tolist()]
+
+        for i, case_id in enumerate(encoded.case_ids.tolist()):
+            start, end = offsets[i], offsets[i + 1]
+            if case_id in self.closed_cases:
+                stats["closed_skipped"] += int(end - start)
+                continue
+
+            stamps, steps = self.open_cases.setdefault(case_id, ([], []))
+            changed = False
+            for ts, activity in zip(timestamps[start:end], activities[start:end]):
+                pos = bisect_right(stamps, ts)
+                # Scan events with the same timestamp for an exact duplicate
+                j = pos - 1
+                duplicate = False
+                while j >= 0 and stamps[j] == ts:
+                    if steps[j] is activity or steps[j] == activity:
+                        duplicate = True
+                        break
+                    j -= 1
+                if duplicate:
+                    stats["duplicates"] += 1
+                    continue
+                stamps.insert(pos, ts)
+                steps.insert(pos, activity)
+                stats["added"] += 1
+                changed = True
+
+            if changed:
+                self._set_case_variant(case_id, tuple(steps))
+
+        last = int(encoded.timestamps.max())
+        if last != (2 ** 63 - 1):
+            self.watermark = last if self.watermark is None else max(self.watermark, last)
+        return stats
+
+    def close_cases(self, case_ids):
+        """
+        Marks cases as finished: their event lists are released and later events ignored.
+        Their variant still counts in variants_dict, the trie and the edge weights.
+        """
+        for case_id in case_ids:
+            if self.open_cases.pop(case_id, None) is not None or case_id in self.case_variant:
+                self.closed_cases.add(case_id)
+
+    def remove_cases(self, case_ids):
+        """Drops cases entirely, subtracting their variant from every aggregate."""
+        for case_id in case_ids:
+            variant = self.case_variant.pop(case_id, None)
+            if variant is not None:
+                self._apply_variant_delta(variant, -1)
+            self.open_cases.pop(case_id, None)
+            self.closed_cases.discard(case_id)
+
+    # ---------- Views ----------
+    def sorted_variants(self):
+        """
+        Returns a list of (variant_tuple, frequency) sorted by frequency desc.
+        Ties are ordered by the variant's activities so the result is deterministic.
+        """
+        return sorted(self.variants_dict.items(), key=lambda item: (-item[1], _variant_sort_key(item[0])))
+
+    def process_graph(self):
+        """
+        Builds the directly-follows DiGraph from the maintained edge weights,
+        equivalent to `build_process_graph` over all indexed variants.
+        """
+        G = nx.DiGraph()
+        G.add_node("START")
+        G.add_node("END")
+        G.add_edges_from((u, v, {"weight": w}) for (u, v), w in self.edge_weights.items())
+        return G
+
+    @property
+    def total_cases(self):
+        return len(self.case_variant)
+
+    # ---------- Persistence ----------
+    def save(self, path):
+        """Writes the index atomically (pickle with a format version)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({"version": INDEX_FORMAT_VERSION, "index": self}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            payload = pickle.load(f)
+        if payload.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported variant index version in {path}")
+        return payload["index"]
+
+    @classmethod
+    def load_or_create(cls, path):
+        if os.path.exists(path):
+            return cls.load(path)
+        return cls()
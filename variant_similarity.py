@@ -0,0 +1,344 @@
+import numpy as np
+
+# Longest pattern the vectorized kernel handles (one uint64 word per text)
+WORD_BITS = 64
+
+
+def levenshtein(a, b):
+    """
+    Levenshtein distance between two code sequences (Myers / Hyyrö bit-parallel).
+
+    The shorter sequence is the pattern; its DP column is held as bit vectors in Python
+    integers, so each text symbol costs a handful of word operations at any length.
+    """
+    a, b = list(a), list(b)
+    if len(a) > len(b):
+        a, b = b, a
+    m = len(a)
+    if m == 0:
+        return len(b)
+
+    peq = {}
+    for i, symbol in enumerate(a):
+        peq[symbol] = peq.get(symbol, 0) | (1 << i)
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for symbol in b:
+        eq = peq.get(symbol, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return score
+
+
+def levenshtein_batch(pattern, codes, offsets, indices=None):
+    """
+    Distances from one pattern to many variants at once.
+
+    For patterns up to 64 symbols the Myers kernel runs on a uint64 array with one
+    word per text, advancing all texts one symbol per step; longer patterns fall back
+    to `levenshtein` per pair.
+
+    Parameters:
+        pattern (ndarray): Activity codes of the query
+        codes, offsets (ndarray): Concatenated texts and their boundaries (as in EncodedVariants)
+        indices (ndarray or None): Subset of texts to compare against (all by default)
+
+    Returns:
+        int64 array of distances, one per selected text
+    """
+    pattern = np.asarray(pattern, dtype=np.int64)
+    indices = np.arange(len(offsets) - 1) if indices is None else np.asarray(indices, dtype=np.int64)
+    starts = offsets[indices]
+    lengths = offsets[indices + 1] - starts
+    m = len(pattern)
+    if m == 0 or len(indices) == 0:
+        return lengths.astype(np.int64)
+    if m > WORD_BITS:
+        return np.array([levenshtein(pattern.tolist(), codes[s:s + n].tolist())
+                         for s, n in zip(starts.tolist(), lengths.tolist())], dtype=np.int64)
+
+    n_symbols = int(max(codes.max(initial=-1), pattern.max())) + 2
+    peq = np.zeros(n_symbols, dtype=np.uint64)
+    for i, symbol in enumerate(pattern.tolist()):
+        if symbol >= 0:
+            peq[symbol] |= np.uint64(1) << np.uint64(i)
+
+    # Longest texts first: the texts still running at step j are always a prefix
+    order = np.argsort(-lengths, kind="stable")
+    starts, lengths = starts[order], lengths[order]
+    running = np.searchsorted(-lengths, -np.arange(int(lengths[0])), side="left")
+
+    mask = np.uint64((1 << m) - 1)
+    last = np.uint64(1 << (m - 1))
+    one = np.uint64(1)
+    pv = np.full(len(indices), mask, dtype=np.uint64)
+    mv = np.zeros(len(indices), dtype=np.uint64)
+    score = np.full(len(indices), m, dtype=np.int64)
+
+    with np.errstate(over="ignore"):
+        for j, k in enumerate(running.tolist()):
+            symbols = codes[starts[:k] + j]
+            eq = peq[np.where(symbols >= 0, symbols, n_symbols - 1)]
+            p, mvv = pv[:k], mv[:k]
+            xv = eq | mvv
+            xh = ((((eq & p) + p) & mask) ^ p) | eq
+            ph = mvv | (~(xh | p) & mask)
+            mh = p & xh
+            score[:k] += ((ph & last) != 0).astype(np.int64) - ((mh & last) != 0)
+            ph = ((ph << one) | one) & mask
+            mh = (mh << one) & mask
+            pv[:k] = mh | (~(xv | ph) & mask)
+            mv[:k] = ph & xv
+
+    result = np.empty(len(indices), dtype=np.int64)
+    result[order] = score
+    return result
+
+
+def levenshtein_pairs(codes, offsets, a, b):
+    """
+    Distances of many independent pairs (texts a[i], b[i]) at once.
+
+    Each pair runs the Myers kernel with its own pattern (the shorter text): the
+    pattern bit masks form an (n_pairs, n_symbols) uint64 table and all pairs advance
+    one text symbol per step. Pairs whose shorter text exceeds 64 symbols fall back to
+    `levenshtein`.
+
+    Parameters:
+        codes, offsets (ndarray): Concatenated texts and their boundaries (as in EncodedVariants)
+        a, b (ndarray): Text indices of each pair
+
+    Returns:
+        int64 array of distances, one per pair
+    """
+    a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+    lengths = np.diff(offsets)
+    swap = lengths[a] > lengths[b]
+    pattern, text = np.where(swap, b, a), np.where(swap, a, b)
+    m, n = lengths[pattern], lengths[text]
+    result = n.astype(np.int64)
+
+    for i in np.flatnonzero(m > WORD_BITS).tolist():
+        p, t = pattern[i], text[i]
+        result[i] = levenshtein(codes[offsets[p]:offsets[p + 1]].tolist(), codes[offsets[t]:offsets[t + 1]].tolist())
+    work = np.flatnonzero((m > 0) & (m <= WORD_BITS))
+    if not len(work):
+        return result
+
+    # Longest texts first: the pairs still running at step j are always a prefix
+    work = work[np.argsort(-n[work], kind="stable")]
+    pattern, text, m, n = pattern[work], text[work], m[work], n[work]
+    k = len(work)
+    n_symbols = int(codes.max(initial=-1)) + 2
+    rows = np.repeat(np.arange(k), m)
+    position = np.arange(len(rows), dtype=np.int64) - np.repeat(np.cumsum(m) - m, m)
+    symbols = codes[np.repeat(offsets[pattern], m) + position]
+    peq = np.zeros((k, n_symbols), dtype=np.uint64)
+    np.bitwise_or.at(peq, (rows, np.where(symbols >= 0, symbols, n_symbols - 1)),
+                     np.left_shift(np.uint64(1), position.astype(np.uint64)))
+
+    mask = np.right_shift(~np.uint64(0), (WORD_BITS - m).astype(np.uint64))
+    last = np.left_shift(np.uint64(1), (m - 1).astype(np.uint64))
+    one = np.uint64(1)
+    pv = mask.copy()
+    mv = np.zeros(k, dtype=np.uint64)
+    score = m.astype(np.int64)
+    starts = offsets[text]
+    running = np.searchsorted(-n, -np.arange(int(n[0])), side="left")
+
+    with np.errstate(over="ignore"):
+        for j, r in enumerate(running.tolist()):
+            symbols = codes[starts[:r] + j]
+            eq = peq[np.arange(r), np.where(symbols >= 0, symbols, n_symbols - 1)]
+            p, mvv, msk, lst = pv[:r], mv[:r], mask[:r], last[:r]
+            xv = eq | mvv
+            xh = ((((eq & p) + p) & msk) ^ p) | eq
+            ph = mvv | (~(xh | p) & msk)
+            mh = p & xh
+            score[:r] += ((ph & lst) != 0).astype(np.int64) - ((mh & lst) != 0)
+            ph = ((ph << one) | one) & msk
+            mh = (mh << one) & msk
+            pv[:r] = mh | (~(xv | ph) & msk)
+            mv[:r] = ph & xv
+
+    result[work] = score
+    return result
+
+
+def _histograms(encoded):
+    """(n_variants, n_activities) activity counts, used for the bag-distance lower bound."""
+    n_var, n_act = len(encoded), max(len(encoded.vocabulary), 1)
+    rows = np.repeat(np.arange(n_var), encoded.lengths)
+    return np.bincount(rows * n_act + encoded.codes, minlength=n_var * n_act).reshape(n_var, n_act)
+
+
+def pairs_within(encoded, threshold):
+    """
+    All variant pairs whose edit distance is at most `threshold`, without an n² matrix.
+
+    Candidates are pruned in two vectorized stages before any distance is computed:
+    a length window (|len_i - len_j| <= threshold, a contiguous range once variants
+    are sorted by length) and the bag-distance bound (activity-count differences).
+    Survivors are verified with the batched Myers kernel.
+
+    Returns:
+        - pairs: (n_pairs, 2) int64 array of variant indices with i < j
+        - distances: int64 array of their edit distances
+    """
+    lengths = encoded.lengths
+    hist = _histograms(encoded)
+    by_length = np.argsort(lengths, kind="stable")
+    sorted_lengths = lengths[by_length]
+    window_end = np.searchsorted(sorted_lengths, sorted_lengths + threshold, side="right")
+
+    found_pairs, found_dist = [], []
+    for pos, i in enumerate(by_length.tolist()):
+        candidates = by_length[pos + 1:window_end[pos]]
+        if not len(candidates):
+            continue
+        diff = hist[candidates] - hist[i]
+        bag = np.maximum(np.clip(diff, 0, None).sum(axis=1), np.clip(-diff, 0, None).sum(axis=1))
+        candidates = candidates[bag <= threshold]
+        if not len(candidates):
+            continue
+        dist = levenshtein_batch(encoded.sequence(i), encoded.codes, encoded.offsets, candidates)
+        keep = dist <= threshold
+        if keep.any():
+            js = candidates[keep]
+            found_pairs.append(np.column_stack([np.minimum(i, js), np.maximum(i, js)]))
+            found_dist.append(dist[keep])
+
+    if not found_pairs:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.vstack(found_pairs), np.concatenate(found_dist)
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over variants for nearest-variant queries under edit distance.
+
+    The triangle inequality prunes every subtree whose edge label differs from the
+    query's distance to the node by more than the current search radius.
+
+    Parameters:
+        encoded (EncodedVariants): Variants to index (e.g. the Pareto set)
+    """
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+        self.sequences = [encoded.sequence(i).tolist() for i in range(len(encoded))]
+        self.root = None
+        self.children = []  # per variant: {distance: child variant index}
+        for i in range(len(encoded)):
+            self._insert(i)
+
+    def _insert(self, i):
+        self.children.append({})
+        if self.root is None:
+            self.root = i
+            return
+        node = self.root
+        while True:
+            d = levenshtein(self.sequences[i], self.sequences[node])
+            child = self.children[node].get(d)
+            if child is None:
+                self.children[node][d] = i
+                return
+            node = child
+
+    def _query_codes(self, query):
+        query = list(query)
+        if query and isinstance(query[0], str):
+            index = self.encoded.activity_index
+            return [index.get(step, -1) for step in query]
+        return [int(code) for code in query]
+
+    def nearest(self, query, k=1):
+        """
+        The k variants closest to `query` (activity names or codes).
+
+        Returns:
+            list of (variant index, distance), closest first
+        """
+        if self.root is None:
+            return []
+        query = self._query_codes(query)
+        best = []  # sorted list of (distance, index), at most k long
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = levenshtein(query, self.sequences[node])
+            if len(best) < k or d < best[-1][0]:
+                best.append((d, node))
+                best.sort()
+                del best[k:]
+            radius = best[-1][0] if len(best) == k else float("inf")
+            for edge, child in self.children[node].items():
+                if abs(edge - d) <= radius:
+                    stack.append(child)
+        return [(i, d) for d, i in best]
+
+    def within(self, query, radius):
+        """All variants within `radius` of `query` as (variant index, distance), closest first."""
+        if self.root is None:
+            return []
+        query = self._query_codes(query)
+        found, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            d = levenshtein(query, self.sequences[node])
+            if d <= radius:
+                found.append((node, d))
+            for edge, child in self.children[node].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+        return sorted(found, key=lambda item: (item[1], item[0]))
+
+
+def edit_distance_clusters(encoded, n_clusters, seed=0):
+    """
+    Partitions variants into clusters by edit distance without a distance matrix.
+
+    Centers are seeded k-means++ style: the first is the most frequent variant, each
+    next one is drawn with probability proportional to the squared distance to its
+    nearest center. Every variant is assigned to its nearest center as centers are
+    added, so the whole pass is n_clusters batched one-vs-all kernels, O(n · k).
+
+    Parameters:
+        encoded (EncodedVariants): Variants to cluster
+        n_clusters (int): Number of clusters
+        seed (int): Seed for drawing centers
+
+    Returns:
+        int64 array of cluster labels in [0, n_clusters)
+    """
+    n = len(encoded)
+    n_clusters = min(n_clusters, n)
+    labels = np.zeros(n, dtype=np.int64)
+    if n_clusters <= 1:
+        return labels
+
+    rng = np.random.default_rng(seed)
+    center = int(np.argmax(encoded.counts))
+    nearest = levenshtein_batch(encoded.sequence(center), encoded.codes, encoded.offsets)
+    for c in range(1, n_clusters):
+        weights = nearest.astype(np.float64) ** 2
+        if weights.sum() == 0:
+            break
+        center = int(rng.choice(n, p=weights / weights.sum()))
+        dist = levenshtein_batch(encoded.sequence(center), encoded.codes, encoded.offsets)
+        closer = dist < nearest
+        labels[closer] = c
+        nearest = np.where(closer, dist, nearest)
+    return labels
@@ -1,4 +1,8 @@
-from graphviz import Digraph
+import numpy as np
+
+from variant_extractor import EncodedVariants
+from tree_lod import prune_for_display, apply_layout_engine
+import metrics
 
 class TrieNode:
     def __init__(self, name):
@@ -15,54 +19,272 @@ def insert_variant(trie_root, variant_steps, frequency):
         node = node.children[step]
         node.frequency += frequency
 
-def build_trie_from_variants(variants_subset):
+def remove_variant(trie_root, variant_steps, frequency):
+    """
+    Subtracts a variant's frequency along its path, dropping nodes that reach zero.
+    """
+    node = trie_root
+    node.frequency -= frequency
+    for step in variant_steps:
+        child = node.children.get(step)
+        if child is None:
+            return
+        child.frequency -= frequency
+        if child.frequency <= 0:
+            del node.children[step]
+            return
+        node = child
+
+class ArrayTrie:
+    """
+    Prefix trie stored in flat NumPy arrays instead of TrieNode objects.
+
+    Node 0 is the START root. Nodes are numbered level by level and, within a level,
+    by (parent, activity code), so the edge keys `parent * n_activities + activity`
+    are globally sorted: child lookup is a binary search and the children of a node
+    occupy a contiguous id range.
+
+    Attributes:
+        vocabulary (list): Activity name per activity code
+        parent (ndarray): Parent node id (-1 for the root)
+        activity (ndarray): Activity code of the edge into the node (-1 for the root)
+        frequency (ndarray): Number of cases passing through the node
+        end_count (ndarray): Number of cases whose variant ends at the node
+        depth (ndarray): Distance from the root
+    """
+
+    def __init__(self, vocabulary, parent, activity, frequency, end_count, depth):
+        self.vocabulary = list(vocabulary)
+        self.activity_index = {a: code for code, a in enumerate(self.vocabulary)}
+        self.parent = parent
+        self.activity = activity
+        self.frequency = frequency
+        self.end_count = end_count
+        self.depth = depth
+
+        width = max(len(self.vocabulary), 1)
+        self._width = width
+        self._edge_keys = parent[1:].astype(np.int64) * width + activity[1:]
+        child_counts = np.bincount(parent[1:], minlength=len(parent))
+        self.child_offsets = np.zeros(len(parent) + 1, dtype=np.int64)
+        np.cumsum(child_counts, out=self.child_offsets[1:])
+        self.child_offsets += 1
+
+    def __len__(self):
+        return len(self.parent)
+
+    @classmethod
+    def from_encoded(cls, encoded):
+        """
+        Bulk-builds the trie from EncodedVariants, one vectorized pass per depth level.
+        """
+        width = max(len(encoded.vocabulary), 1)
+        lengths = encoded.lengths
+        counts = encoded.counts
+        node_of_variant = np.zeros(len(encoded), dtype=np.int64)
+
+        parents = [np.array([-1], dtype=np.int64)]
+        activities = [np.array([-1], dtype=np.int64)]
+        frequencies = [np.array([counts.sum()], dtype=np.int64)]
+        depths = [np.array([0], dtype=np.int64)]
+        next_id = 1
+        max_len = int(lengths.max()) if len(lengths) else 0
+
+        for d in range(max_len):
+            active = np.flatnonzero(lengths > d)
+            keys = node_of_variant[active] * width + encoded.codes[encoded.offsets[active] + d]
+            level_keys, inverse = np.unique(keys, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            parents.append(level_keys // width)
+            activities.append(level_keys % width)
+            frequencies.append(np.bincount(inverse, weights=counts[active],
+                                           minlength=len(level_keys)).astype(np.int64))
+            depths.append(np.full(len(level_keys), d + 1, dtype=np.int64))
+            node_of_variant[active] = next_id + inverse
+            next_id += len(level_keys)
+
+        n_nodes = next_id
+        end_count = np.bincount(node_of_variant, weights=counts, minlength=n_nodes).astype(np.int64)
+        return cls(
+            encoded.vocabulary,
+            parent=np.concatenate(parents),
+            activity=np.concatenate(activities).astype(np.int32),
+            frequency=np.concatenate(frequencies),
+            end_count=end_count,
+            depth=np.concatenate(depths).astype(np.int32),
+        )
+
+    def name(self, node):
+        return "START" if node == 0 else self.vocabulary[self.activity[node]]
+
+    def child(self, node, code):
+        """Returns the child of `node` along activity `code`, or -1."""
+        if node < 0 or code is None or code < 0:
+            return -1
+        key = node * self._width + code
+        i = np.searchsorted(self._edge_keys, key)
+        if i < len(self._edge_keys) and self._edge_keys[i] == key:
+            return int(i) + 1
+        return -1
+
+    def children(self, node):
+        """Ids of the children of `node` (a contiguous range, ordered by activity code)."""
+        return np.arange(self.child_offsets[node], self.child_offsets[node + 1])
+
+    def encode(self, prefix):
+        """Maps activity names to codes; unknown activities become -1."""
+        return [self.activity_index.get(step, -1) for step in prefix]
+
+    def find(self, prefix):
+        """Returns the node reached by an activity-name prefix, or -1 if it is not in the trie."""
+        node = 0
+        for code in self.encode(prefix):
+            node = self.child(node, code)
+            if node < 0:
+                return -1
+        return node
+
+    def prefix_frequency(self, prefix):
+        """Number of cases whose variant starts with `prefix`."""
+        node = self.find(prefix)
+        return int(self.frequency[node]) if node >= 0 else 0
+
+    def path(self, node):
+        """Activity names from the root to `node`."""
+        steps = []
+        while node > 0:
+            steps.append(self.vocabulary[self.activity[node]])
+            node = self.parent[node]
+        return tuple(reversed(steps))
+
+    def to_trie_node(self):
+        """Materializes the equivalent TrieNode tree (e.g. for visualization)."""
+        nodes = [TrieNode("START")]
+        nodes[0].frequency = int(self.frequency[0])
+        for i in range(1, len(self)):
+            node = TrieNode(self.vocabulary[self.activity[i]])
+            node.frequency = int(self.frequency[i])
+            nodes.append(node)
+            nodes[self.parent[i]].children[node.name] = node
+        return nodes[0]
+
+def _count_trie_nodes(trie):
+    if isinstance(trie, ArrayTrie):
+        return len(trie)
+    count, stack = 0, [trie]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children.values())
+    return count
+
+def _describe_trie(trie, variants_subset, *args, **kwargs):
+    return {"variants": len(variants_subset), "nodes": _count_trie_nodes(trie)}
+
+@metrics.timed("build_trie", describe=_describe_trie)
+def build_trie_from_variants(variants_subset, compact=False):
     """
     Builds a Trie from a subset of variants.
     Each path through the Trie represents a process variant.
+
+    Parameters:
+        variants_subset: List of (variant_tuple, frequency), or EncodedVariants
+        compact (bool): Return an array-backed ArrayTrie instead of TrieNode objects
+            (always the case for EncodedVariants input)
     """
+    if isinstance(variants_subset, EncodedVariants):
+        return ArrayTrie.from_encoded(variants_subset)
+    if compact:
+        return ArrayTrie.from_encoded(EncodedVariants.from_sorted_variants(variants_subset))
+
     root = TrieNode("START")
     for variant_tuple, freq in variants_subset:
         insert_variant(root, variant_tuple, freq)
     return root
 
-def visualize_trie(trie_root, save_path="variant_trie_tree", dpi=300):
+def _flatten_trie(trie_root):
+    """
+    Parent / name / frequency arrays of a trie; TrieNode trees are walked
+    iteratively in pre-order, an ArrayTrie is used as is.
+    """
+    if isinstance(trie_root, ArrayTrie):
+        names = ["START"] + [trie_root.vocabulary[code] for code in trie_root.activity[1:].tolist()]
+        return trie_root.parent, names, trie_root.frequency
+
+    parent, names, freqs = [], [], []
+    stack = [(trie_root, -1)]
+    while stack:
+        node, parent_id = stack.pop()
+        node_id = len(names)
+        parent.append(parent_id)
+        names.append(node.name)
+        freqs.append(node.frequency)
+        stack.extend((child, node_id) for child in reversed(list(node.children.values())))
+    return np.array(parent, dtype=np.int64), names, np.array(freqs, dtype=np.int64)
+
+@metrics.timed("visualize_trie")
+def visualize_trie(trie_root, save_path="variant_trie_tree", dpi=300, render_queue=None,
+                   max_nodes=None, min_share=0.0, engine="dot"):
     """
     Visualizes the Trie using Graphviz and saves it as an image.
+    With a RenderQueue the render is queued and its future returned.
+
+    Large tries: `max_nodes` / `min_share` keep only the most frequent prefixes and fold
+    the rest into "+N more" nodes (see tree_lod.prune_for_display); `engine` can be
+    "sfdp" or "twopi" for layouts that scale better than "dot".
     """
+    from graphviz import Digraph
+
+    parent, names, freqs = _flatten_trie(trie_root)
+    visible, collapsed = prune_for_display(parent, freqs, max_nodes=max_nodes, min_share=min_share)
+    metrics.annotate(nodes=len(parent), rendered_nodes=len(visible), collapsed_groups=len(collapsed))
+
     dot = Digraph(format='png')
     dot.attr(dpi=str(dpi))
     dot.attr(rankdir='TB')  # vertical layout
+    if engine != "dot":
+        apply_layout_engine(dot, engine, root_id=0)
 
-    def add_nodes_edges(node, parent_id=None):
-        node_id = str(id(node))
-        label = f"{node.name}\n({node.frequency})"
-        dot.node(node_id, label=label, shape='box', style='filled', fillcolor='lightblue')
-
-        if parent_id:
-            dot.edge(parent_id, node_id)
-
-        for child in node.children.values():
-            add_nodes_edges(child, node_id)
+    # Node ids are positions in the flattened trie, so the DOT source is identical
+    # across runs (see RenderQueue skipping)
+    for node_id in visible.tolist():
+        label = f"{names[node_id]}\n({freqs[node_id]})"
+        dot.node(str(node_id), label=label, shape='box', style='filled', fillcolor='lightblue')
+        if parent[node_id] >= 0:
+            dot.edge(str(parent[node_id]), str(node_id))
 
-    add_nodes_edges(trie_root)
+    for node_id, (hidden_nodes, hidden_freq) in collapsed.items():
+        dot.node(f"more{node_id}", label=f"+{hidden_nodes} more\n({int(hidden_freq)})",
+                 shape='box', style='dashed', color='gray', fontcolor='gray40')
+        dot.edge(str(node_id), f"more{node_id}", style='dashed', color='gray')
 
+    if render_queue is not None:
+        return render_queue.submit_dot(dot.source, f"{save_path}.png", engine=dot.engine)
     dot.render(filename=save_path, cleanup=True)
     print(f"✅ Trie-based process variant tree saved to {save_path}.png")
 
-def build_and_visualize_trie(variants_subset, top_n=None, save_path="variant_trie_tree"):
+def build_and_visualize_trie(variants_subset, top_n=None, save_path="variant_trie_tree", compact=False,
+                             render_queue=None, max_nodes=None, min_share=0.0, engine="dot"):
     """
     Main entry: builds and visualizes the Trie from the filtered variants.
 
     Parameters:
-        variants_subset: List of (variant_tuple, frequency)
+        variants_subset: List of (variant_tuple, frequency), or EncodedVariants
         top_n: Optional integer – only use top N variants
         save_path: Output path prefix (without extension)
+        compact: Build the array-backed ArrayTrie
+        render_queue: Optional RenderQueue; the render then runs in the background
+        max_nodes / min_share / engine: Level-of-detail options of visualize_trie
     """
     if top_n is not None:
-        variants_subset = variants_subset[:top_n]
+        if isinstance(variants_subset, EncodedVariants):
+            variants_subset = variants_subset.subset(top_n)
+        else:
+            variants_subset = variants_subset[:top_n]
         print(f"📦 Building Trie from top {top_n} variants.")
     else:
         print(f"📦 Building Trie from full variant set ({len(variants_subset)} variants).")
 
-    trie_root = build_trie_from_variants(variants_subset)
-    visualize_trie(trie_root, save_path=save_path)
+    trie_root = build_trie_from_variants(variants_subset, compact=compact)
+    return visualize_trie(trie_root, save_path=save_path, render_queue=render_queue,
+                          max_nodes=max_nodes, min_share=min_share, engine=engine)
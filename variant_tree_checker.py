@@ -1,32 +1,134 @@
 import os
+import numpy as np
 import pandas as pd
-from collections import defaultdict
 
+from tree_lod import node_depths, subtree_totals
+from variant_export import load_variants
 
-def analyze_variant_tree(csv_path):
-    df = pd.read_csv(csv_path)
+# Only these columns are read from the hierarchy CSV (the long Event Path is skipped)
+CSV_COLUMNS = ["Variant ID", "Level", "Frequency", "Parent ID"]
 
-    # Total number of variants
-    total_variants = len(df)
 
-    # Handle level analysis directly using the 'Level' column
-    level_counts = df['Level'].value_counts().to_dict()
-    max_level = df['Level'].max()
+def read_hierarchy_columns(source):
+    """
+    Loads the hierarchy as arrays (ids, levels, freqs, parents; parent -1 = root).
 
-    # Build parent-child map
-    tree = defaultdict(list)
-    for _, row in df.iterrows():
-        parent = None if row['Parent ID'] == "ROOT" else int(row['Parent ID'])
-        tree[parent].append(int(row['Variant ID']))
+    Parameters:
+        source: Hierarchy CSV path, its columnar export directory (x.variants), the
+            `nodes` list of build_data_driven_tree, or its (nodes, tree) result
+    """
+    if isinstance(source, tuple):
+        source = source[0]
+    if isinstance(source, list):
+        ids = np.fromiter((node["id"] for node in source), dtype=np.int64, count=len(source))
+        levels = np.fromiter((node.get("level", 0) for node in source), dtype=np.int32, count=len(source))
+        freqs = np.fromiter((node["freq"] for node in source), dtype=np.int64, count=len(source))
+        parents = np.fromiter((-1 if node["parent"] is None else node["parent"] for node in source),
+                              dtype=np.int64, count=len(source))
+        return ids, levels, freqs, parents
+    if os.path.isdir(source):
+        encoded, columns = load_variants(source, with_columns=True)
+        return (np.asarray(columns["id"]), np.asarray(columns["level"]), np.asarray(encoded.counts),
+                np.asarray(columns["parent"]))
 
-    # Number of clusters = number of children under root
-    num_clusters = len(tree[None])
+    df = pd.read_csv(source, usecols=CSV_COLUMNS,
+                     dtype={"Variant ID": np.int64, "Level": np.int32, "Frequency": np.int64, "Parent ID": str})
+    parents = pd.to_numeric(df["Parent ID"].where(df["Parent ID"] != "ROOT"), errors="raise")
+    return (df["Variant ID"].to_numpy(), df["Level"].to_numpy(), df["Frequency"].to_numpy(),
+            parents.fillna(-1).to_numpy(dtype=np.int64))
+
+
+def parent_positions(ids, parents):
+    """
+    Row position of every node's parent (-1 for roots), resolved with one binary search.
+    """
+    n = len(ids)
+    order = np.argsort(ids, kind="stable")
+    sorted_ids = ids[order]
+    has_parent = parents >= 0
+    parent_pos = np.full(n, -1, dtype=np.int64)
+    if has_parent.any():
+        found = np.searchsorted(sorted_ids, parents[has_parent])
+        found = np.minimum(found, max(n - 1, 0))
+        if not np.array_equal(sorted_ids[found], parents[has_parent]):
+            raise ValueError("Hierarchy references parent ids that are not in the tree")
+        parent_pos[has_parent] = order[found]
+    return parent_pos
+
+
+def tree_statistics(ids, levels, freqs, parents):
+    """
+    Structural statistics of a hierarchy given as parent arrays.
+
+    Children are grouped into a CSR adjacency (one stable argsort); subtree sizes and
+    frequency mass are accumulated bottom-up one vectorized step per level.
+
+    Returns:
+        dict with total_variants, max_level, level_counts, roots, num_clusters (children
+        of the roots), depth (per node), children_indptr / children (CSR), fan_out
+        ({number of children: number of nodes}), subtree_size and subtree_freq
+    """
+    n = len(ids)
+    parent_pos = parent_positions(ids, parents)
+    has_parent = parent_pos >= 0
+
+    child_counts = np.bincount(parent_pos[has_parent], minlength=n)
+    children_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(child_counts, out=children_indptr[1:])
+    children = np.flatnonzero(has_parent)[np.argsort(parent_pos[has_parent], kind="stable")]
+
+    subtree_size = subtree_totals(parent_pos, np.ones(n)).astype(np.int64)
+    subtree_freq = subtree_totals(parent_pos, freqs).astype(np.int64)
+    level_values, level_sizes = np.unique(levels, return_counts=True)
+    fan_values, fan_sizes = np.unique(child_counts[child_counts > 0], return_counts=True)
+    roots = np.flatnonzero(~has_parent)
+
+    return {
+        "total_variants": n,
+        "max_level": int(levels.max()) if n else 0,
+        "level_counts": dict(zip(level_values.tolist(), level_sizes.tolist())),
+        "roots": roots,
+        "num_clusters": int(child_counts[roots].sum()),
+        "depth": node_depths(parent_pos),
+        "children_indptr": children_indptr,
+        "children": children,
+        "fan_out": dict(zip(fan_values.tolist(), fan_sizes.tolist())),
+        "subtree_size": subtree_size,
+        "subtree_freq": subtree_freq,
+        "total_freq": int(freqs.sum()),
+        "ids": ids,
+    }
+
+
+def analyze_variant_tree(source):
+    """
+    Prints a summary of a variant hierarchy and returns its statistics.
+
+    Parameters:
+        source: Hierarchy CSV path, its columnar export directory, or the in-memory
+            result of build_data_driven_tree (nodes or (nodes, tree)) to skip the CSV
+    """
+    stats = tree_statistics(*read_hierarchy_columns(source))
 
     # Output summary
     print("\n📊 Variant Tree Analysis:")
-    print(f"🔢 Total variants: {total_variants}")
-    print(f"🌲 Tree depth (max level): {max_level}")
-    print(f"🌿 Number of clusters (children of most common variant): {num_clusters}")
+    print(f"🔢 Total variants: {stats['total_variants']}")
+    print(f"🌲 Tree depth (max level): {stats['max_level']}")
+    print(f"🌿 Number of clusters (children of most common variant): {stats['num_clusters']}")
     print(f"🧱 Nodes per level:")
-    for level in sorted(level_counts):
-        print(f"  - Level {level}: {level_counts[level]} nodes")
\ No newline at end of file
+    for level in sorted(stats["level_counts"]):
+        print(f"  - Level {level}: {stats['level_counts'][level]} nodes")
+    if stats["fan_out"]:
+        print("🔀 Fan-out (children → nodes): " + ", ".join(
+            f"{children}→{count}" for children, count in sorted(stats["fan_out"].items())))
+
+    indptr, children = stats["children_indptr"], stats["children"]
+    root_children = np.concatenate([children[indptr[r]:indptr[r + 1]] for r in stats["roots"].tolist()] or
+                                   [np.zeros(0, dtype=np.int64)])
+    if stats["total_freq"] and len(root_children):
+        top = root_children[np.argsort(-stats["subtree_freq"][root_children], kind="stable")[:5]]
+        print("🏋️ Largest clusters by case mass:")
+        for pos in top.tolist():
+            print(f"  - Variant {stats['ids'][pos]}: {stats['subtree_size'][pos]} variants, "
+                  f"{stats['subtree_freq'][pos] / stats['total_freq']:.1%} of cases")
+    return stats
@@ -1,8 +1,10 @@
-import matplotlib.pyplot as plt
 import os
-import csv
 
-def plot_variant_distribution(pareto_variants, save_path="output/variant_distribution.png", max_display=50):
+from variant_extractor import EncodedVariants
+from variant_export import columnar_path, export_variants, write_variant_csv
+
+def plot_variant_distribution(pareto_variants, save_path="output/variant_distribution.png", max_display=50,
+                              render_queue=None):
     """
     Plots a bar chart of the Pareto-filtered variants and saves the plot.
     Caps the height of the figure to avoid rendering issues with matplotlib.
@@ -11,7 +13,14 @@ def plot_variant_distribution(pareto_variants, save_path="output/variant_distrib
         pareto_variants (list): List of (variant_tuple, freq) tuples.
         save_path (str): File path to save the plot image.
         max_display (int): Max number of variants to show in the plot.
+        render_queue (RenderQueue or None): Plot in a background process and return its future.
     """
+    if render_queue is not None:
+        return render_queue.submit_plot(plot_variant_distribution, list(pareto_variants[:max_display]),
+                                        output_path=save_path, save_path=save_path, max_display=max_display)
+
+    import matplotlib.pyplot as plt
+
     total_variants = len(pareto_variants)
     if total_variants > max_display:
         print(f"⚠️ Too many variants to display ({total_variants}). Truncating to top {max_display} for visualization.")
@@ -46,22 +55,25 @@ def plot_variant_distribution(pareto_variants, save_path="output/variant_distrib
     print(f"📈 Variant distribution plot saved as: {save_path}")
 
 
-def save_variants_to_csv(pareto_variants, csv_path="output/pareto_variants.csv"):
+def save_variants_to_csv(pareto_variants, csv_path="output/pareto_variants.csv", columnar=True):
     """
     Saves the full list of Pareto-filtered variants and their frequencies to a CSV file.
 
     Parameters:
-        pareto_variants (list): List of (variant_tuple, freq) tuples.
+        pareto_variants (list): List of (variant_tuple, freq) tuples, or EncodedVariants.
         csv_path (str): File path to save the CSV.
+        columnar (bool): Also write the int-encoded columnar export next to the CSV
+            (x.variants, reload with variant_export.load_variants).
     """
-    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-
-    with open(csv_path, mode='w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["Variant", "Frequency"])
+    if columnar:
+        encoded = export_variants(pareto_variants, columnar_path(csv_path))
+    elif isinstance(pareto_variants, EncodedVariants):
+        encoded = pareto_variants
+    else:
+        encoded = EncodedVariants.from_sorted_variants(pareto_variants)
 
-        for variant_tuple, freq in pareto_variants:
-            variant_str = " → ".join(variant_tuple)
-            writer.writerow([variant_str, freq])
+    counts = encoded.counts.tolist()
+    write_variant_csv(csv_path, ["Variant", "Frequency"], encoded,
+                      lambda start, stop, paths: zip(paths, counts[start:stop]))
 
     print(f"📄 Full Pareto variant list saved to: {csv_path}")